@@ -1,6 +1,8 @@
 import argparse
 import multiprocessing
 import os
+import re
+import sys
 import time
 import calendar
 from pathlib import Path
@@ -9,11 +11,21 @@ from typing import List
 from . import __version__
 from . import sw_logger
 from . import slack_wrapper
+from . import async_slack_wrapper
 from . import signature_updater
+from . import rate_limiter
+from . import cassette
+from . import metadata_cache
+from . import adaptive_concurrency
+from . import api_metrics
+from . import checkpoint
+from . import scan_journal
+from . import phases
+from . import pipeline
+from . import directory
+from . import coordinator
 from .models import (
     signature,
-    user,
-    workspace,
     post,
     conversation
 )
@@ -22,10 +34,10 @@ SIGNATURES_PATH = (Path(__file__).parents[2] / 'watchman-signatures').resolve()
 OUTPUT_LOGGER: sw_logger.JSONLogger
 
 
-def load_signatures() -> List[signature.Signature]:
-    """ Load signatures from YAML files
+def load_signatures() -> List[signature.CompiledSignature]:
+    """ Load signatures from YAML files, and compile them for matching
     Returns:
-        List containing loaded definitions as Signatures objects
+        List containing loaded definitions as CompiledSignature objects
     """
 
     loaded_signatures = []
@@ -37,77 +49,97 @@ def load_signatures() -> List[signature.Signature]:
                     loaded_def = signature.load_from_yaml(sig_path)
                     for sig in loaded_def:
                         if sig.status == 'enabled' and 'slack_eg' in sig.watchman_apps:
-                            loaded_signatures.append(sig)
+                            try:
+                                loaded_signatures.append(signature.compile_signature(sig))
+                            except re.error as e:
+                                OUTPUT_LOGGER.log('WARNING', f'Skipping signature {sig.name}, a pattern is not '
+                                                             f'a valid regular expression: {e}')
         return loaded_signatures
     except Exception as e:
         raise e
 
 
-def search(loaded_signature: signature,
+def search(signature_list: List[signature.CompiledSignature],
            slack_connection: slack_wrapper.SlackAPI,
-           user_list: List[user.User],
+           enterprise_directory: directory.EnterpriseDirectory,
            message_list: List[post.Message],
-           workspace_list: List[workspace.Workspace],
            files_list: List[post.File],
            scope: str,
            cores: int,
-           verbose: bool) -> None:
-    """ Uses the signature to call the relevant search functions to find data in messages
-    files and drafts. Results are output to stdout logging.
+           verbose: bool,
+           journal: scan_journal.ScanJournal = None,
+           pool: slack_wrapper.SearchPool = None) -> None:
+    """ Search messages or files with every signature in the same pass, and output the
+    results to stdout logging.
     Args:
+        signature_list: Signature objects. Only signatures with the scope are used
         slack_connection: Slack API object
-        loaded_signature: Signature object
-        user_list: List of User objects from the Enterprise
+        enterprise_directory: Users and workspaces in the Enterprise
         message_list: List of Message objects to search through
-        workspace_list: List of Workspace objects from the Enterprise
         files_list: List of File objects to search through
-        scope: Scope of any results found for logging: e.g. Draft
+        scope: Scope to search: messages or files
         cores: Number of CPU cores to use
         verbose: Whether to use verbose logging or not
+        journal: Journal of findings already output by the scan
+        pool: Search pool holding the messages and files to search, created with the same signatures
     """
 
+    count = sum(1 for sig in signature_list if scope in sig.scope)
     if scope == 'messages':
-        OUTPUT_LOGGER.log('INFO', f'Searching for posts containing {loaded_signature.name}')
-        messages = slack_wrapper.search_message_matches(
-            loaded_signature,
+        OUTPUT_LOGGER.log('INFO', f'Searching for posts matching {count} signatures')
+        matches = slack_wrapper.search_message_matches(
+            signature_list,
             slack_connection,
-            user_list,
+            enterprise_directory,
             message_list,
-            workspace_list,
             cores,
             OUTPUT_LOGGER,
-            verbose
+            verbose,
+            pool
         )
-        if messages:
-            for message in messages:
-                OUTPUT_LOGGER.log(
-                    'NOTIFY',
-                    message,
-                    scope=scope,
-                    severity=loaded_signature.severity,
-                    detect_type=loaded_signature.name,
-                    notify_type='result'
-                )
-
-    if scope == 'files':
-        OUTPUT_LOGGER.log('INFO', f'Searching for {loaded_signature.name}')
-        files = slack_wrapper.search_file_matches(
-            loaded_signature,
-            user_list,
+    elif scope == 'files':
+        OUTPUT_LOGGER.log('INFO', f'Searching for files matching {count} signatures')
+        matches = slack_wrapper.search_file_matches(
+            signature_list,
+            enterprise_directory,
             files_list,
             cores,
-            OUTPUT_LOGGER
+            OUTPUT_LOGGER,
+            pool
         )
-        if files:
-            for file in files:
-                OUTPUT_LOGGER.log(
-                    'NOTIFY',
-                    file,
-                    scope=scope,
-                    severity=loaded_signature.severity,
-                    detect_type=loaded_signature.name,
-                    notify_type='result'
-                )
+    else:
+        return
+
+    for loaded_signature, results in zip(signature_list, matches):
+        for result in results:
+            output_result(result, scope, loaded_signature, journal)
+
+
+def output_result(result: dict,
+                  scope: str,
+                  loaded_signature: signature.CompiledSignature,
+                  journal: scan_journal.ScanJournal = None) -> None:
+    """ Output a finding. Findings already output earlier in a resumed scan are skipped
+
+    Args:
+        result: The finding
+        scope: Scope of the finding for logging: e.g. Draft
+        loaded_signature: Signature that matched
+        journal: Journal of findings already output by the scan
+    """
+
+    if journal and journal.has_finding(scope, loaded_signature.name, result):
+        return
+    OUTPUT_LOGGER.log(
+        'NOTIFY',
+        result,
+        scope=scope,
+        severity=loaded_signature.severity,
+        detect_type=loaded_signature.name,
+        notify_type='result'
+    )
+    if journal:
+        journal.record_finding(scope, loaded_signature.name, result)
 
 
 def core_validation(cores: int) -> int:
@@ -139,6 +171,28 @@ def init_logger(logging_type: str, debug: bool) -> sw_logger.JSONLogger or sw_lo
         return sw_logger.JSONLogger(debug=debug)
 
 
+def write_metrics(metrics: api_metrics.ApiMetrics, metrics_dir: str) -> None:
+    """ Collect the API metrics from every process and write them to the metrics directory
+
+    Args:
+        metrics: Metrics collector used by the Slack API objects
+        metrics_dir: Directory to write the metrics files to
+    """
+
+    stats = metrics.collect()
+    metrics.remove_spool()
+    os.makedirs(metrics_dir, exist_ok=True)
+    api_metrics.write_json(stats, Path(metrics_dir) / 'api_metrics.json')
+    api_metrics.write_prometheus(stats, Path(metrics_dir) / 'api_metrics.prom')
+
+    request_count = sum(s.get('requests') for s in stats.values())
+    rate_limited = sum(s.get('rate_limited') for s in stats.values())
+    waited = sum(s.get('rate_limit_wait_seconds') for s in stats.values())
+    OUTPUT_LOGGER.log('INFO', f'{request_count} API requests made, {rate_limited} rate limited, '
+                              f'{waited:.1f} seconds spent waiting on rate limits')
+    OUTPUT_LOGGER.log('INFO', f'API metrics written to {metrics_dir}')
+
+
 def main():
     global OUTPUT_LOGGER
     try:
@@ -155,6 +209,54 @@ def main():
                                  'for reading via terminal. Default is terminal')
         parser.add_argument('--cores', '-c', dest='cores', type=int,
                             help='Number of cores to use between 1-12', required=False)
+        parser.add_argument('--concurrency', '-C', dest='concurrency', type=int,
+                            help='Number of concurrent API requests to use when enumerating messages and files. '
+                                 'If set, enumeration runs from a pool of threads in a single process instead of '
+                                 'multiprocessing', required=False)
+        parser.add_argument('--adaptive-concurrency', dest='adaptive_concurrency', action='store_true',
+                            help='Enumerate messages and files using a pool of threads, automatically raising the '
+                                 'number of concurrent API requests while the API is healthy, and backing off when '
+                                 'rate limited. --concurrency sets the maximum')
+        parser.add_argument('--metadata-cache', dest='metadata_cache', type=str,
+                            help='Path of a file to cache workspace, conversation and Enterprise information in. '
+                                 'The cache is reused by later runs', required=False)
+        parser.add_argument('--metadata-cache-ttl', dest='metadata_cache_ttl', type=int,
+                            default=metadata_cache.DEFAULT_TTL,
+                            help='Number of seconds cached information is kept for. Default is 6 hours',
+                            required=False)
+        parser.add_argument('--stream', dest='stream', action='store_true',
+                            help='Search messages as they are fetched instead of fetching every message first. '
+                                 'Keeps memory use flat, and outputs matches sooner on large timeframes. Messages '
+                                 'are fetched using multiprocessing')
+        parser.add_argument('--edits', dest='edits', action='store_true',
+                            help='Also search messages posted before the timeframe that were edited during it')
+        parser.add_argument('--checkpoint', dest='checkpoint', type=str,
+                            help='Path of a file to store the newest message, file and draft scanned in. Later '
+                                 'runs only fetch messages, files and drafts newer than these', required=False)
+        parser.add_argument('--journal', dest='journal', type=str,
+                            help='Path of a file to record the progress of the scan in, so a scan that fails '
+                                 'can be resumed with --resume', required=False)
+        parser.add_argument('--resume', dest='resume', action='store_true',
+                            help='Resume the unfinished scan recorded in the --journal file, skipping work '
+                                 'already completed and findings already output')
+        parser.add_argument('--coordinator', dest='coordinator', type=str,
+                            help='Path of a queue file shared with workers on this host. The scan is split into '
+                                 'shards for workers started with --worker to scan, and their findings are output',
+                            required=False)
+        parser.add_argument('--shards', dest='shards', type=int, default=coordinator.DEFAULT_SHARDS,
+                            help=f'Number of shards to split the scan into with --coordinator. Default is '
+                                 f'{coordinator.DEFAULT_SHARDS}', required=False)
+        parser.add_argument('--worker', dest='worker', type=str,
+                            help='Path of the queue file of a coordinator. Scans shards from the queue until none '
+                                 'are left', required=False)
+        parser.add_argument('--enforce-rate-limits', dest='enforce_rate_limits', action='store_true',
+                            help='Hold every API method to its documented rate limit tier from the start. By '
+                                 'default a method is only held to its tier once the API has rate limited it')
+        parser.add_argument('--metrics-dir', dest='metrics_dir', type=str,
+                            help='Directory to write per API method request counts, latencies and rate limiting '
+                                 'figures to, in JSON and Prometheus text formats', required=False)
+        parser.add_argument('--no-update', dest='no_update', action='store_true',
+                            help='Don\'t download signature updates, use the signatures already stored locally')
         parser.add_argument('--version', '-v', action='version',
                             version=f'Slack Watchman for Enterprise Grid: {__version__.__version__}')
         parser.add_argument('--users', '-u', dest='users', action='store_true', help='Return all users')
@@ -165,9 +267,32 @@ def main():
                                  'This includes more fields, but is larger')
 
         args = parser.parse_args()
+        if args.resume and not args.journal:
+            parser.error('--resume requires --journal')
+        if args.coordinator and args.worker:
+            parser.error('--coordinator and --worker can\'t be used together')
+        if (args.coordinator or args.worker) and (args.stream or args.checkpoint or args.journal):
+            parser.error('--stream, --checkpoint and --journal can\'t be used with --coordinator or --worker')
+        if args.shards < 1:
+            parser.error('--shards must be at least 1')
         hours = args.hours
         minutes = args.minutes
         cores = args.cores
+        concurrency = args.concurrency
+        no_update = args.no_update
+        adaptive = args.adaptive_concurrency
+        metadata_cache_path = args.metadata_cache
+        metadata_cache_ttl = args.metadata_cache_ttl
+        metrics_dir = args.metrics_dir
+        enforce_rate_limits = args.enforce_rate_limits
+        checkpoint_path = args.checkpoint
+        stream = args.stream
+        edits = args.edits
+        journal_path = args.journal
+        coordinator_path = args.coordinator
+        shards = args.shards
+        worker_path = args.worker
+        resume = args.resume
         users = args.users
         workspaces = args.workspaces
         logging_type = args.logging_type
@@ -202,93 +327,267 @@ def main():
 
         cores = core_validation(cores)
 
-        slack_con = slack_wrapper.initiate_slack_connection(os.environ.get('SLACK_WATCHMAN_EG_TOKEN'))
+        base_url = os.environ.get('SLACK_WATCHMAN_EG_API_URL', slack_wrapper.DEFAULT_BASE_URL)
+        limiter = rate_limiter.RateLimiter(
+            multiplier=float(os.environ.get('SLACK_WATCHMAN_EG_RATE_MULTIPLIER', 1)),
+            enforce=enforce_rate_limits)
+        cache = None
+        if metadata_cache_path:
+            cache = metadata_cache.MetadataCache(metadata_cache_path, metadata_cache_ttl)
+            cache.purge_expired()
+        journal = None
+        if journal_path:
+            journal = scan_journal.ScanJournal(journal_path)
+            if resume:
+                journal.resume()
+                tf = journal.timeframe
+            else:
+                journal.start(tf)
+        checkpoints = None
+        if checkpoint_path:
+            checkpoints = checkpoint.CheckpointStore(checkpoint_path, run_id=journal.scan_id if journal else None)
+        metrics = None
+        if metrics_dir:
+            metrics = api_metrics.ApiMetrics()
+        slack_con = slack_wrapper.initiate_slack_connection(
+            os.environ.get('SLACK_WATCHMAN_EG_TOKEN'), limiter, base_url, cache, metrics)
+        async_slack_con = None
+        controller = None
+        if adaptive:
+            if not concurrency or concurrency < 1:
+                concurrency = adaptive_concurrency.DEFAULT_MAXIMUM
+            controller = adaptive_concurrency.AdaptiveConcurrency(maximum=concurrency, logger=OUTPUT_LOGGER)
+        if concurrency and concurrency > 0:
+            async_slack_con = async_slack_wrapper.initiate_async_slack_connection(
+                os.environ.get('SLACK_WATCHMAN_EG_TOKEN'), concurrency, limiter, base_url, cache, controller, metrics)
+        if os.environ.get('SLACK_WATCHMAN_EG_CASSETTE'):
+            cassette_mode = os.environ.get('SLACK_WATCHMAN_EG_CASSETTE_MODE', cassette.REPLAY)
+            cassette.use_cassette(slack_con, os.environ.get('SLACK_WATCHMAN_EG_CASSETTE'), cassette_mode)
+            if async_slack_con:
+                cassette.use_cassette(async_slack_con.slack_api, os.environ.get('SLACK_WATCHMAN_EG_CASSETTE'),
+                                      cassette_mode)
         OUTPUT_LOGGER.log('SUCCESS', 'Slack Watchman Enterprise Grid started execution')
         OUTPUT_LOGGER.log('INFO', f'Version: {__version__.__version__}')
         OUTPUT_LOGGER.log('INFO', f'Created by: {__version__.__author__} - {__version__.__email__}')
         OUTPUT_LOGGER.log('INFO', f'{cores} cores in use')
-        OUTPUT_LOGGER.log('INFO', 'Downloading signature file updates')
-        signature_updater.SignatureUpdater(OUTPUT_LOGGER).update_signatures()
-        OUTPUT_LOGGER.log('INFO', 'Importing signatures...')
-        signature_list = load_signatures()
-        OUTPUT_LOGGER.log('SUCCESS', f'{len(signature_list)} signatures loaded')
-        OUTPUT_LOGGER.log('INFO', f'Searching previous {hours} hour(s), {minutes} minutes')
-        OUTPUT_LOGGER.log('INFO', 'Enumerating Enterprise information')
-        OUTPUT_LOGGER.log('NOTIFY', slack_wrapper.get_enterprise(slack_con), scope='Enterprise',
-                          notify_type='enterprise')
-        OUTPUT_LOGGER.log('INFO', 'Enumerating Enterprise workspaces')
-        workspace_list = slack_wrapper.get_workspaces(slack_con, verbose)
-        OUTPUT_LOGGER.log('INFO', f'{len(workspace_list)} workspaces discovered')
-        OUTPUT_LOGGER.log('INFO', 'Enumerating Enterprise users')
-        user_list = slack_wrapper.get_users(slack_con, workspace_list, verbose)
-        OUTPUT_LOGGER.log('INFO', f'{len(user_list)} users discovered')
-
-        if users:
-            OUTPUT_LOGGER.log('INFO', 'Outputting Enterprise users')
-            for user in user_list:
-                OUTPUT_LOGGER.log('NOTIFY', user, detect_type='User', notify_type='user')
-
-        if workspaces:
-            OUTPUT_LOGGER.log('INFO', 'Outputting Enterprise workspaces')
-            for workspace in workspace_list:
-                OUTPUT_LOGGER.log('NOTIFY', workspace, detect_type='Workspace', notify_type='workspace')
-
-        OUTPUT_LOGGER.log('INFO', 'Enumerating files')
-        file_list = slack_wrapper.get_all_files(slack_con, cores=cores, verbose=verbose, timeframe=tf)
-        OUTPUT_LOGGER.log('INFO', f'{len(file_list)} files discovered')
-
-        OUTPUT_LOGGER.log('INFO', 'Enumerating messages')
-        message_list = slack_wrapper.get_all_messages(slack_con, cores=cores, timeframe=tf)
-        OUTPUT_LOGGER.log('INFO', f'{len(message_list)} messages discovered')
-
-        for sig in signature_list:
-            for scope in sig.scope:
-                search(
-                    sig,
-                    slack_con,
-                    user_list,
-                    message_list,
-                    workspace_list,
-                    file_list,
-                    scope,
-                    cores,
-                    verbose
-                )
+        if controller:
+            OUTPUT_LOGGER.log('INFO', f'Adaptive API concurrency in use for enumeration, starting at '
+                                      f'{controller.limit} concurrent requests, up to {concurrency}')
+        elif async_slack_con:
+            OUTPUT_LOGGER.log('INFO', f'{concurrency} concurrent API requests in use for enumeration')
+        if resume:
+            OUTPUT_LOGGER.log('INFO', f'Resuming scan with {journal.count_completed()} conversations, files and '
+                                      f'workspaces already completed')
+        elif worker_path:
+            OUTPUT_LOGGER.log('INFO', f'Scanning shards from {worker_path}')
+        else:
+            OUTPUT_LOGGER.log('INFO', f'Searching previous {hours} hour(s), {minutes} minutes')
+
+        def load_signature_phase():
+            if not no_update:
+                OUTPUT_LOGGER.log('INFO', 'Downloading signature file updates')
+                signature_updater.SignatureUpdater(OUTPUT_LOGGER).update_signatures()
+            OUTPUT_LOGGER.log('INFO', 'Importing signatures...')
+            loaded_signatures = load_signatures()
+            OUTPUT_LOGGER.log('SUCCESS', f'{len(loaded_signatures)} signatures loaded')
+            return loaded_signatures
+
+        def enterprise_phase():
+            OUTPUT_LOGGER.log('INFO', 'Enumerating Enterprise information')
+            OUTPUT_LOGGER.log('NOTIFY', slack_wrapper.get_enterprise(slack_con), scope='Enterprise',
+                              notify_type='enterprise')
+
+        def workspace_phase():
+            OUTPUT_LOGGER.log('INFO', 'Enumerating Enterprise workspaces')
+            enterprise_workspaces = slack_wrapper.get_workspaces(slack_con, verbose)
+            OUTPUT_LOGGER.log('INFO', f'{len(enterprise_workspaces)} workspaces discovered')
+            if workspaces:
+                OUTPUT_LOGGER.log('INFO', 'Outputting Enterprise workspaces')
+                for workspace in enterprise_workspaces:
+                    OUTPUT_LOGGER.log('NOTIFY', workspace, detect_type='Workspace', notify_type='workspace')
+            return enterprise_workspaces
+
+        def user_phase(workspace_list):
+            OUTPUT_LOGGER.log('INFO', 'Enumerating Enterprise users')
+            enterprise_users = slack_wrapper.get_users(slack_con, workspace_list, verbose)
+            OUTPUT_LOGGER.log('INFO', f'{len(enterprise_users)} users discovered')
+            if users:
+                OUTPUT_LOGGER.log('INFO', 'Outputting Enterprise users')
+                for user in enterprise_users:
+                    OUTPUT_LOGGER.log('NOTIFY', user, detect_type='User', notify_type='user')
+            return enterprise_users
+
+        def directory_phase(user_list, workspace_list):
+            return directory.EnterpriseDirectory(user_list, workspace_list)
+
+        def file_phase():
+            OUTPUT_LOGGER.log('INFO', 'Enumerating files')
+            if async_slack_con:
+                files = async_slack_con.run(async_slack_wrapper.get_all_files(
+                    async_slack_con, verbose=verbose, timeframe=tf, checkpoints=checkpoints, journal=journal))
+            else:
+                files = slack_wrapper.get_all_files(slack_con, cores=cores, verbose=verbose, timeframe=tf,
+                                                    checkpoints=checkpoints, journal=journal)
+            OUTPUT_LOGGER.log('INFO', f'{len(files)} files discovered')
+            return files
+
+        def message_phase():
+            OUTPUT_LOGGER.log('INFO', 'Enumerating messages')
+            if async_slack_con:
+                messages = async_slack_con.run(async_slack_wrapper.get_all_messages(
+                    async_slack_con, timeframe=tf, checkpoints=checkpoints, journal=journal, edits=edits))
+            else:
+                messages = slack_wrapper.get_all_messages(slack_con, cores=cores, timeframe=tf,
+                                                          checkpoints=checkpoints, journal=journal, edits=edits)
+            OUTPUT_LOGGER.log('INFO', f'{len(messages)} messages discovered')
+            return messages
+
+        def draft_phase(workspace_list):
+            OUTPUT_LOGGER.log('INFO', 'Enumerating draft messages')
+            drafts = slack_wrapper.get_all_drafts(
+                slack_con,
+                workspace_list,
+                cores=cores,
+                verbose=verbose,
+                timeframe=tf,
+                checkpoints=checkpoints,
+                journal=journal
+            )
+            OUTPUT_LOGGER.log('INFO', f'{len(drafts)} drafts discovered')
+            return drafts
+
+        def message_stream_phase(signature_list, enterprise_directory):
+            OUTPUT_LOGGER.log('INFO', 'Enumerating and searching messages')
+            searched = pipeline.stream_message_matches(
+                slack_con,
+                signature_list,
+                enterprise_directory,
+                cores,
+                lambda sig, message: output_result(message, 'messages', sig, journal),
+                OUTPUT_LOGGER,
+                verbose,
+                timeframe=tf,
+                checkpoints=checkpoints,
+                journal=journal,
+                edits=edits
+            )
+            OUTPUT_LOGGER.log('INFO', f'{searched} messages searched')
+
+        def search_phase(signature_list, enterprise_directory, file_list, message_list=None):
+            # Each message and file is searched with every signature in a single pass, by one
+            # set of worker processes, so they are only sent to the worker processes once
+            with slack_wrapper.SearchPool(slack_con, signature_list, enterprise_directory, message_list, file_list,
+                                          cores, verbose) as pool:
+                for scope in ('messages', 'files'):
+                    if scope == 'messages' and stream:
+                        continue
+                    if any(scope in sig.scope for sig in signature_list):
+                        search(
+                            signature_list,
+                            slack_con,
+                            enterprise_directory,
+                            message_list,
+                            file_list,
+                            scope,
+                            cores,
+                            verbose,
+                            journal,
+                            pool
+                        )
 
-        OUTPUT_LOGGER.log('INFO', 'Enumerating draft messages')
-        draft_list = slack_wrapper.get_all_drafts(
-            slack_con,
-            workspace_list,
-            cores=cores,
-            verbose=verbose,
-            timeframe=tf
-        )
-        OUTPUT_LOGGER.log('INFO', f'{len(draft_list)} drafts discovered')
-        for sig in signature_list:
-            if 'drafts' in sig.scope:
-                OUTPUT_LOGGER.log('INFO', f'Searching for drafts containing {sig.name}')
-                drafts = slack_wrapper.search_draft_matches(
+        def draft_search_phase(signature_list, draft_list, enterprise_directory):
+            count = sum(1 for sig in signature_list if 'drafts' in sig.scope)
+            if count:
+                OUTPUT_LOGGER.log('INFO', f'Searching for drafts matching {count} signatures')
+                matches = slack_wrapper.search_draft_matches(
                     slack_con,
-                    sig,
+                    signature_list,
                     draft_list,
-                    user_list,
+                    enterprise_directory,
                     OUTPUT_LOGGER,
                     verbose,
                     tf
                 )
-                if drafts:
+                for sig, drafts in zip(signature_list, matches):
                     for draft in drafts:
-                        OUTPUT_LOGGER.log(
-                            'NOTIFY',
-                            draft,
-                            scope='Draft',
-                            severity=sig.severity,
-                            detect_type=sig.name,
-                            notify_type='result'
-                        )
+                        output_result(draft, 'Draft', sig, journal)
+
+        def coordinator_phase(enterprise_directory):
+            OUTPUT_LOGGER.log('INFO', f'Sharding scan across workers using {coordinator_path}')
+            for scope, detect_type, severity, finding in coordinator.coordinate(
+                    slack_con, coordinator.ShardQueue(coordinator_path), enterprise_directory, shards, tf, edits,
+                    OUTPUT_LOGGER):
+                OUTPUT_LOGGER.log(
+                    'NOTIFY',
+                    finding,
+                    scope=scope,
+                    severity=severity,
+                    detect_type=detect_type,
+                    notify_type='result'
+                )
+
+        def worker_phase(signature_list):
+            scanned = coordinator.run_worker(slack_con, coordinator.ShardQueue(worker_path), signature_list, cores,
+                                             verbose, OUTPUT_LOGGER)
+            OUTPUT_LOGGER.log('INFO', f'{scanned} shards scanned')
+
+        # Enumeration is network bound, so independent phases run at the same time. Searching
+        # is CPU bound, so drafts are only searched once the other searches have finished.
+        # Phases using worker processes run one at a time, see PhaseExecutor
+        executor = phases.PhaseExecutor(OUTPUT_LOGGER)
+        # Enumeration with concurrent API requests runs in threads, not worker processes
+        enumeration_forks = not async_slack_con
+        if worker_path:
+            executor.add('signature_list', load_signature_phase)
+            executor.add('worker', worker_phase, requires=['signature_list'], forks=True)
+        elif coordinator_path:
+            executor.add('enterprise', enterprise_phase)
+            executor.add('workspace_list', workspace_phase)
+            executor.add('user_list', user_phase, requires=['workspace_list'])
+            executor.add('enterprise_directory', directory_phase, requires=['user_list', 'workspace_list'])
+            executor.add('coordinator', coordinator_phase, requires=['enterprise_directory'])
+        else:
+            executor.add('signature_list', load_signature_phase)
+            executor.add('enterprise', enterprise_phase)
+            executor.add('workspace_list', workspace_phase)
+            executor.add('user_list', user_phase, requires=['workspace_list'])
+            executor.add('enterprise_directory', directory_phase, requires=['user_list', 'workspace_list'])
+            executor.add('file_list', file_phase, forks=enumeration_forks)
+            executor.add('draft_list', draft_phase, requires=['workspace_list'], forks=True)
+            if stream:
+                executor.add('message_stream', message_stream_phase,
+                             requires=['signature_list', 'enterprise_directory'], forks=True)
+                executor.add('search', search_phase,
+                             requires=['signature_list', 'enterprise_directory', 'file_list'],
+                             after=['message_stream'], forks=True)
+            else:
+                executor.add('message_list', message_phase, forks=enumeration_forks)
+                executor.add('search', search_phase,
+                             requires=['signature_list', 'enterprise_directory', 'file_list', 'message_list'],
+                             forks=True)
+            executor.add('draft_search', draft_search_phase,
+                         requires=['signature_list', 'draft_list', 'enterprise_directory'], after=['search'])
+        try:
+            executor.run()
+        finally:
+            if async_slack_con:
+                async_slack_con.close()
+        if controller:
+            OUTPUT_LOGGER.log('INFO', f'API concurrency at {controller.limit} concurrent requests, '
+                                      f'peak of {int(controller.peak)}')
+
+        if checkpoints:
+            OUTPUT_LOGGER.log('INFO', f'{checkpoints.commit()} checkpoints updated')
+        if journal:
+            journal.finish()
+        if metrics:
+            write_metrics(metrics, metrics_dir)
 
         OUTPUT_LOGGER.log('SUCCESS', 'Slack Watchman Enterprise Grid finished execution')
 
+    except coordinator.QueueError as e:
+        OUTPUT_LOGGER.log('CRITICAL', e)
+        sys.exit(1)
     except Exception as e:
         OUTPUT_LOGGER.log('CRITICAL', e)
 
@@ -0,0 +1,95 @@
+import threading
+import time
+
+DEFAULT_INITIAL = 8
+DEFAULT_MINIMUM = 1
+DEFAULT_MAXIMUM = 500
+# Multiplier applied to the limit when a request is rate limited
+RATE_LIMIT_BACKOFF = 0.5
+# Multiplier applied to the limit when latency rises above the baseline
+LATENCY_BACKOFF = 0.9
+# Latency is considered to be rising when the recent average is this many times the baseline
+LATENCY_THRESHOLD = 2.0
+# Number of responses needed to establish a latency baseline before latency can reduce the limit
+WARM_UP_SAMPLES = 50
+# Weights of new samples in the recent and baseline latency averages
+RECENT_WEIGHT = 0.2
+BASELINE_WEIGHT = 0.01
+
+
+class AdaptiveConcurrency(object):
+    """ AIMD controller for the number of requests to have in flight at once.
+
+    While responses are healthy the limit grows additively, by roughly one for every
+    limit's worth of successful responses. When a request is rate limited the limit is
+    halved, and when latency rises well above its baseline the limit is reduced slightly.
+    Decreases are applied at most once per round trip, so a burst of rate limited
+    responses from requests sent together only backs off once.
+
+    The controller is fed from every thread making requests, and read by the client
+    deciding how many requests to start."""
+
+    def __init__(self,
+                 initial: int = DEFAULT_INITIAL,
+                 minimum: int = DEFAULT_MINIMUM,
+                 maximum: int = DEFAULT_MAXIMUM,
+                 logger=None):
+        self.minimum = minimum
+        self.maximum = max(minimum, maximum)
+        self.logger = logger
+        self.peak = self._limit = float(min(max(initial, minimum), self.maximum))
+        self._recent_latency = None
+        self._baseline_latency = None
+        self._samples = 0
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    def _log(self, mes_type: str, message: str):
+        if self.logger:
+            self.logger.log(mes_type, message)
+
+    def _decrease(self, factor: float, reason: str):
+        now = time.monotonic()
+        if now - self._last_decrease < (self._recent_latency or 0):
+            return
+        self._last_decrease = now
+        previous = self.limit
+        self._limit = max(float(self.minimum), self._limit * factor)
+        if self.limit != previous:
+            self._log('INFO', f'{reason}, reducing API concurrency from {previous} to {self.limit}')
+
+    def record(self, latency: float, rate_limited: bool = False):
+        """ Feed back the outcome of a request
+
+        Args:
+            latency: Seconds the request took
+            rate_limited: Whether the API responded that the request was rate limited
+        """
+
+        with self._lock:
+            if rate_limited:
+                self._decrease(RATE_LIMIT_BACKOFF, 'Slack API rate limit reached')
+                return
+
+            self._samples += 1
+            if self._recent_latency is None:
+                self._recent_latency = self._baseline_latency = latency
+            elif self._samples <= WARM_UP_SAMPLES:
+                self._recent_latency += RECENT_WEIGHT * (latency - self._recent_latency)
+                self._baseline_latency += (latency - self._baseline_latency) / self._samples
+            else:
+                self._recent_latency += RECENT_WEIGHT * (latency - self._recent_latency)
+                self._baseline_latency += BASELINE_WEIGHT * (latency - self._baseline_latency)
+
+            if self._samples > WARM_UP_SAMPLES and self._recent_latency > LATENCY_THRESHOLD * self._baseline_latency:
+                self._decrease(LATENCY_BACKOFF, 'Slack API latency rising')
+            else:
+                previous = self.limit
+                self._limit = min(float(self.maximum), self._limit + 1 / self._limit)
+                self.peak = max(self.peak, self._limit)
+                if self.limit != previous:
+                    self._log('DEBUG', f'Increasing API concurrency to {self.limit}')
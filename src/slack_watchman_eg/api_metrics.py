@@ -0,0 +1,213 @@
+import bisect
+import os
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+from typing import Dict, List
+
+from . import json_codec
+
+# Upper bounds, in seconds, of the request latency histogram buckets
+LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0]
+COUNTERS = ['calls', 'requests', 'pages', 'bytes_received', 'retries', 'rate_limited', 'rate_limit_waits',
+            'rate_limit_wait_seconds', 'cache_hits', 'latency_seconds']
+PROMETHEUS_PREFIX = 'slack_watchman_api'
+PROMETHEUS_COUNTERS = {
+    'calls': 'API method calls made. A paginated call counts once, however many pages it takes',
+    'requests': 'HTTP requests made to the Slack API',
+    'pages': 'Pages of results received',
+    'bytes_received': 'Bytes of response bodies received',
+    'retries': 'Requests retried after being rate limited',
+    'rate_limited': 'Responses telling the client it was rate limited',
+    'rate_limit_waits': 'Requests that waited for the client side rate limiter',
+    'rate_limit_wait_seconds': 'Seconds spent waiting for the client side rate limiter',
+    'cache_hits': 'Lookups served from the metadata cache'
+}
+
+
+def _empty_stats() -> Dict:
+    stats = {counter: 0 for counter in COUNTERS}
+    stats['latency_buckets'] = [0] * (len(LATENCY_BUCKETS) + 1)
+    return stats
+
+
+class ApiMetrics(object):
+    """ Per-method instrumentation of Slack API usage: call, request and page counts,
+    bytes received, a latency histogram, retries and time spent waiting on rate limits.
+
+    Each process collects its own figures. Worker processes flush them to a shared spool
+    directory, and the parent merges every process' figures with collect()."""
+
+    def __init__(self, spool_dir: str or Path = None):
+        self.spool_dir = str(spool_dir or tempfile.mkdtemp(prefix='slack-watchman-eg-metrics-'))
+        os.makedirs(self.spool_dir, exist_ok=True)
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def __getstate__(self):
+        return {'spool_dir': self.spool_dir}
+
+    def __setstate__(self, state):
+        self.spool_dir = state.get('spool_dir')
+        self._reset()
+
+    def _method_stats(self, method: str) -> Dict:
+        """ Get the figures for a method. Figures inherited from a parent process are
+        discarded, as the parent reports them itself """
+
+        if self._pid != os.getpid():
+            self._reset()
+        if method not in self._stats:
+            self._stats[method] = _empty_stats()
+        return self._stats[method]
+
+    def record_call(self, method: str):
+        with self._lock:
+            self._method_stats(method)['calls'] += 1
+
+    def record_page(self, method: str):
+        with self._lock:
+            self._method_stats(method)['pages'] += 1
+
+    def record_cache_hit(self, method: str):
+        with self._lock:
+            self._method_stats(method)['cache_hits'] += 1
+
+    def record_wait(self, method: str, seconds: float):
+        with self._lock:
+            stats = self._method_stats(method)
+            stats['rate_limit_waits'] += 1
+            stats['rate_limit_wait_seconds'] += seconds
+
+    def record_request(self,
+                       method: str,
+                       latency: float,
+                       bytes_received: int,
+                       rate_limited: bool = False,
+                       retry: bool = False):
+        """ Record an HTTP request made to the Slack API
+
+        Args:
+            method: Slack API method called
+            latency: Seconds the request took
+            bytes_received: Size of the response body
+            rate_limited: Whether the response said the request was rate limited
+            retry: Whether the request was a retry of a rate limited request
+        """
+
+        with self._lock:
+            stats = self._method_stats(method)
+            stats['requests'] += 1
+            stats['bytes_received'] += bytes_received
+            stats['latency_seconds'] += latency
+            stats['latency_buckets'][bisect.bisect_left(LATENCY_BUCKETS, latency)] += 1
+            if rate_limited:
+                stats['rate_limited'] += 1
+            if retry:
+                stats['retries'] += 1
+
+    def snapshot(self) -> Dict[str, Dict]:
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+            return json_codec.loads(json_codec.dumps(self._stats))
+
+    def flush(self):
+        """ Write the figures for this process to the spool directory. Can be called
+        repeatedly, each call replaces the previous figures """
+
+        path = Path(self.spool_dir) / f'{os.getpid()}.json'
+        tmp_path = path.with_suffix('.tmp')
+        with open(tmp_path, 'w') as f:
+            f.write(json_codec.dumps(self.snapshot()))
+        os.replace(tmp_path, path)
+
+    def collect(self) -> Dict[str, Dict]:
+        """ Merge the figures from this process and every worker process that has flushed
+
+        Returns:
+            Figures for each Slack API method
+        """
+
+        snapshots = [self.snapshot()]
+        for path in Path(self.spool_dir).glob('*.json'):
+            if path.stem != str(os.getpid()):
+                with open(path) as f:
+                    snapshots.append(json_codec.loads(f.read()))
+
+        merged = {}
+        for snapshot in snapshots:
+            for method, stats in snapshot.items():
+                total = merged.setdefault(method, _empty_stats())
+                for counter in COUNTERS:
+                    total[counter] += stats.get(counter, 0)
+                total['latency_buckets'] = [a + b for a, b in zip(total['latency_buckets'],
+                                                                   stats.get('latency_buckets'))]
+
+        return dict(sorted(merged.items()))
+
+    def remove_spool(self):
+        """ Delete the spool directory and every figure flushed to it """
+
+        shutil.rmtree(self.spool_dir, ignore_errors=True)
+
+
+def write_json(stats: Dict[str, Dict], path: str or Path) -> None:
+    """ Write metrics as JSON
+
+    Args:
+        stats: Figures for each method, from ApiMetrics.collect()
+        path: Path of the file to write
+    """
+
+    output = {}
+    for method, method_stats in stats.items():
+        output[method] = {counter: method_stats.get(counter) for counter in COUNTERS}
+        output[method]['latency_histogram'] = {
+            str(bound): count for bound, count in zip(LATENCY_BUCKETS + ['+Inf'], method_stats.get('latency_buckets'))
+        }
+    with open(path, 'w') as f:
+        f.write(json_codec.dumps(output))
+
+
+def _prometheus_histogram(method: str, method_stats: Dict) -> List[str]:
+    name = f'{PROMETHEUS_PREFIX}_request_duration_seconds'
+    lines = []
+    cumulative = 0
+    for bound, count in zip(LATENCY_BUCKETS + ['+Inf'], method_stats.get('latency_buckets')):
+        cumulative += count
+        lines.append(f'{name}_bucket{{method="{method}",le="{bound}"}} {cumulative}')
+    lines.append(f'{name}_sum{{method="{method}"}} {method_stats.get("latency_seconds")}')
+    lines.append(f'{name}_count{{method="{method}"}} {method_stats.get("requests")}')
+    return lines
+
+
+def write_prometheus(stats: Dict[str, Dict], path: str or Path) -> None:
+    """ Write metrics in the Prometheus text exposition format
+
+    Args:
+        stats: Figures for each method, from ApiMetrics.collect()
+        path: Path of the file to write
+    """
+
+    lines = []
+    for counter, description in PROMETHEUS_COUNTERS.items():
+        name = f'{PROMETHEUS_PREFIX}_{counter}_total'
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} counter')
+        for method, method_stats in stats.items():
+            lines.append(f'{name}{{method="{method}"}} {method_stats.get(counter)}')
+
+    name = f'{PROMETHEUS_PREFIX}_request_duration_seconds'
+    lines.append(f'# HELP {name} Latency of HTTP requests made to the Slack API')
+    lines.append(f'# TYPE {name} histogram')
+    for method, method_stats in stats.items():
+        lines.extend(_prometheus_histogram(method, method_stats))
+
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
@@ -0,0 +1,500 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Callable, Any, Coroutine
+
+from . import slack_wrapper
+from . import rate_limiter
+from . import metadata_cache
+from . import adaptive_concurrency
+from . import api_metrics
+from . import checkpoint
+from . import scan_journal
+from .models import (
+    post,
+    conversation
+)
+
+DEFAULT_CONCURRENCY = 100
+
+
+class AsyncSlackAPI(object):
+    """ Thread pool fan-out over slack_wrapper.SlackAPI, driven from asyncio. It isn't an
+    asyncio HTTP client: each coroutine method runs the blocking SlackAPI method in a pool
+    of threads sharing one keep-alive connection pool, so many calls can be in flight from
+    a single process. The event loop only schedules the calls and gathers their results,
+    so the rate limiter, request sharing and cache of SlackAPI all still apply.
+
+    The number of in-flight requests is bounded by the concurrency limit, which is also
+    the number of threads. If an adaptive controller is given, the limit follows the
+    controller instead, up to the concurrency limit as a maximum.
+
+    Calls to the journal, checkpoint and cache stores are blocking too, so are run on a
+    thread of their own with offload(), keeping them off the event loop."""
+
+    def __init__(self,
+                 token: str,
+                 concurrency: int = DEFAULT_CONCURRENCY,
+                 limiter: rate_limiter.RateLimiter = None,
+                 base_url: str = slack_wrapper.DEFAULT_BASE_URL,
+                 cache: metadata_cache.MetadataCache = None,
+                 controller: adaptive_concurrency.AdaptiveConcurrency = None,
+                 metrics: api_metrics.ApiMetrics = None):
+        self.concurrency = concurrency
+        self.controller = controller
+        self.slack_api = slack_wrapper.SlackAPI(token, pool_size=concurrency, limiter=limiter, base_url=base_url,
+                                                cache=cache, controller=controller, metrics=metrics)
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='slack-api')
+        # One thread, so the SQLite stores use one connection and their writes don't contend
+        self._store_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='slack-api-store')
+        self._condition = None
+        self._loop = None
+        self._in_flight = 0
+        self._background_loop = None
+        self._background_thread = None
+        self._background_lock = threading.Lock()
+
+    @property
+    def limit(self) -> int:
+        """ Current number of requests allowed in flight """
+
+        if self.controller:
+            return min(self.controller.limit, self.concurrency)
+        return self.concurrency
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """ Stop the background event loop, shut down the thread pools and close the
+        HTTP session """
+
+        with self._background_lock:
+            if self._background_loop:
+                self._background_loop.call_soon_threadsafe(self._background_loop.stop)
+                self._background_thread.join()
+                self._background_loop.close()
+                self._background_loop = None
+                self._background_thread = None
+        self._executor.shutdown(wait=True)
+        self._store_executor.shutdown(wait=True)
+        self.slack_api.session.close()
+
+    def run(self, coroutine: Coroutine) -> Any:
+        """ Run a coroutine from synchronous code and wait for its result. Coroutines are
+        run on an event loop in a background thread, so calls made from several threads
+        at once share one event loop and concurrency limit
+
+        Args:
+            coroutine: Coroutine to run, e.g. get_all_messages(...)
+        Returns:
+            Result of the coroutine
+        """
+
+        with self._background_lock:
+            if not self._background_loop:
+                self._background_loop = asyncio.new_event_loop()
+                self._background_thread = threading.Thread(target=self._background_loop.run_forever,
+                                                           name='slack-api-loop', daemon=True)
+                self._background_thread.start()
+        return asyncio.run_coroutine_threadsafe(coroutine, self._background_loop).result()
+
+    async def _run(self, func: Callable, *args, **kwargs) -> Any:
+        """ Run a blocking SlackAPI method in the request thread pool, waiting
+        for a free concurrency slot first
+
+        Args:
+            func: Bound SlackAPI method to call
+        Returns:
+            Result of the SlackAPI method
+        """
+
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._condition = asyncio.Condition()
+            self._loop = loop
+            self._in_flight = 0
+
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._in_flight < self.limit)
+            self._in_flight += 1
+        try:
+            return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+        finally:
+            async with self._condition:
+                self._in_flight -= 1
+                self._condition.notify_all()
+
+    async def offload(self, func: Callable, *args, **kwargs) -> Any:
+        """ Run a blocking call that isn't an API request, e.g. to the journal or checkpoint
+        store, on the store thread so it doesn't block the event loop
+
+        Args:
+            func: Function to call
+        Returns:
+            Result of the function
+        """
+
+        return await asyncio.get_running_loop().run_in_executor(
+            self._store_executor, functools.partial(func, *args, **kwargs))
+
+    async def get_enterprise_info(self) -> Dict:
+        return await self._run(self.slack_api.get_enterprise_info)
+
+    async def get_all_users(self, offset: str = None) -> List[Dict]:
+        return await self._run(self.slack_api.get_all_users, offset=offset)
+
+    async def get_user_info(self, user_id: str) -> Dict:
+        return await self._run(self.slack_api.get_user_info, user_id)
+
+    async def get_user_conversations(self,
+                                     user_id: str,
+                                     public: bool = None,
+                                     private: bool = None,
+                                     im: bool = None,
+                                     mpim: bool = None,
+                                     historical: bool = None) -> List[Dict]:
+        return await self._run(self.slack_api.get_user_conversations, user_id, public=public, private=private,
+                               im=im, mpim=mpim, historical=historical)
+
+    async def get_all_conversations(self,
+                                    public: bool = None,
+                                    private: bool = None,
+                                    im: bool = None,
+                                    mpim: bool = None,
+                                    ext_shared: bool = None,
+                                    historical: bool = None) -> List[Dict]:
+        return await self._run(self.slack_api.get_all_conversations, public=public, private=private, im=im,
+                               mpim=mpim, ext_shared=ext_shared, historical=historical)
+
+    async def get_recent_conversations(self, latest: float = None) -> List[Dict]:
+        return await self._run(self.slack_api.get_recent_conversations, latest=latest)
+
+    async def get_conversation_history(self,
+                                       channel_id: str,
+                                       team_id: str = None,
+                                       latest: float = None,
+                                       oldest: float = None) -> List[Dict]:
+        return await self._run(self.slack_api.get_conversation_history, channel_id, team_id, latest=latest,
+                               oldest=oldest)
+
+    async def get_conversation_edits(self,
+                                     channel_id: str,
+                                     team_id: str,
+                                     latest: float = None,
+                                     oldest: float = None) -> List[Dict]:
+        return await self._run(self.slack_api.get_conversation_edits, channel_id, team_id, latest=latest,
+                               oldest=oldest)
+
+    async def get_conversation_info(self,
+                                    channel_id: str,
+                                    team_id: str = None) -> List[Dict]:
+        return await self._run(self.slack_api.get_conversation_info, channel_id, team_id)
+
+    async def get_conversation_members(self,
+                                       channel_id: str,
+                                       team_id: str = None,
+                                       include_member_left: bool = None) -> List[Dict]:
+        return await self._run(self.slack_api.get_conversation_members, channel_id, team_id,
+                               include_member_left=include_member_left)
+
+    async def get_conversation_renames(self,
+                                       latest: float = None,
+                                       oldest: float = None,
+                                       private: bool = None) -> List[Dict]:
+        return await self._run(self.slack_api.get_conversation_renames, latest=latest, oldest=oldest,
+                               private=private)
+
+    async def search_conversations(self,
+                                   query: str,
+                                   include_messages: bool = None,
+                                   latest: float = None,
+                                   oldest: float = None) -> List[Dict]:
+        return await self._run(self.slack_api.search_conversations, query, include_messages=include_messages,
+                               latest=latest, oldest=oldest)
+
+    async def get_message_info(self,
+                               timestamp: str,
+                               channel_id: str,
+                               team_id: str = None) -> dict:
+        return await self._run(self.slack_api.get_message_info, timestamp, channel_id, team_id)
+
+    async def update_message(self,
+                             timestamp: str,
+                             channel_id: str,
+                             team_id: str,
+                             text: str) -> dict:
+        return await self._run(self.slack_api.update_message, timestamp, channel_id, team_id, text)
+
+    async def delete_message(self,
+                             timestamp: str,
+                             channel_id: str,
+                             team_id: str) -> dict:
+        return await self._run(self.slack_api.delete_message, timestamp, channel_id, team_id)
+
+    async def tombstone_message(self,
+                                timestamp: str,
+                                channel_id: str,
+                                team_id: str,
+                                content: str = None) -> dict:
+        return await self._run(self.slack_api.tombstone_message, timestamp, channel_id, team_id, content)
+
+    async def restore_message(self,
+                              channel_id: str,
+                              timestamp: str,
+                              team_id: str) -> dict:
+        return await self._run(self.slack_api.restore_message, channel_id, timestamp, team_id)
+
+    async def list_drafts(self,
+                          team_id: str,
+                          oldest: int = None,
+                          latest: int = None) -> List[Dict]:
+        return await self._run(self.slack_api.list_drafts, team_id, oldest=oldest, latest=latest)
+
+    async def get_draft_info(self,
+                             team_id: str,
+                             draft_id: str,
+                             user_id: str,
+                             oldest: float = None,
+                             latest: float = None) -> dict:
+        return await self._run(self.slack_api.get_draft_info, team_id, draft_id, user_id, oldest=oldest,
+                               latest=latest)
+
+    async def list_files(self,
+                         oldest: int or str = None,
+                         latest: int or str = None) -> List[Dict]:
+        return await self._run(self.slack_api.list_files, oldest=oldest, latest=latest)
+
+    async def get_file_info(self, file_id: str) -> dict:
+        return await self._run(self.slack_api.get_file_info, file_id)
+
+    async def tombstone_file(self,
+                             file_id: str,
+                             title: str = None,
+                             content: str = None) -> dict:
+        return await self._run(self.slack_api.tombstone_file, file_id, title, content)
+
+    async def restore_file(self, file_id: str) -> dict:
+        return await self._run(self.slack_api.restore_file, file_id)
+
+    async def delete_file(self, file_id: str) -> dict:
+        return await self._run(self.slack_api.delete_file, file_id)
+
+    async def get_team_info(self, team_id: str) -> dict:
+        return await self._run(self.slack_api.get_team_info, team_id)
+
+
+def initiate_async_slack_connection(token: str,
+                                    concurrency: int = DEFAULT_CONCURRENCY,
+                                    limiter: rate_limiter.RateLimiter = None,
+                                    base_url: str = slack_wrapper.DEFAULT_BASE_URL,
+                                    cache: metadata_cache.MetadataCache = None,
+                                    controller: adaptive_concurrency.AdaptiveConcurrency = None,
+                                    metrics: api_metrics.ApiMetrics = None) -> AsyncSlackAPI:
+    """ Create an async Slack API object to use for interacting with the Slack API
+
+    Args:
+        token: Slack API token
+        concurrency: Maximum number of requests to have in flight at once
+        limiter: Rate limiter to share with other Slack API objects. A new one is
+            created if not given
+        base_url: Base URL of the Slack API
+        cache: Cache for team, conversation and enterprise lookups
+        controller: Adaptive controller to set the number of requests in flight. If given,
+            concurrency is the maximum it can reach
+        metrics: Collector for API usage metrics
+    Returns:
+        Async Slack API object
+    """
+
+    try:
+        return AsyncSlackAPI(token, concurrency, limiter, base_url, cache, controller, metrics)
+    except Exception as e:
+        raise e
+
+
+async def _get_conversation_messages(slack_connection: AsyncSlackAPI,
+                                     conv: Dict,
+                                     timeframe: int,
+                                     checkpoints: checkpoint.CheckpointStore = None,
+                                     journal: scan_journal.ScanJournal = None) -> List[Dict]:
+    """ Get recent messages for a single conversation
+
+    Args:
+        slack_connection: Async Slack API object
+        conv: Conversation output from discovery.conversations.recent endpoint
+        timeframe: Furthest back time to get messages from
+        checkpoints: Store of high-water marks for each conversation
+        journal: Journal to record completed conversations in, and reuse their messages from
+    Returns:
+        List of messages from the conversation
+    """
+
+    if journal:
+        completed = await slack_connection.offload(journal.get_completed, scan_journal.CONVERSATION, conv.get('id'))
+        if completed is not None:
+            return completed
+
+    oldest = timeframe
+    if checkpoints:
+        oldest = await slack_connection.offload(checkpoints.since, checkpoint.CONVERSATION, conv.get('id'), timeframe)
+    message_list = await slack_connection.get_conversation_history(conv.get('id'), conv.get('team'),
+                                                                   oldest=oldest)
+    if checkpoints:
+        message_list = await slack_connection.offload(checkpoints.new_entries, checkpoint.CONVERSATION,
+                                                      conv.get('id'), message_list, 'ts', 'ts')
+    messages = slack_wrapper.prepare_messages(conv, message_list)
+    if journal:
+        await slack_connection.offload(journal.complete, scan_journal.CONVERSATION, conv.get('id'), messages)
+    if slack_connection.slack_api.cache:
+        await slack_connection.offload(slack_connection.slack_api.cache.set, slack_wrapper.CONVERSATION_SIZE,
+                                       conv.get('id'), len(messages))
+    return messages
+
+
+async def _get_conversation_edited_messages(slack_connection: AsyncSlackAPI,
+                                           conv: Dict,
+                                           timeframe: int,
+                                           checkpoints: checkpoint.CheckpointStore = None,
+                                           journal: scan_journal.ScanJournal = None) -> List[Dict]:
+    """ Get messages in a single conversation that were posted before the timeframe, but
+    edited during it
+
+    Args:
+        slack_connection: Async Slack API object
+        conv: Conversation output from discovery.conversations.recent endpoint
+        timeframe: Furthest back time to get edits from
+        checkpoints: Store of high-water marks for each conversation
+        journal: Journal to record completed conversations in, and reuse their edits from
+    Returns:
+        List of edited messages from the conversation
+    """
+
+    if journal:
+        completed = await slack_connection.offload(journal.get_completed, scan_journal.CONVERSATION_EDITS,
+                                                   conv.get('id'))
+        if completed is not None:
+            return completed
+
+    oldest = timeframe
+    history_oldest = timeframe
+    if checkpoints:
+        oldest = await slack_connection.offload(checkpoints.since, checkpoint.CONVERSATION_EDITS, conv.get('id'),
+                                                timeframe)
+        history_oldest = await slack_connection.offload(checkpoints.since, checkpoint.CONVERSATION, conv.get('id'),
+                                                        timeframe)
+    edit_list = await slack_connection.get_conversation_edits(conv.get('id'), conv.get('team'), oldest=oldest)
+    if checkpoints:
+        edit_list = await slack_connection.offload(checkpoints.new_entries, checkpoint.CONVERSATION_EDITS,
+                                                   conv.get('id'), edit_list, 'edited.ts', 'ts')
+    messages = slack_wrapper.prepare_edits(conv, edit_list, history_oldest)
+    if journal:
+        await slack_connection.offload(journal.complete, scan_journal.CONVERSATION_EDITS, conv.get('id'), messages)
+    return messages
+
+
+async def _get_file(slack_connection: AsyncSlackAPI,
+                    file_id: str,
+                    verbose: bool,
+                    journal: scan_journal.ScanJournal = None) -> post.File or None:
+    """ Get file information and the conversations the file has been shared in
+
+    Args:
+        slack_connection: Async Slack API object
+        file_id: ID of the file
+        verbose: Whether to use verbose logging or not
+        journal: Journal to record completed files in, and reuse them from
+    Returns:
+        File object, or None if the file hasn't been shared
+    """
+
+    if journal:
+        completed = await slack_connection.offload(journal.get_completed, scan_journal.FILE, file_id)
+        if completed is not None:
+            return completed[0] if completed else None
+
+    file_info = await slack_connection.get_file_info(file_id)
+    if not file_info.get('shares'):
+        if journal:
+            await slack_connection.offload(journal.complete, scan_journal.FILE, file_id, [])
+        return None
+
+    shares = []
+    for share in file_info.get('shares'):
+        if share.get('channel').startswith('D'):
+            team_id = (await slack_connection.get_enterprise_info()).get('id')
+        else:
+            team_id = share.get('team')
+        conv = (await slack_connection.get_conversation_info(share.get('channel'), team_id))[0]
+        shares.append(conversation.create_from_dict(conv, verbose))
+    file_info['shares'] = shares
+    file = post.create_file_from_dict(file_info)
+    if journal:
+        await slack_connection.offload(journal.complete, scan_journal.FILE, file_id, [file])
+
+    return file
+
+
+async def get_all_messages(slack_connection: AsyncSlackAPI,
+                           timeframe: int = slack_wrapper.DEFAULT_TIMEFRAME,
+                           checkpoints: checkpoint.CheckpointStore = None,
+                           journal: scan_journal.ScanJournal = None,
+                           edits: bool = False) -> List[Dict]:
+    """ Get all messages in the Enterprise for a given timeframe, fetching conversation
+    histories concurrently
+
+    Args:
+        slack_connection: Async Slack API object
+        timeframe: timeframe to search in
+        checkpoints: Store of high-water marks. If given, only messages newer than the
+            last scanned message in each conversation are returned
+        journal: Journal to record completed conversations in, and resume from
+        edits: Whether to also get messages posted before the timeframe but edited during it
+    Returns:
+        list of messages from all recently updated conversations
+    """
+
+    updated_conversations = await slack_connection.get_recent_conversations(latest=timeframe)
+    fetches = [_get_conversation_messages(slack_connection, conv, timeframe, checkpoints, journal)
+               for conv in updated_conversations]
+    if edits:
+        fetches.extend(_get_conversation_edited_messages(slack_connection, conv, timeframe, checkpoints, journal)
+                       for conv in updated_conversations)
+    histories = await asyncio.gather(*fetches)
+
+    return slack_wrapper._flatten_list(histories)
+
+
+async def get_all_files(slack_connection: AsyncSlackAPI,
+                        verbose: bool,
+                        timeframe: int = slack_wrapper.DEFAULT_TIMEFRAME,
+                        checkpoints: checkpoint.CheckpointStore = None,
+                        journal: scan_journal.ScanJournal = None) -> List[post.File]:
+    """ Get all files in the Enterprise for a given timeframe, fetching file
+    information concurrently
+
+    Args:
+        slack_connection: Async Slack API object
+        verbose: Whether to use verbose logging or not
+        timeframe: timeframe to search in
+        checkpoints: Store of high-water marks. If given, only files newer than the
+            last scanned file are returned
+        journal: Journal to record completed files in, and resume from
+    Returns:
+        list of File objects
+    """
+
+    oldest = timeframe
+    if checkpoints:
+        oldest = await slack_connection.offload(checkpoints.since, checkpoint.FILES, checkpoint.ENTERPRISE, timeframe)
+    updated_files = await slack_connection.list_files(oldest=int(oldest))
+    if checkpoints:
+        updated_files = await slack_connection.offload(checkpoints.new_entries, checkpoint.FILES,
+                                                       checkpoint.ENTERPRISE, updated_files, 'created')
+    files = await asyncio.gather(*(_get_file(slack_connection, f.get('id'), verbose, journal) for f in updated_files))
+
+    return [f for f in files if f]
@@ -0,0 +1,170 @@
+import hashlib
+import os
+import threading
+from pathlib import Path
+from typing import Set
+from urllib.parse import urlsplit, parse_qsl
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+from . import json_codec
+
+RECORD = 'record'
+REPLAY = 'replay'
+# Response headers kept in recordings
+RECORDED_HEADERS = ['Content-Type', 'Retry-After']
+# Parameters holding timestamps relative to when the scan ran. The timestamps of the
+# scan's timeframe are left out of the interaction key so recordings replay at any time.
+# Some methods page by passing the timestamp of the last item on a page in latest, and
+# these are kept, so each page has its own key
+TIME_PARAMS = ['oldest', 'latest']
+
+
+class CassetteError(Exception):
+    pass
+
+
+def _is_timestamp(value: str) -> bool:
+    try:
+        float(value)
+        return True
+    except ValueError:
+        return False
+
+
+def _interaction_key(request: requests.PreparedRequest, cursors: Set[str] = frozenset()) -> str:
+    """ Build a stable key identifying a request. Query parameters are sorted
+    so the key doesn't depend on parameter order, and timestamps are masked unless
+    they are the cursor of a page
+
+    Args:
+        request: Request being sent
+        cursors: Offsets of the next page given in responses
+    Returns:
+        Hex digest identifying the request
+    """
+
+    url = urlsplit(request.url)
+    query = sorted((k, '*' if k in TIME_PARAMS and _is_timestamp(v) and v not in cursors else v)
+                   for k, v in parse_qsl(url.query, keep_blank_values=True))
+    body = request.body or ''
+    if isinstance(body, bytes):
+        body = body.decode('utf-8')
+    key = '\n'.join((request.method, url.path, repr(query), body))
+
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+class CassetteAdapter(HTTPAdapter):
+    """ Transport adapter that records Slack API responses to disk, or replays
+    previously recorded responses without making any network calls.
+
+    Each interaction is stored as a JSON file in the cassette directory, named after
+    a hash of the request method, path, query parameters and body. The offset of the
+    next page in each response is remembered, so a timestamp passed back as the cursor
+    of a page is told apart from the timestamps of the scan's timeframe."""
+
+    def __init__(self, path: str or Path, mode: str = REPLAY, **kwargs):
+        super().__init__(**kwargs)
+        if mode not in (RECORD, REPLAY):
+            raise CassetteError(f'Unknown cassette mode: {mode}')
+        self.path = Path(path)
+        self.mode = mode
+        self._cursors: Set[str] = set()
+        self._lock = threading.Lock()
+        if mode == RECORD:
+            os.makedirs(self.path, exist_ok=True)
+
+    def _interaction_path(self, request: requests.PreparedRequest) -> Path:
+        with self._lock:
+            return self.path / f'{_interaction_key(request, self._cursors)}.json'
+
+    def _add_cursor(self, body: str) -> None:
+        """ Remember the offset of the next page given in a response """
+
+        try:
+            offset = json_codec.loads(body).get('offset')
+        except (ValueError, AttributeError):
+            return
+        if offset:
+            with self._lock:
+                self._cursors.add(str(offset))
+
+    def send(self, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+        if self.mode == REPLAY:
+            return self._replay(request)
+
+        response = super().send(request, **kwargs)
+        self._record(request, response)
+        return response
+
+    def _record(self, request: requests.PreparedRequest, response: requests.Response):
+        """ Save a response to the cassette. Authorisation headers are never recorded
+
+        Args:
+            request: Request that was sent
+            response: Response from the API
+        """
+
+        interaction = {
+            'method': request.method,
+            'url': request.url,
+            'status': response.status_code,
+            'headers': {k: response.headers.get(k) for k in RECORDED_HEADERS if response.headers.get(k)},
+            'body': response.content.decode('utf-8')
+        }
+        path = self._interaction_path(request)
+        self._add_cursor(interaction.get('body'))
+        tmp_path = path.with_name(f'{path.name}.{os.getpid()}-{threading.get_ident()}.tmp')
+        with open(tmp_path, 'w') as f:
+            f.write(json_codec.dumps(interaction))
+        os.replace(tmp_path, path)
+
+    def _replay(self, request: requests.PreparedRequest) -> requests.Response:
+        """ Build a response from a recorded interaction
+
+        Args:
+            request: Request being sent
+        Returns:
+            The recorded response
+        """
+
+        path = self._interaction_path(request)
+        if not path.exists():
+            raise CassetteError(f'No recorded response for {request.method} {request.url}')
+        with open(path) as f:
+            interaction = json_codec.loads(f.read())
+        self._add_cursor(interaction.get('body'))
+
+        response = requests.Response()
+        response.status_code = interaction.get('status')
+        response.headers = CaseInsensitiveDict(interaction.get('headers'))
+        response._content = interaction.get('body').encode('utf-8')
+        response.encoding = 'utf-8'
+        response.url = request.url
+        response.request = request
+        response.reason = 'Replayed'
+
+        return response
+
+
+def use_cassette(slack_connection, path: str or Path, mode: str = REPLAY) -> None:
+    """ Route all requests made by a SlackAPI object through a cassette
+
+    Args:
+        slack_connection: SlackAPI object
+        path: Directory to record to, or replay from
+        mode: 'record' to save responses from the API, 'replay' to serve saved responses
+    """
+
+    current = slack_connection.session.get_adapter(slack_connection.base_url)
+    slack_connection.session.mount(
+        slack_connection.base_url,
+        CassetteAdapter(
+            path,
+            mode,
+            max_retries=current.max_retries,
+            pool_connections=current._pool_connections,
+            pool_maxsize=current._pool_maxsize))
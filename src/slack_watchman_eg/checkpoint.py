@@ -0,0 +1,227 @@
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Iterable, List, Dict, Set, Tuple
+
+from . import json_codec
+
+CONVERSATION = 'conversation'
+CONVERSATION_EDITS = 'conversation_edits'
+FILES = 'files'
+DRAFTS = 'drafts'
+# Key of the single high-water mark kept for files, which are listed Enterprise wide
+ENTERPRISE = 'enterprise'
+# Marks left uncommitted by runs that failed are deleted after this many seconds
+STALE_PENDING = 24 * 3600
+SQLITE_TIMEOUT = 30
+
+
+def _value(entry: Dict, field: str) -> Any:
+    for name in field.split('.'):
+        entry = entry.get(name)
+    return entry
+
+
+def _timestamp(entry: Dict, field: str) -> float:
+    return float(_value(entry, field))
+
+
+def _merge(mark: Tuple[float, Set[str]] or None, ts: float, ids: Iterable[str]) -> Tuple[float, Set[str]]:
+    """ Combine a high-water mark with a newer one. Where both are at the same time, the
+    entries at the mark are those of both """
+
+    if mark is None or ts > mark[0]:
+        return ts, set(ids)
+    if ts == mark[0]:
+        return ts, mark[1] | set(ids)
+    return mark
+
+
+class CheckpointStore(object):
+    """ Persistent store of high-water marks: the timestamp of the newest message in each
+    conversation, newest file and newest draft in each workspace that has been scanned.
+    Later runs only fetch items from the mark on.
+
+    Some timestamps are only to the second, so an entry created in the same second as the
+    mark, after the previous listing, has the same timestamp as the mark. The IDs of the
+    entries at the mark are stored with it, so only those are skipped.
+
+    Marks found during a run are held as pending until commit() is called at the end of
+    the run, so a run that fails partway doesn't skip items it never finished scanning.
+    The store can be shared by every worker process in a run. A run resuming an earlier
+    run that failed can pass the same run ID to keep the marks the earlier run found."""
+
+    def __init__(self, path: str or Path, run_id: str = None):
+        self.path = str(path)
+        self.run_id = run_id or uuid.uuid4().hex
+        self._local = threading.local()
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        connection = self._connection()
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS checkpoints ('
+            'kind TEXT NOT NULL, '
+            'key TEXT NOT NULL, '
+            'ts REAL NOT NULL, '
+            "ids TEXT NOT NULL DEFAULT '[]', "
+            'PRIMARY KEY (kind, key))')
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS pending ('
+            'run TEXT NOT NULL, '
+            'kind TEXT NOT NULL, '
+            'key TEXT NOT NULL, '
+            'ts REAL NOT NULL, '
+            "ids TEXT NOT NULL DEFAULT '[]', "
+            'updated REAL NOT NULL, '
+            'PRIMARY KEY (run, kind, key))')
+        for table in ('checkpoints', 'pending'):
+            # Stores created before the IDs at each mark were kept
+            if 'ids' not in [column[1] for column in connection.execute(f'PRAGMA table_info({table})')]:
+                connection.execute(f"ALTER TABLE {table} ADD COLUMN ids TEXT NOT NULL DEFAULT '[]'")
+        connection.execute('DELETE FROM pending WHERE updated <= ?', (time.time() - STALE_PENDING,))
+
+    def __getstate__(self):
+        return {'path': self.path, 'run_id': self.run_id}
+
+    def __setstate__(self, state):
+        self.path = state.get('path')
+        self.run_id = state.get('run_id')
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        """ Get the SQLite connection for the current process and thread. Connections
+        inherited from a parent process are never reused
+
+        Returns:
+            SQLite connection
+        """
+
+        if getattr(self._local, 'pid', None) != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=SQLITE_TIMEOUT, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return self._local.connection
+
+    def get(self, kind: str, key: str) -> float or None:
+        """ Get the committed high-water mark for an item
+
+        Args:
+            kind: Type of the item, e.g. conversation
+            key: ID of the item
+        Returns:
+            Timestamp of the newest entry scanned, or None if the item has never been scanned
+        """
+
+        mark = self._mark(kind, key)
+        if mark:
+            return mark[0]
+
+    def _mark(self, kind: str, key: str) -> Tuple[float, Set[str]] or None:
+        """ Get the committed high-water mark for an item, and the IDs of the entries at it """
+
+        row = self._connection().execute(
+            'SELECT ts, ids FROM checkpoints WHERE kind = ? AND key = ?', (kind, key)).fetchone()
+        if row:
+            return row[0], set(json_codec.loads(row[1]))
+
+    def _pending_mark(self, kind: str, key: str) -> Tuple[float, Set[str]] or None:
+        """ Get the high-water mark recorded for an item by this run, and the IDs of the
+        entries at it """
+
+        row = self._connection().execute(
+            'SELECT ts, ids FROM pending WHERE run = ? AND kind = ? AND key = ?', (self.run_id, kind, key)).fetchone()
+        if row:
+            return row[0], set(json_codec.loads(row[1]))
+
+    def since(self, kind: str, key: str, timeframe: float) -> float:
+        """ Get the timestamp to fetch entries for an item from. The timeframe of the run
+        is always the furthest back entries are fetched from
+
+        Args:
+            kind: Type of the item, e.g. conversation
+            key: ID of the item
+            timeframe: Furthest back time to get entries from
+        Returns:
+            Timestamp to fetch entries from
+        """
+
+        mark = self.get(kind, key)
+        if mark is None:
+            return timeframe
+        return max(float(timeframe), mark)
+
+    def advance(self, kind: str, key: str, ts: float, ids: Iterable[str] = ()) -> None:
+        """ Record a new high-water mark for an item. The mark is pending until committed
+
+        Args:
+            kind: Type of the item, e.g. conversation
+            key: ID of the item
+            ts: Timestamp of the newest entry scanned
+            ids: IDs of the entries scanned with that timestamp
+        """
+
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            mark = _merge(self._pending_mark(kind, key), float(ts), ids)
+            connection.execute(
+                'INSERT OR REPLACE INTO pending (run, kind, key, ts, ids, updated) VALUES (?, ?, ?, ?, ?, ?)',
+                (self.run_id, kind, key, mark[0], json_codec.dumps(sorted(mark[1])), time.time()))
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+
+    def new_entries(self, kind: str, key: str, entries: List[Dict], field: str, id_field: str = 'id') -> List[Dict]:
+        """ Drop entries before the high-water mark of an item, and those at the mark that
+        have already been scanned, then advance the mark to the newest entry
+
+        Args:
+            kind: Type of the item, e.g. conversation
+            key: ID of the item
+            entries: Entries fetched for the item, e.g. messages
+            field: Field of each entry holding its timestamp. Fields of nested objects are
+                separated by dots, e.g. edited.ts
+            id_field: Field of each entry holding its ID
+        Returns:
+            Entries that haven't been scanned
+        """
+
+        mark = self._mark(kind, key)
+        if mark is not None:
+            entries = [e for e in entries if _timestamp(e, field) > mark[0]
+                       or (_timestamp(e, field) == mark[0] and str(_value(e, id_field)) not in mark[1])]
+        if entries:
+            newest = max(_timestamp(e, field) for e in entries)
+            self.advance(kind, key, newest,
+                         [str(_value(e, id_field)) for e in entries if _timestamp(e, field) == newest])
+        return entries
+
+    def commit(self) -> int:
+        """ Commit the high-water marks recorded during this run by every process
+
+        Returns:
+            Number of marks committed
+        """
+
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            pending = connection.execute(
+                'SELECT kind, key, ts, ids FROM pending WHERE run = ?', (self.run_id,)).fetchall()
+            for kind, key, ts, ids in pending:
+                mark = _merge(self._mark(kind, key), ts, json_codec.loads(ids))
+                connection.execute(
+                    'INSERT OR REPLACE INTO checkpoints (kind, key, ts, ids) VALUES (?, ?, ?, ?)',
+                    (kind, key, mark[0], json_codec.dumps(sorted(mark[1]))))
+            count = len(pending)
+            connection.execute('DELETE FROM pending WHERE run = ?', (self.run_id,))
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        return count
@@ -0,0 +1,592 @@
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Tuple
+
+from . import slack_wrapper
+from . import sw_logger
+from . import json_codec
+from . import directory
+from . import scan_journal
+from .models import (
+    signature,
+    workspace
+)
+
+DEFAULT_SHARDS = 8
+# Seconds a worker holds a shard for without a heartbeat before another worker can take it
+LEASE = 300
+# Shards that fail this many times are given up on, and reported by the coordinator
+MAX_ATTEMPTS = 3
+POLL_INTERVAL = 1
+# Seconds a worker waits for a coordinator to start a scan before exiting
+IDLE_TIMEOUT = 60
+# Seconds a coordinator waits without any worker claiming, scanning or finishing a shard
+# before giving up on the scan
+STALL_TIMEOUT = LEASE
+SQLITE_TIMEOUT = 30
+
+PENDING = 'pending'
+CLAIMED = 'claimed'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class QueueError(Exception):
+    pass
+
+
+class Shard(object):
+    """ A share of a scan for one worker to complete: recently active conversations, new
+    files and workspaces, each assigned to the shard by a stable hash of its ID """
+
+    def __init__(self,
+                 scan_id: str,
+                 index: int,
+                 conversations: List[Dict],
+                 files: List[Dict],
+                 workspaces: List[workspace.Workspace]):
+        self.scan_id = scan_id
+        self.index = index
+        self.conversations = conversations
+        self.files = files
+        self.workspaces = workspaces
+
+
+def shard_of(key: str, shards: int) -> int:
+    """ Get the shard an item belongs to. The same ID is always assigned to the same shard,
+    whichever host or process assigns it
+
+    Args:
+        key: ID of the item, e.g. a conversation ID
+        shards: Number of shards in the scan
+    Returns:
+        Index of the shard
+    """
+
+    return zlib.crc32(key.encode()) % shards
+
+
+class ShardQueue(object):
+    """ Queue of shards shared by a coordinator and the workers scanning for it, along
+    with the findings of each shard.
+
+    The queue is stored in SQLite in WAL mode, so coordinator and workers can run as
+    separate processes, but only on one host. WAL keeps its index in shared memory, which
+    processes on other hosts sharing the file over a network filesystem can't see.
+
+    Workers claim a shard at a time and keep a heartbeat on it while scanning. A shard whose
+    worker stops sending heartbeats is claimed again by another worker."""
+
+    def __init__(self, path: str or Path):
+        self.path = str(path)
+        self._local = threading.local()
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        connection = self._connection()
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS scans ('
+            'id TEXT PRIMARY KEY, '
+            'timeframe INTEGER NOT NULL, '
+            'edits INTEGER NOT NULL, '
+            'directory TEXT NOT NULL, '
+            'started REAL NOT NULL, '
+            'finished REAL)')
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS shards ('
+            'scan TEXT NOT NULL, '
+            'shard INTEGER NOT NULL, '
+            'items TEXT NOT NULL, '
+            'status TEXT NOT NULL, '
+            'worker TEXT, '
+            'heartbeat REAL, '
+            'attempts INTEGER NOT NULL DEFAULT 0, '
+            'error TEXT, '
+            'PRIMARY KEY (scan, shard))')
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS findings ('
+            'scan TEXT NOT NULL, '
+            'key TEXT NOT NULL, '
+            'scope TEXT NOT NULL, '
+            'detect_type TEXT NOT NULL, '
+            'severity TEXT, '
+            'finding TEXT NOT NULL, '
+            'PRIMARY KEY (scan, key))')
+
+    def __getstate__(self):
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.path = state.get('path')
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        """ Get the SQLite connection for the current process and thread. Connections
+        inherited from a parent process are never reused
+
+        Returns:
+            SQLite connection
+        """
+
+        if getattr(self._local, 'pid', None) != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=SQLITE_TIMEOUT, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return self._local.connection
+
+    def create_scan(self,
+                    timeframe: int,
+                    edits: bool,
+                    enterprise_directory: directory.EnterpriseDirectory,
+                    shards: List[Shard]) -> str:
+        """ Start a scan, adding its shards to the queue
+
+        Args:
+            timeframe: Furthest back time the scan gets messages from
+            edits: Whether the scan also searches older messages edited during the timeframe
+            enterprise_directory: Users and workspaces in the Enterprise, used by the workers
+                to resolve matches without enumerating every user themselves
+            shards: Shards of the scan
+        Returns:
+            ID of the scan
+        """
+
+        scan_id = uuid.uuid4().hex
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute(
+                'INSERT INTO scans (id, timeframe, edits, directory, started) VALUES (?, ?, ?, ?, ?)',
+                (scan_id, timeframe, int(edits), json_codec.dumps(enterprise_directory.to_dict()), time.time()))
+            connection.executemany(
+                'INSERT INTO shards (scan, shard, items, status) VALUES (?, ?, ?, ?)',
+                [(scan_id, shard.index, json_codec.dumps(_shard_items(shard)), PENDING) for shard in shards])
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        return scan_id
+
+    def claim(self, worker_id: str) -> Shard or None:
+        """ Claim the next shard waiting to be scanned, or whose worker has stopped sending
+        heartbeats. A shard whose worker stopped sending heartbeats on its last attempt is
+        marked as failed instead
+
+        Args:
+            worker_id: ID of the worker claiming the shard
+        Returns:
+            The claimed shard, or None if there are no shards to scan
+        """
+
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            stale = time.time() - LEASE
+            # A shard whose worker keeps dying, e.g. running out of memory, is given up on
+            # like one that keeps failing
+            connection.execute(
+                'UPDATE shards SET status = ?, worker = NULL, error = ? '
+                'WHERE status = ? AND heartbeat < ? AND attempts >= ?',
+                (FAILED, 'Worker stopped sending heartbeats on the last attempt', CLAIMED, stale, MAX_ATTEMPTS))
+            row = connection.execute(
+                'SELECT shards.scan, shards.shard, shards.items FROM shards '
+                'JOIN scans ON scans.id = shards.scan '
+                'WHERE scans.finished IS NULL AND (shards.status = ? OR '
+                '(shards.status = ? AND shards.heartbeat < ? AND shards.attempts < ?)) '
+                'ORDER BY scans.started, shards.shard LIMIT 1',
+                (PENDING, CLAIMED, stale, MAX_ATTEMPTS)).fetchone()
+            if row:
+                connection.execute(
+                    'UPDATE shards SET status = ?, worker = ?, heartbeat = ?, attempts = attempts + 1 '
+                    'WHERE scan = ? AND shard = ?',
+                    (CLAIMED, worker_id, time.time(), row[0], row[1]))
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        if row:
+            items = json_codec.loads(row[2])
+            return Shard(row[0], row[1], items.get('conversations'), items.get('files'),
+                         [directory.workspace_from_dict(w) for w in items.get('workspaces')])
+
+    def heartbeat(self, shard: Shard, worker_id: str) -> None:
+        """ Renew a worker's claim on a shard
+
+        Args:
+            shard: Shard being scanned
+            worker_id: ID of the worker scanning it
+        """
+
+        self._connection().execute(
+            'UPDATE shards SET heartbeat = ? WHERE scan = ? AND shard = ? AND worker = ? AND status = ?',
+            (time.time(), shard.scan_id, shard.index, worker_id, CLAIMED))
+
+    def complete(self, shard: Shard, worker_id: str, findings: List[Tuple[str, str, Any, Any]]) -> bool:
+        """ Record the findings of a shard, and mark it as done. If the worker's claim on the
+        shard expired and another worker has taken it over, the findings are discarded
+
+        Args:
+            shard: Shard that has been scanned
+            worker_id: ID of the worker that scanned it
+            findings: Scope, signature name, severity and finding, for each finding
+        Returns:
+            Whether the worker still held the shard, and the findings were recorded
+        """
+
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            held = connection.execute(
+                'UPDATE shards SET status = ?, error = NULL WHERE scan = ? AND shard = ? AND worker = ? AND status = ?',
+                (DONE, shard.scan_id, shard.index, worker_id, CLAIMED)).rowcount
+            if held:
+                connection.executemany(
+                    'INSERT OR IGNORE INTO findings (scan, key, scope, detect_type, severity, finding) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    [(shard.scan_id, scan_journal.finding_key(scope, detect_type, finding), scope, detect_type,
+                      str(severity), json_codec.dumps(finding)) for scope, detect_type, severity, finding in findings])
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        return bool(held)
+
+    def fail(self, shard: Shard, worker_id: str, error: Exception) -> bool:
+        """ Return a shard that failed to the queue to be tried again, or give up on it
+        once it has failed MAX_ATTEMPTS times. Nothing is changed if the worker's claim on
+        the shard expired and another worker has taken it over
+
+        Args:
+            shard: Shard that failed
+            worker_id: ID of the worker that failed to scan it
+            error: Exception that caused the failure
+        Returns:
+            Whether the worker still held the shard
+        """
+
+        return bool(self._connection().execute(
+            'UPDATE shards SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, worker = NULL, error = ? '
+            'WHERE scan = ? AND shard = ? AND worker = ? AND status = ?',
+            (MAX_ATTEMPTS, FAILED, PENDING, str(error), shard.scan_id, shard.index, worker_id, CLAIMED)).rowcount)
+
+    def progress(self, scan_id: str) -> Dict[str, int]:
+        """ Count the shards of a scan in each state
+
+        Args:
+            scan_id: ID of the scan
+        Returns:
+            Number of shards pending, claimed, done and failed
+        """
+
+        counts = {PENDING: 0, CLAIMED: 0, DONE: 0, FAILED: 0}
+        for status, count in self._connection().execute(
+                'SELECT status, count(*) FROM shards WHERE scan = ? GROUP BY status', (scan_id,)):
+            counts[status] = count
+        return counts
+
+    def errors(self, scan_id: str) -> List[Tuple[int, str]]:
+        """ Get the shards of a scan that were given up on
+
+        Args:
+            scan_id: ID of the scan
+        Returns:
+            Index and last error of each failed shard
+        """
+
+        return self._connection().execute(
+            'SELECT shard, error FROM shards WHERE scan = ? AND status = ? ORDER BY shard',
+            (scan_id, FAILED)).fetchall()
+
+    def findings(self, scan_id: str) -> Iterator[Tuple[str, str, str, Any]]:
+        """ Get the findings of a scan, from every shard
+
+        Args:
+            scan_id: ID of the scan
+        Returns:
+            Scope, signature name, severity and finding, for each finding
+        """
+
+        for scope, detect_type, severity, finding in self._connection().execute(
+                'SELECT scope, detect_type, severity, finding FROM findings WHERE scan = ? ORDER BY rowid',
+                (scan_id,)):
+            yield scope, detect_type, severity, json_codec.loads(finding)
+
+    def get_scan(self, scan_id: str) -> Tuple[int, bool, directory.EnterpriseDirectory]:
+        """ Get the settings of a scan for a worker
+
+        Args:
+            scan_id: ID of the scan
+        Returns:
+            Timeframe, whether edits are searched, and the Enterprise directory
+        """
+
+        row = self._connection().execute(
+            'SELECT timeframe, edits, directory FROM scans WHERE id = ?', (scan_id,)).fetchone()
+        if not row:
+            raise QueueError(f'No scan {scan_id} in {self.path}')
+        return row[0], bool(row[1]), directory.EnterpriseDirectory.from_dict(json_codec.loads(row[2]))
+
+    def last_heartbeat(self, scan_id: str) -> float or None:
+        """ Get the last time a worker claimed or sent a heartbeat for a shard of a scan
+
+        Args:
+            scan_id: ID of the scan
+        Returns:
+            Time of the last heartbeat, or None if no shard has been claimed
+        """
+
+        return self._connection().execute(
+            'SELECT max(heartbeat) FROM shards WHERE scan = ?', (scan_id,)).fetchone()[0]
+
+    def outstanding(self) -> int:
+        """ Get the number of shards of unfinished scans still waiting to be scanned, or
+        being scanned
+
+        Returns:
+            Number of outstanding shards
+        """
+
+        return self._connection().execute(
+            'SELECT count(*) FROM shards JOIN scans ON scans.id = shards.scan '
+            'WHERE scans.finished IS NULL AND shards.status IN (?, ?)', (PENDING, CLAIMED)).fetchone()[0]
+
+    def finish(self, scan_id: str) -> None:
+        """ Mark a scan as finished, and remove its shards and findings from the queue
+
+        Args:
+            scan_id: ID of the scan
+        """
+
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute('DELETE FROM shards WHERE scan = ?', (scan_id,))
+            connection.execute('DELETE FROM findings WHERE scan = ?', (scan_id,))
+            connection.execute("UPDATE scans SET finished = ?, directory = '' WHERE id = ?", (time.time(), scan_id))
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+
+
+def _shard_items(shard: Shard) -> Dict[str, List[Dict]]:
+    """ Get the conversations, files and workspaces of a shard in a form that can be stored
+    as JSON. JSON is used rather than pickle, as unpickling a queue file anyone else can
+    write to would run any code they put in it """
+
+    return {
+        'conversations': shard.conversations,
+        'files': shard.files,
+        'workspaces': [directory.workspace_to_dict(w) for w in shard.workspaces]
+    }
+
+
+def make_shards(conversations: List[Dict],
+                files: List[Dict],
+                workspaces: List[workspace.Workspace],
+                shards: int) -> List[Shard]:
+    """ Split the conversations, files and workspaces to scan into shards by a stable hash
+    of their IDs
+
+    Args:
+        conversations: Output from the discovery.conversations.recent endpoint
+        files: Output from the discovery.files.list endpoint
+        workspaces: Workspaces to search drafts in
+        shards: Number of shards
+    Returns:
+        List of shards, without a scan ID
+    """
+
+    output = [Shard(None, index, [], [], []) for index in range(shards)]
+    for conv in conversations:
+        output[shard_of(conv.get('id'), shards)].conversations.append(conv)
+    for f in files:
+        output[shard_of(f.get('id'), shards)].files.append(f)
+    for w in workspaces:
+        output[shard_of(w.id, shards)].workspaces.append(w)
+    return output
+
+
+def coordinate(slack_connection: slack_wrapper.SlackAPI,
+               queue: ShardQueue,
+               enterprise_directory: directory.EnterpriseDirectory,
+               shards: int,
+               timeframe: int,
+               edits: bool,
+               logger: sw_logger.JSONLogger or sw_logger.StdoutLogger,
+               stall_timeout: float = STALL_TIMEOUT) -> Iterator[Tuple[str, str, str, Any]]:
+    """ Shard a scan across workers, wait for them to scan every shard, and gather
+    their findings. If no worker claims, scans or finishes a shard for stall_timeout
+    seconds, e.g. because none are running, the scan is given up on and QueueError raised
+
+    Args:
+        slack_connection: Slack API object
+        queue: Queue shared with the workers
+        enterprise_directory: Users and workspaces in the Enterprise
+        shards: Number of shards to split the scan into
+        timeframe: Furthest back time to get messages, files and drafts from
+        edits: Whether to also search older messages edited during the timeframe
+        logger: Logging object
+        stall_timeout: Seconds to wait for workers to make progress before giving up
+    Returns:
+        Scope, signature name, severity and finding, for each finding
+    """
+
+    conversations = slack_connection.get_recent_conversations(latest=timeframe)
+    files = slack_wrapper.list_new_files(slack_connection, timeframe)
+    scan_id = queue.create_scan(
+        timeframe, edits, enterprise_directory,
+        make_shards(conversations, files, list(enterprise_directory.workspaces), shards))
+    logger.log('INFO', f'Scan {scan_id} of {len(conversations)} conversations, {len(files)} files and '
+                       f'{len(enterprise_directory.workspaces)} workspaces split into {shards} shards')
+
+    done = None
+    last_progress = time.time()
+    while True:
+        progress = queue.progress(scan_id)
+        if progress.get(DONE) != done:
+            done = progress.get(DONE)
+            last_progress = time.time()
+            logger.log('INFO', f'{done} of {shards} shards scanned')
+        if not progress.get(PENDING) and not progress.get(CLAIMED):
+            break
+        last_progress = max(last_progress, queue.last_heartbeat(scan_id) or 0)
+        if time.time() - last_progress > stall_timeout:
+            queue.finish(scan_id)
+            raise QueueError(f'No worker has scanned a shard of scan {scan_id} for {stall_timeout} seconds, '
+                             f'{progress.get(PENDING) + progress.get(CLAIMED)} of {shards} shards were not scanned')
+        time.sleep(POLL_INTERVAL)
+
+    for index, error in queue.errors(scan_id):
+        logger.log('CRITICAL', f'Shard {index} failed after {MAX_ATTEMPTS} attempts: {error}')
+    yield from queue.findings(scan_id)
+    queue.finish(scan_id)
+
+
+def scan_shard(slack_connection: slack_wrapper.SlackAPI,
+               shard: Shard,
+               signature_list: List[signature.CompiledSignature],
+               enterprise_directory: directory.EnterpriseDirectory,
+               cores: int,
+               verbose: bool,
+               timeframe: int,
+               edits: bool,
+               logger: sw_logger.JSONLogger or sw_logger.StdoutLogger) -> List[Tuple[str, str, Any, Any]]:
+    """ Fetch the messages, files and drafts in a shard and search them with every signature.
+    Errors are raised rather than logged, so the shard is returned to the queue to be tried
+    again instead of being marked as done with its matches missing
+
+    Args:
+        slack_connection: Slack API object
+        shard: Shard to scan
+        signature_list: Signatures to search with
+        enterprise_directory: Users and workspaces in the Enterprise
+        cores: Number of cores to use
+        verbose: Whether to use verbose logging or not
+        timeframe: Furthest back time to get messages, files and drafts from
+        edits: Whether to also search older messages edited during the timeframe
+        logger: Logging object
+    Returns:
+        Scope, signature name, severity and finding, for each finding
+    """
+
+    messages = slack_wrapper.get_all_messages(slack_connection, cores, timeframe, edits=edits,
+                                              conversations=shard.conversations)
+    files = slack_wrapper.get_all_files(slack_connection, cores, verbose, timeframe, files=shard.files)
+    drafts = slack_wrapper.get_all_drafts(slack_connection, shard.workspaces, cores, verbose, timeframe)
+    logger.log('INFO', f'Shard {shard.index}: {len(messages)} messages, {len(files)} files and {len(drafts)} '
+                       f'drafts discovered')
+
+    findings = []
+    with slack_wrapper.SearchPool(slack_connection, signature_list, enterprise_directory, messages, files, cores,
+                                  verbose) as pool:
+        message_matches = slack_wrapper.search_message_matches(
+            signature_list, slack_connection, enterprise_directory, messages, cores, logger, verbose, pool,
+            raise_errors=True)
+        file_matches = slack_wrapper.search_file_matches(signature_list, enterprise_directory, files, cores, logger,
+                                                         pool, raise_errors=True)
+    draft_matches = slack_wrapper.search_draft_matches(slack_connection, signature_list, drafts, enterprise_directory,
+                                                       logger, verbose, timeframe, raise_errors=True)
+    for sig, message_results, file_results, draft_results in zip(signature_list, message_matches, file_matches,
+                                                                 draft_matches):
+        for result in message_results:
+            findings.append(('messages', sig.name, sig.severity, result))
+        for result in file_results:
+            findings.append(('files', sig.name, sig.severity, result))
+        for result in draft_results:
+            findings.append(('Draft', sig.name, sig.severity, result))
+    return findings
+
+
+def run_worker(slack_connection: slack_wrapper.SlackAPI,
+               queue: ShardQueue,
+               signature_list: List[signature.CompiledSignature],
+               cores: int,
+               verbose: bool,
+               logger: sw_logger.JSONLogger or sw_logger.StdoutLogger,
+               idle_timeout: float = IDLE_TIMEOUT) -> int:
+    """ Scan shards from the queue until none are left. Waits for a coordinator to start
+    a scan if there isn't one yet
+
+    Args:
+        slack_connection: Slack API object
+        queue: Queue shared with the coordinator
+        signature_list: Signatures to search with
+        cores: Number of cores to use
+        verbose: Whether to use verbose logging or not
+        logger: Logging object
+        idle_timeout: Seconds to wait for a scan to be started before exiting
+    Returns:
+        Number of shards scanned
+    """
+
+    worker_id = f'{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}'
+    logger.log('INFO', f'Worker {worker_id} waiting for shards')
+    scanned = 0
+    scans = {}
+    idle_since = time.monotonic()
+    while True:
+        shard = queue.claim(worker_id)
+        if not shard:
+            # Shards claimed by other workers may still be returned to the queue, so keep
+            # waiting until every shard has been scanned
+            if queue.outstanding() or (not scans and time.monotonic() - idle_since < idle_timeout):
+                time.sleep(POLL_INTERVAL)
+                continue
+            return scanned
+
+        if shard.scan_id not in scans:
+            scans[shard.scan_id] = queue.get_scan(shard.scan_id)
+        timeframe, edits, enterprise_directory = scans.get(shard.scan_id)
+
+        stop = threading.Event()
+
+        def keep_claim():
+            while not stop.wait(LEASE / 3):
+                queue.heartbeat(shard, worker_id)
+
+        heartbeat = threading.Thread(target=keep_claim, name='shard-heartbeat', daemon=True)
+        heartbeat.start()
+        try:
+            findings = scan_shard(slack_connection, shard, signature_list, enterprise_directory, cores, verbose,
+                                  timeframe, edits, logger)
+        except Exception as e:
+            logger.log('CRITICAL', f'Shard {shard.index} failed: {e}')
+            if not queue.fail(shard, worker_id, e):
+                logger.log('WARNING', f'Shard {shard.index} was taken over by another worker')
+        else:
+            if queue.complete(shard, worker_id, findings):
+                scanned += 1
+                logger.log('INFO', f'Shard {shard.index}: {len(findings)} findings')
+            else:
+                logger.log('WARNING', f'Shard {shard.index} was taken over by another worker, discarding '
+                                      f'{len(findings)} findings')
+        finally:
+            stop.set()
+            heartbeat.join()
@@ -0,0 +1,155 @@
+import dataclasses
+from typing import Any, List, Dict
+
+from .models import (
+    user,
+    workspace
+)
+
+_USER_TYPES = {cls.__name__: cls for cls in (user.User, user.UserSuccinct)}
+_WORKSPACE_TYPES = {cls.__name__: cls for cls in (workspace.Workspace, workspace.WorkspaceSuccinct)}
+
+
+class DirectoryError(Exception):
+    pass
+
+
+class EnterpriseDirectory(object):
+    """ Users and workspaces in the Enterprise, indexed so a user or workspace can be found
+    for a match without searching through every one of them.
+
+    The directory is read only, so worker processes forked from the parent share it
+    without copying it, see worker_pool.frozen_heap(). Only the users and workspaces are
+    pickled when it is sent to a spawned worker process, and the indexes are rebuilt there."""
+
+    def __init__(self,
+                 users_list: List[user.User] = None,
+                 workspaces_list: List[workspace.Workspace] = None):
+        self.users = tuple(users_list or ())
+        self.workspaces = tuple(workspaces_list or ())
+        self._build_indexes()
+
+    def __getstate__(self):
+        return {'users': self.users, 'workspaces': self.workspaces}
+
+    def __setstate__(self, state):
+        self.users = state.get('users')
+        self.workspaces = state.get('workspaces')
+        self._build_indexes()
+
+    def to_dict(self) -> Dict[str, List[Dict[str, Any]]]:
+        """ Convert the directory into a form that can be stored as JSON
+
+        Returns:
+            Users and workspaces in the directory as dicts
+        """
+
+        return {
+            'users': [user_to_dict(u) for u in self.users],
+            'workspaces': [workspace_to_dict(w) for w in self.workspaces]
+        }
+
+    @classmethod
+    def from_dict(cls, directory_dict: Dict[str, List[Dict[str, Any]]]) -> 'EnterpriseDirectory':
+        """ Create a directory from the output of to_dict()
+
+        Args:
+            directory_dict: Users and workspaces as dicts
+        Returns:
+            EnterpriseDirectory object
+        """
+
+        return cls([user_from_dict(u) for u in directory_dict.get('users', [])],
+                   [workspace_from_dict(w) for w in directory_dict.get('workspaces', [])])
+
+    def _build_indexes(self) -> None:
+        self._users_by_id: Dict[str, user.User] = {}
+        self._workspaces_by_id: Dict[str, workspace.Workspace] = {}
+        # Where IDs are repeated the first is kept, the same one a search of the list would find
+        for u in self.users:
+            self._users_by_id.setdefault(u.id, u)
+        for w in self.workspaces:
+            self._workspaces_by_id.setdefault(w.id, w)
+
+    def get_user(self, user_id: str) -> user.User or user.UserSuccinct or None:
+        """ Find a user by their ID
+
+        Args:
+            user_id: ID of the user, e.g. U01ABCDEF
+        Returns:
+            User object, or None if the user isn't in the Enterprise
+        """
+
+        return self._users_by_id.get(user_id)
+
+    def get_workspace(self, workspace_id: str) -> workspace.Workspace or workspace.WorkspaceSuccinct or None:
+        """ Find a workspace by its ID
+
+        Args:
+            workspace_id: ID of the workspace, e.g. T01ABCDEF
+        Returns:
+            Workspace object, or None if the workspace isn't in the Enterprise
+        """
+
+        return self._workspaces_by_id.get(workspace_id)
+
+
+def workspace_to_dict(workspace_object: workspace.Workspace or workspace.WorkspaceSuccinct) -> Dict[str, Any]:
+    """ Convert a workspace into a form that can be stored as JSON
+
+    Args:
+        workspace_object: Workspace object
+    Returns:
+        Fields of the workspace, and the class it is
+    """
+
+    return {'type': type(workspace_object).__name__, **dataclasses.asdict(workspace_object)}
+
+
+def workspace_from_dict(workspace_dict: Dict[str, Any]) -> workspace.Workspace or workspace.WorkspaceSuccinct:
+    """ Create a workspace from the output of workspace_to_dict()
+
+    Args:
+        workspace_dict: Fields of the workspace, and the class it is
+    Returns:
+        Workspace object
+    """
+
+    fields = dict(workspace_dict)
+    workspace_type = _WORKSPACE_TYPES.get(fields.pop('type', None))
+    if not workspace_type:
+        raise DirectoryError(f'Unknown workspace type {workspace_dict.get("type")}')
+    return workspace_type(**fields)
+
+
+def user_to_dict(user_object: user.User or user.UserSuccinct) -> Dict[str, Any]:
+    """ Convert a user into a form that can be stored as JSON
+
+    Args:
+        user_object: User object
+    Returns:
+        Fields of the user, and the class it is
+    """
+
+    fields = {field.name: getattr(user_object, field.name) for field in dataclasses.fields(user_object)}
+    if fields.get('workspaces'):
+        fields['workspaces'] = [workspace_to_dict(w) for w in fields.get('workspaces')]
+    return {'type': type(user_object).__name__, **fields}
+
+
+def user_from_dict(user_dict: Dict[str, Any]) -> user.User or user.UserSuccinct:
+    """ Create a user from the output of user_to_dict()
+
+    Args:
+        user_dict: Fields of the user, and the class it is
+    Returns:
+        User object
+    """
+
+    fields = dict(user_dict)
+    user_type = _USER_TYPES.get(fields.pop('type', None))
+    if not user_type:
+        raise DirectoryError(f'Unknown user type {user_dict.get("type")}')
+    if fields.get('workspaces'):
+        fields['workspaces'] = [workspace_from_dict(w) for w in fields.get('workspaces')]
+    return user_type(**fields)
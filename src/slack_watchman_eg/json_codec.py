@@ -0,0 +1,120 @@
+import dataclasses
+import json
+import re
+from typing import Any
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+BACKENDS = ['orjson', 'ujson', 'json']
+# Every backend writes compact JSON with non-ASCII characters and DEL escaped, so output is
+# the same whichever is installed. orjson can't escape them itself, so its output is escaped after
+SEPARATORS = (',', ':')
+_NON_ASCII = re.compile(r'[^\x00-\x7e]')
+
+
+class EnhancedJSONEncoder(json.JSONEncoder):
+    def default(self, o):
+        if dataclasses.is_dataclass(o):
+            return dataclasses.asdict(o)
+        return super().default(o)
+
+
+def _default(o: Any) -> Any:
+    """ Fallback serialiser for objects the JSON backend doesn't handle natively """
+
+    if dataclasses.is_dataclass(o):
+        return dataclasses.asdict(o)
+    raise TypeError(f'Object of type {o.__class__.__name__} is not JSON serializable')
+
+
+def _escape_non_ascii(match: re.Match) -> str:
+    """ Escape a character the way the json module does with ensure_ascii, as a surrogate
+    pair for characters outside the Basic Multilingual Plane """
+
+    code = ord(match.group(0))
+    if code > 0xffff:
+        code -= 0x10000
+        return f'\\u{0xd800 | (code >> 10):04x}\\u{0xdc00 | (code & 0x3ff):04x}'
+    return f'\\u{code:04x}'
+
+
+def _available(name: str) -> bool:
+    return (name == 'orjson' and orjson is not None) \
+        or (name == 'ujson' and ujson is not None) \
+        or name == 'json'
+
+
+def set_backend(name: str) -> None:
+    """ Select the library used to encode and decode JSON
+
+    Args:
+        name: One of 'orjson', 'ujson' or 'json'
+    """
+
+    global BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f'Unknown JSON backend: {name}')
+    if not _available(name):
+        raise ImportError(f'JSON backend {name} is not installed')
+    BACKEND = name
+
+
+def loads(data: bytes or str) -> Any:
+    """ Decode a JSON document
+
+    Args:
+        data: JSON document as bytes or a string
+    Returns:
+        Decoded Python object
+    """
+
+    if BACKEND == 'orjson':
+        return orjson.loads(data)
+    elif BACKEND == 'ujson':
+        return ujson.loads(data)
+    else:
+        return json.loads(data)
+
+
+def dumps(obj: Any, sort_keys: bool = False) -> str:
+    """ Encode an object as a JSON string. Dataclasses are encoded as dicts. The output is
+    compact and ASCII only, and the same whichever backend is used, apart from very large
+    and very small floats, which backends write with or without an exponent
+
+    Args:
+        obj: Object to encode
+        sort_keys: Whether to sort the keys of dicts in the output
+    Returns:
+        JSON encoded string
+    """
+
+    if BACKEND == 'orjson':
+        option = orjson.OPT_NON_STR_KEYS
+        if sort_keys:
+            # orjson doesn't sort the fields of dataclasses it encodes itself
+            option |= orjson.OPT_SORT_KEYS | orjson.OPT_PASSTHROUGH_DATACLASS
+        try:
+            encoded = orjson.dumps(obj, default=_default, option=option).decode('utf-8')
+        except orjson.JSONEncodeError:
+            # Values orjson rejects but the json module accepts, e.g. lone surrogates and
+            # integers over 64 bits
+            return json.dumps(obj, cls=EnhancedJSONEncoder, sort_keys=sort_keys, separators=SEPARATORS)
+        if encoded.isascii() and '\x7f' not in encoded:
+            return encoded
+        return _NON_ASCII.sub(_escape_non_ascii, encoded)
+    elif BACKEND == 'ujson':
+        return ujson.dumps(obj, default=_default, sort_keys=sort_keys, ensure_ascii=True,
+                           escape_forward_slashes=False)
+    else:
+        return json.dumps(obj, cls=EnhancedJSONEncoder, sort_keys=sort_keys, separators=SEPARATORS)
+
+
+BACKEND = next(name for name in BACKENDS if _available(name))
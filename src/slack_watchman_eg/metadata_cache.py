@@ -0,0 +1,102 @@
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any
+
+from . import json_codec
+
+# Metadata changes rarely, so cached lookups are reused across several scheduled runs
+DEFAULT_TTL = 6 * 3600
+SQLITE_TIMEOUT = 30
+
+
+class MetadataCache(object):
+    """ Persistent cache for Slack metadata lookups such as team.info and
+    discovery.conversations.info, stored in SQLite with a time to live on each entry.
+
+    The cache file can be shared by every worker process in a run, and by subsequent
+    runs. Each process and thread opens its own connection to the database."""
+
+    def __init__(self, path: str or Path, ttl: int = DEFAULT_TTL):
+        self.path = str(path)
+        self.ttl = ttl
+        self._local = threading.local()
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._connection().execute(
+            'CREATE TABLE IF NOT EXISTS metadata ('
+            'namespace TEXT NOT NULL, '
+            'key TEXT NOT NULL, '
+            'value TEXT NOT NULL, '
+            'expires REAL NOT NULL, '
+            'PRIMARY KEY (namespace, key))')
+
+    def __getstate__(self):
+        return {'path': self.path, 'ttl': self.ttl}
+
+    def __setstate__(self, state):
+        self.path = state.get('path')
+        self.ttl = state.get('ttl')
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        """ Get the SQLite connection for the current process and thread. Connections
+        inherited from a parent process are never reused
+
+        Returns:
+            SQLite connection
+        """
+
+        if getattr(self._local, 'pid', None) != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=SQLITE_TIMEOUT, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return self._local.connection
+
+    def get(self, namespace: str, key: str) -> Any:
+        """ Get an entry from the cache
+
+        Args:
+            namespace: Type of the entry, e.g. the API method it came from
+            key: Key of the entry within the namespace
+        Returns:
+            The cached value, or None if it isn't cached or has expired
+        """
+
+        row = self._connection().execute(
+            'SELECT value FROM metadata WHERE namespace = ? AND key = ? AND expires > ?',
+            (namespace, key, time.time())).fetchone()
+        if row:
+            return json_codec.loads(row[0])
+
+    def set(self, namespace: str, key: str, value: Any, ttl: int = None) -> None:
+        """ Add an entry to the cache
+
+        Args:
+            namespace: Type of the entry, e.g. the API method it came from
+            key: Key of the entry within the namespace
+            value: JSON serialisable value to cache
+            ttl: Seconds until the entry expires. Defaults to the TTL of the cache
+        """
+
+        expires = time.time() + (ttl if ttl is not None else self.ttl)
+        self._connection().execute(
+            'INSERT OR REPLACE INTO metadata (namespace, key, value, expires) VALUES (?, ?, ?, ?)',
+            (namespace, key, json_codec.dumps(value), expires))
+
+    def purge_expired(self) -> int:
+        """ Delete expired entries from the cache
+
+        Returns:
+            Number of entries deleted
+        """
+
+        return self._connection().execute('DELETE FROM metadata WHERE expires <= ?', (time.time(),)).rowcount
+
+    def clear(self) -> None:
+        """ Delete every entry from the cache """
+
+        self._connection().execute('DELETE FROM metadata')
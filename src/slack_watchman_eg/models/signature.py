@@ -1,7 +1,10 @@
 import pathlib
+import re
 import yaml
 from dataclasses import dataclass
-from typing import List
+from typing import List, FrozenSet, Tuple
+
+from .. import regex_set
 
 
 @dataclass(slots=True)
@@ -32,6 +35,47 @@ class Signature:
     patterns: List[str]
 
 
+@dataclass(slots=True)
+class CompiledSignature:
+    """ Signature prepared for matching: patterns compiled, together as a pattern set as well
+    as on their own, and search strings and file types lowercased once, rather than for
+    every post searched. The loaded Signature is kept for its other fields"""
+
+    name: str
+    severity: int
+    scope: List[str]
+    locations: FrozenSet[str]
+    file_types: Tuple[str, ...]
+    search_strings: Tuple[str, ...]
+    patterns: Tuple[re.Pattern, ...]
+    pattern_set: regex_set.PatternSet
+    signature: Signature
+
+
+def compile_signature(sig: Signature) -> CompiledSignature:
+    """ Prepare a loaded signature for matching
+
+    Args:
+        sig: Signature object loaded from YAML
+    Returns:
+        CompiledSignature object for the signature
+    """
+
+    patterns = tuple(re.compile(pattern) for pattern in sig.patterns or [])
+
+    return CompiledSignature(
+        name=sig.name,
+        severity=sig.severity,
+        scope=sig.scope or [],
+        locations=frozenset(sig.locations or []),
+        file_types=tuple(file_type.lower() for file_type in sig.file_types or []),
+        search_strings=tuple(str(search_string).lower() for search_string in sig.search_strings or []),
+        patterns=patterns,
+        pattern_set=regex_set.PatternSet(patterns),
+        signature=sig
+    )
+
+
 def load_from_yaml(sig_path: pathlib.PosixPath) -> List[Signature]:
     """Load YAML file and return a Signature object
     Args:
@@ -0,0 +1,128 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from typing import Any, Callable, Dict, List
+
+from . import sw_logger
+
+
+class PhaseError(Exception):
+    pass
+
+
+class Phase(object):
+    """ A step of a scan, run once the phases it depends on have finished """
+
+    def __init__(self,
+                 name: str,
+                 func: Callable,
+                 requires: List[str] = None,
+                 after: List[str] = None,
+                 forks: bool = False):
+        self.name = name
+        self.func = func
+        self.requires = requires or []
+        self.after = after or []
+        self.forks = forks
+
+    @property
+    def dependencies(self) -> List[str]:
+        return self.requires + self.after
+
+
+class PhaseExecutor(object):
+    """ Runs the phases of a scan concurrently, each starting as soon as the phases it
+    depends on have finished. Phases are run in threads, so phases waiting on the network
+    overlap with each other.
+
+    Phases that fork worker processes are the exception. Forking while other threads are
+    running can leave the child with locks that were held at the time, e.g. logging's, and
+    several sets of worker processes at once would compete for the same cores. These phases
+    are run one at a time on the thread calling run(), while no other phase is running.
+
+    A phase is passed the results of the phases it requires as keyword arguments. Phases
+    listed in after only have to finish first, their results aren't passed."""
+
+    def __init__(self, logger: sw_logger.JSONLogger or sw_logger.StdoutLogger = None):
+        self.logger = logger
+        self.phases = {}
+
+    def add(self,
+            name: str,
+            func: Callable,
+            requires: List[str] = None,
+            after: List[str] = None,
+            forks: bool = False) -> None:
+        """ Add a phase to be run
+
+        Args:
+            name: Name of the phase, also the keyword its result is passed to other phases as
+            func: Function to run for the phase
+            requires: Phases whose results are passed to the function
+            after: Phases that have to finish before this phase starts
+            forks: Whether the phase forks worker processes, so is run on its own
+        """
+
+        if name in self.phases:
+            raise PhaseError(f'Phase {name} has already been added')
+        self.phases[name] = Phase(name, func, requires, after, forks)
+
+    def _run_phase(self, phase: Phase, results: Dict[str, Any]) -> Any:
+        start = time.monotonic()
+        result = phase.func(**{name: results.get(name) for name in phase.requires})
+        if self.logger:
+            self.logger.log('DEBUG', f'Phase {phase.name} finished in {time.monotonic() - start:.2f} seconds')
+        return result
+
+    def run(self) -> Dict[str, Any]:
+        """ Run every phase, waiting for all of them to finish. If a phase raises an
+        exception, phases that haven't started yet are not run, and the exception is
+        raised once the running phases have finished
+
+        Returns:
+            Result of each phase, by phase name
+        """
+
+        for phase in self.phases.values():
+            for dependency in phase.dependencies:
+                if dependency not in self.phases:
+                    raise PhaseError(f'Phase {phase.name} depends on unknown phase {dependency}')
+
+        results = {}
+        waiting = dict(self.phases)
+        running: Dict[Future, Phase] = {}
+        error = None
+        with ThreadPoolExecutor(max_workers=max(len(self.phases), 1), thread_name_prefix='phase') as executor:
+            while waiting or running:
+                if not error:
+                    ready = [phase for phase in waiting.values()
+                             if all(dependency in results for dependency in phase.dependencies)]
+                    forking = [phase for phase in ready if phase.forks]
+                    if forking:
+                        # No more threads are started until the running phases have finished
+                        # and the forking phase has run
+                        if not running:
+                            phase = waiting.pop(forking[0].name)
+                            try:
+                                results[phase.name] = self._run_phase(phase, results)
+                            except Exception as e:
+                                error = e
+                            continue
+                    else:
+                        for phase in ready:
+                            running[executor.submit(self._run_phase, phase, results)] = waiting.pop(phase.name)
+                if not running:
+                    if error:
+                        break
+                    raise PhaseError(f'Phases have circular dependencies: {", ".join(waiting)}')
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    phase = running.pop(future)
+                    try:
+                        results[phase.name] = future.result()
+                    except Exception as e:
+                        error = error or e
+
+        if error:
+            raise error
+        return results
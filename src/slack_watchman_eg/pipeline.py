@@ -0,0 +1,246 @@
+import multiprocessing
+import queue
+import threading
+from typing import List, Dict, Callable
+
+from . import slack_wrapper
+from . import sw_logger
+from . import json_codec
+from . import checkpoint
+from . import scan_journal
+from . import scheduler
+from . import directory
+from . import worker_pool
+from . import prefilter
+from .models import signature
+
+# Maximum number of message batches waiting to be searched. Fetching pauses when the queue
+# is full, so memory use stays flat however many messages are in the timeframe
+DEFAULT_QUEUE_SIZE = 64
+BATCH_SIZE = 500
+
+
+class PipelineError(Exception):
+    pass
+
+
+def _mp_fetch_worker(tasks: multiprocessing.Queue,
+                     slack_connection: slack_wrapper.SlackAPI,
+                     timeframe: int,
+                     batches: multiprocessing.Queue,
+                     matches: multiprocessing.Queue,
+                     checkpoints: checkpoint.CheckpointStore = None,
+                     journal: scan_journal.ScanJournal = None,
+                     edits: bool = False):
+    """ MULTIPROCESSING WORKER - Takes lists of conversations from the task queue until it
+    receives None, putting the recent messages for them on the batch queue
+
+    Args:
+        tasks: Queue to take lists of output from discovery.conversations.recent endpoint from
+        slack_connection: Slack API object
+        timeframe: Furthest back time to get messages from
+        batches: Queue to put batches of messages on
+        matches: Queue of the matchers' results. A PipelineError is put on it if fetching fails
+        checkpoints: Store of high-water marks for each conversation
+        journal: Journal to record completed conversations in, and reuse their messages from
+        edits: Whether to also get older messages edited during the timeframe
+    """
+
+    try:
+        batch = []
+        for conv_list in iter(tasks.get, None):
+            for conv in conv_list:
+                batch.extend(slack_wrapper.get_conversation_messages(slack_connection, conv, timeframe, checkpoints,
+                                                                     journal))
+                if edits:
+                    batch.extend(slack_wrapper.get_conversation_edited_messages(slack_connection, conv, timeframe,
+                                                                                checkpoints, journal))
+                if len(batch) >= BATCH_SIZE:
+                    batches.put(batch)
+                    batch = []
+        if batch:
+            batches.put(batch)
+    except Exception as e:
+        matches.put(PipelineError(f'Fetching messages failed: {e}'))
+    finally:
+        if slack_connection.metrics:
+            slack_connection.metrics.flush()
+
+
+def _mp_match_worker(signature_list: List[signature.CompiledSignature],
+                     slack_connection: slack_wrapper.SlackAPI,
+                     enterprise_directory: directory.EnterpriseDirectory,
+                     batches: multiprocessing.Queue,
+                     matches: multiprocessing.Queue,
+                     verbose: bool,
+                     matcher: prefilter.SearchStringMatcher = None):
+    """ MULTIPROCESSING WORKER - Takes batches of messages from the queue and searches them
+    with every signature, until it receives None
+
+    Args:
+        signature_list: Signatures with the messages scope
+        slack_connection: Slack API object
+        enterprise_directory: Users and workspaces in the Enterprise
+        batches: Queue to take batches of messages from
+        matches: Queue to put lists of (signature index, match) on. An exception is put on the
+            queue if a batch fails, and the number of messages searched when finished
+        verbose: Whether to use verbose logging or not
+        matcher: Search string matcher built from the signatures
+    """
+
+    searched = 0
+    try:
+        for batch in iter(batches.get, None):
+            searched += len(batch)
+            try:
+                found = slack_wrapper.match_messages(signature_list, slack_connection, enterprise_directory, batch,
+                                                     verbose, matcher)
+                if found:
+                    matches.put(found)
+            except Exception as e:
+                matches.put(e)
+    finally:
+        matches.put(searched)
+        if slack_connection.metrics:
+            slack_connection.metrics.flush()
+
+
+def stream_message_matches(slack_connection: slack_wrapper.SlackAPI,
+                           signature_list: List[signature.CompiledSignature],
+                           enterprise_directory: directory.EnterpriseDirectory,
+                           cores: int,
+                           on_match: Callable[[signature.CompiledSignature, Dict], None],
+                           logger: sw_logger.JSONLogger,
+                           verbose: bool,
+                           timeframe: int = slack_wrapper.DEFAULT_TIMEFRAME,
+                           checkpoints: checkpoint.CheckpointStore = None,
+                           journal: scan_journal.ScanJournal = None,
+                           queue_size: int = DEFAULT_QUEUE_SIZE,
+                           edits: bool = False) -> int:
+    """ Get all messages in the Enterprise for a given timeframe and search them with
+    every signature as they arrive. Fetcher processes put batches of messages on a
+    bounded queue, and matcher processes search them while fetching continues. Matches
+    are passed to on_match as soon as they are found. If fetching fails, PipelineError
+    is raised once the messages that were fetched have been searched.
+
+    Args:
+        slack_connection: Slack API object
+        signature_list: Signatures to search messages with. Only signatures with the
+            messages scope are used
+        enterprise_directory: Users and workspaces in the Enterprise
+        cores: Number of fetcher processes, and of matcher processes, to use
+        on_match: Called with the signature and each match found
+        logger: Logging object
+        verbose: Whether to use verbose logging or not
+        timeframe: Furthest back time to get messages from
+        checkpoints: Store of high-water marks. If given, only messages newer than the
+            last scanned message in each conversation are searched
+        journal: Journal to record completed conversations in, and resume from
+        queue_size: Maximum number of batches of messages waiting to be searched
+        edits: Whether to also search messages posted before the timeframe but edited during it
+    Returns:
+        Number of messages searched
+    """
+
+    signature_list = [sig for sig in signature_list if 'messages' in sig.scope]
+    matcher = prefilter.SearchStringMatcher(signature_list, 'messages')
+    batches = multiprocessing.Queue(maxsize=queue_size)
+    matches = multiprocessing.Queue()
+
+    matchers = []
+    with worker_pool.frozen_heap():
+        for _ in range(cores):
+            p = multiprocessing.Process(
+                target=_mp_match_worker,
+                args=(
+                    signature_list,
+                    slack_connection,
+                    enterprise_directory,
+                    batches,
+                    matches,
+                    verbose,
+                    matcher
+                )
+            )
+            matchers.append(p)
+            p.start()
+
+    updated_conversations = slack_connection.get_recent_conversations(latest=timeframe)
+    tasks = multiprocessing.Queue()
+    for conv_list in scheduler.make_tasks(
+            updated_conversations, cores,
+            weight=lambda conv: slack_wrapper.estimate_conversation_size(slack_connection, conv)):
+        tasks.put(conv_list)
+    fetchers = []
+    for _ in range(cores):
+        tasks.put(None)
+        p = multiprocessing.Process(
+            target=_mp_fetch_worker,
+            args=(
+                tasks,
+                slack_connection,
+                timeframe,
+                batches,
+                matches,
+                checkpoints,
+                journal,
+                edits
+            )
+        )
+        fetchers.append(p)
+        p.start()
+
+    def stop_matchers():
+        for fetcher in fetchers:
+            fetcher.join()
+            # Fetchers report their own errors, so this is a fetcher that was killed
+            if fetcher.exitcode:
+                matches.put(PipelineError(f'Message fetcher process exited with code {fetcher.exitcode}'))
+        for _ in matchers:
+            batches.put(None)
+
+    stopper = threading.Thread(target=stop_matchers, name='stream-stopper', daemon=True)
+    stopper.start()
+
+    searched = 0
+    finished = 0
+    fetch_errors = []
+    seen = set()
+    counts = [0] * len(signature_list)
+    while finished < len(matchers):
+        try:
+            item = matches.get(timeout=1)
+        except queue.Empty:
+            if not any(process.is_alive() for process in matchers):
+                logger.log('CRITICAL', 'Message matcher processes exited before finishing')
+                for fetcher in fetchers:
+                    fetcher.terminate()
+                break
+            continue
+        if isinstance(item, PipelineError):
+            logger.log('CRITICAL', item)
+            fetch_errors.append(item)
+        elif isinstance(item, Exception):
+            logger.log('CRITICAL', item)
+        elif isinstance(item, int):
+            searched += item
+            finished += 1
+        else:
+            for index, result in item:
+                key = (index, json_codec.dumps(result, sort_keys=True))
+                if key not in seen:
+                    seen.add(key)
+                    counts[index] += 1
+                    on_match(signature_list[index], result)
+
+    if finished == len(matchers):
+        stopper.join()
+    for process in matchers:
+        process.join()
+    for sig, count in zip(signature_list, counts):
+        logger.log('INFO', f'{count} total matches found for {sig.name}')
+    if fetch_errors:
+        raise PipelineError(f'{len(fetch_errors)} message fetcher processes failed, messages in some conversations '
+                            f'were not searched')
+
+    return searched
@@ -0,0 +1,106 @@
+import collections
+from typing import Dict, FrozenSet, List, Set
+
+from .models import signature
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+
+class SearchStringMatcher(object):
+    """ Finds which signatures have a search string in a text, in a single pass over the
+    text however many signatures and search strings there are.
+
+    An Aho-Corasick automaton is built over the search strings of every signature with
+    the scope. Each search string leads to the signatures it belongs to, so scanning a
+    text once gives every signature that is a candidate for having its patterns searched.
+    The automaton from pyahocorasick is used when it is installed, otherwise one built
+    here in Python."""
+
+    def __init__(self, signature_list: List[signature.CompiledSignature], scope: str):
+        keywords: Dict[str, Set[int]] = {}
+        for index, sig in enumerate(signature_list):
+            if scope in sig.scope:
+                for search_string in sig.search_strings:
+                    keywords.setdefault(search_string, set()).add(index)
+
+        # An empty search string is in every text
+        self._always = frozenset(keywords.pop('', ()))
+        self._automaton = None
+        if keywords:
+            if ahocorasick is not None:
+                self._automaton = ahocorasick.Automaton()
+                for keyword, indexes in keywords.items():
+                    self._automaton.add_word(keyword, frozenset(indexes))
+                self._automaton.make_automaton()
+            else:
+                self._automaton = _Automaton(keywords)
+
+    def candidates(self, *texts: str) -> Set[int]:
+        """ Find the signatures with a search string in any of the texts, ignoring case
+
+        Args:
+            texts: Text to search, e.g. a message
+        Returns:
+            Indexes of the signatures in the signature list the matcher was built from
+        """
+
+        found = set(self._always)
+        if self._automaton is not None:
+            for text in texts:
+                for _, indexes in self._automaton.iter(text.lower()):
+                    found.update(indexes)
+
+        return found
+
+
+class _Automaton(object):
+    """ Aho-Corasick automaton, used when pyahocorasick isn't installed. Like pyahocorasick,
+    iter() yields the values of the search strings found in a text, though each set of values
+    is only yielded once per text """
+
+    def __init__(self, keywords: Dict[str, Set[int]]):
+        goto: List[Dict[str, int]] = [{}]
+        output: List[Set[int]] = [set()]
+        for keyword, indexes in keywords.items():
+            state = 0
+            for char in keyword:
+                if char not in goto[state]:
+                    goto[state][char] = len(goto)
+                    goto.append({})
+                    output.append(set())
+                state = goto[state][char]
+            output[state].update(indexes)
+
+        # Breadth first, so the failure state of each state is set before its own children's
+        fail = [0] * len(goto)
+        queue = collections.deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in goto[state].items():
+                queue.append(child)
+                failure = fail[state]
+                while failure and char not in goto[failure]:
+                    failure = fail[failure]
+                fail[child] = goto[failure].get(char, 0)
+                output[child].update(output[fail[child]])
+
+        self._goto = goto
+        self._fail = fail
+        self._output: List[FrozenSet[int]] = [frozenset(indexes) if indexes else None for indexes in output]
+
+    def iter(self, text: str):
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+        state = 0
+        seen = set()
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state] is not None and state not in seen:
+                seen.add(state)
+                yield state, output[state]
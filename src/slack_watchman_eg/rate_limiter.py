@@ -0,0 +1,148 @@
+import multiprocessing
+import time
+from typing import Dict
+
+# Requests per minute allowed for each Slack Web API rate limit tier
+TIER_LIMITS = {
+    1: 1,
+    2: 20,
+    3: 50,
+    4: 100
+}
+
+# Rate limit tier of each API method used. Methods not listed use DEFAULT_TIER
+METHOD_TIERS = {
+    'discovery.enterprise.info': 2,
+    'discovery.users.list': 3,
+    'discovery.user.info': 4,
+    'discovery.user.conversations': 3,
+    'discovery.conversations.list': 3,
+    'discovery.conversations.recent': 3,
+    'discovery.conversations.history': 4,
+    'discovery.conversations.edits': 4,
+    'discovery.conversations.info': 4,
+    'discovery.conversations.members': 4,
+    'discovery.conversations.renames': 3,
+    'discovery.conversations.search': 3,
+    'discovery.chat.info': 4,
+    'discovery.drafts.list': 3,
+    'discovery.draft.info': 4,
+    'discovery.files.list': 3,
+    'discovery.file.info': 4,
+    'team.info': 3
+}
+DEFAULT_TIER = 3
+# Number of seconds worth of requests a bucket can hold, allowing short bursts
+DEFAULT_BURST_SECONDS = 10
+# Wait used when a rate limited response doesn't include a Retry-After header
+DEFAULT_RETRY_AFTER = 30
+
+
+class RateLimiter(object):
+    """ Token bucket rate limiter with one bucket per Slack API method. Each bucket is
+    paused when the API responds with a Retry-After header.
+
+    The documented tier limits are often lower than what the API allows in practice, so
+    by default a method isn't held to its tier until the API has rate limited it. From
+    then on, its bucket refills at the rate allowed by the method's tier. With enforce,
+    every method is held to its tier from the start.
+
+    Bucket state is held in shared memory, so a single RateLimiter created before worker
+    processes are started is shared by every worker, and by every thread within them.
+
+    The multiplier scales every tier limit, for tenants with raised limits or when running
+    against a local test server."""
+
+    def __init__(self,
+                 method_tiers: Dict[str, int] = None,
+                 tier_limits: Dict[int, int] = None,
+                 burst_seconds: int = DEFAULT_BURST_SECONDS,
+                 multiplier: float = 1.0,
+                 enforce: bool = False):
+        method_tiers = method_tiers if method_tiers is not None else METHOD_TIERS
+        tier_limits = tier_limits if tier_limits is not None else TIER_LIMITS
+
+        self._slots = {method: i for i, method in enumerate(method_tiers)}
+        self._default_slot = len(self._slots)
+        tiers = [method_tiers[method] for method in self._slots] + [DEFAULT_TIER]
+
+        self._rates = [tier_limits[tier] * multiplier / 60 for tier in tiers]
+        self._capacities = [max(1.0, rate * burst_seconds) for rate in self._rates]
+        self._tokens = multiprocessing.RawArray('d', self._capacities)
+        self._updated = multiprocessing.RawArray('d', [time.monotonic()] * len(tiers))
+        self._blocked_until = multiprocessing.RawArray('d', len(tiers))
+        # Whether each method is held to its tier, set once the API has rate limited it
+        self._enforced = multiprocessing.RawArray('b', [int(enforce)] * len(tiers))
+        self._lock = multiprocessing.Lock()
+
+    def _slot(self, method: str) -> int:
+        return self._slots.get(method, self._default_slot)
+
+    def _refill(self, slot: int, now: float):
+        elapsed = now - self._updated[slot]
+        if elapsed > 0:
+            self._tokens[slot] = min(self._capacities[slot], self._tokens[slot] + elapsed * self._rates[slot])
+            self._updated[slot] = now
+
+    def acquire(self, method: str) -> float:
+        """ Take a token from the bucket for the given method, waiting only as long
+        as needed for one to become available. Methods not yet held to their tier only
+        wait while paused by a Retry-After
+
+        Args:
+            method: Slack API method being called, e.g. discovery.conversations.history
+        Returns:
+            Number of seconds spent waiting
+        """
+
+        slot = self._slot(method)
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(slot, now)
+                if self._blocked_until[slot] > now:
+                    wait = self._blocked_until[slot] - now
+                elif not self._enforced[slot]:
+                    return waited
+                elif self._tokens[slot] >= 1:
+                    self._tokens[slot] -= 1
+                    return waited
+                else:
+                    wait = (1 - self._tokens[slot]) / self._rates[slot]
+            time.sleep(wait)
+            waited += wait
+
+    def penalise(self, method: str, retry_after: float = DEFAULT_RETRY_AFTER):
+        """ Pause the bucket for a method after the API has rate limited it. All callers
+        of the method wait until the Retry-After period has passed, and from then on the
+        method is held to its tier
+
+        Args:
+            method: Slack API method that was rate limited
+            retry_after: Number of seconds the API asked to wait for
+        """
+
+        slot = self._slot(method)
+        with self._lock:
+            blocked_until = max(self._blocked_until[slot], time.monotonic() + retry_after)
+            self._blocked_until[slot] = blocked_until
+            self._enforced[slot] = 1
+            # One request may go as soon as the pause ends, then the bucket refills from there
+            self._tokens[slot] = 1
+            self._updated[slot] = blocked_until
+
+
+def parse_retry_after(value: str or None) -> float:
+    """ Parse the value of a Retry-After header
+
+    Args:
+        value: Header value in seconds
+    Returns:
+        Number of seconds to wait
+    """
+
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return DEFAULT_RETRY_AFTER
@@ -0,0 +1,99 @@
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Sequence, Tuple
+
+try:
+    import re2
+except ImportError:
+    re2 = None
+
+# Python and RE2 read these differently, e.g. RE2 takes {,n} literally, $ only matches at the
+# very end and [:alpha:] is a class, so patterns using them are always searched by Python
+_UNPORTABLE_PATTERN = re.compile(r'\$|\[:[a-z]+:]|\{,')
+# RE2 only treats ASCII letters and digits as \w and \d, and fewer characters as \s, so it
+# could miss matches Python would find in text with any other characters
+_UNPORTABLE_TEXT = re.compile(r'[\x0b\x1c-\x1f]')
+
+
+@dataclass(slots=True)
+class PatternMatch:
+    """ First match of one of the patterns in a pattern set """
+
+    pattern: int
+    match_string: str
+    # Start and end of the match in the text it was found in
+    span: Tuple[int, int]
+
+
+class PatternSet(object):
+    """ The patterns of a signature, searched for together.
+
+    When google-re2 is installed, the patterns are also compiled into an RE2 set, which
+    scans a text once to find which of them match, however many there are. Only the
+    patterns that match are then searched by Python, for the match itself. A
+    text with no matches, as most are, takes one scan. Patterns that RE2 can't compile,
+    or would read differently to Python, are always searched by Python.
+
+    Without google-re2, or for text RE2 can't be trusted with, such as any text with
+    characters outside ASCII, each pattern is searched by Python in turn. Joining the
+    patterns into one Python alternation doesn't help here: the alternation loses the
+    literal prefix each pattern is scanned for on its own, and is slower for the few
+    patterns a signature has."""
+
+    def __init__(self, patterns: Sequence[re.Pattern]):
+        self.patterns = tuple(patterns)
+        self._set = None
+        self._set_patterns: Dict[int, int] = {}
+        if re2 is not None:
+            self._compile_set()
+        self._separate = [index for index in range(len(self.patterns)) if index not in self._set_patterns.values()]
+
+    def __getstate__(self):
+        return {'patterns': self.patterns}
+
+    def __setstate__(self, state):
+        self.__init__(state.get('patterns'))
+
+    def _compile_set(self) -> None:
+        options = re2.Options()
+        options.log_errors = False
+        regex_set = re2.Set.SearchSet(options)
+        set_patterns = {}
+        for index, pattern in enumerate(self.patterns):
+            if isinstance(pattern.pattern, str) and not _UNPORTABLE_PATTERN.search(pattern.pattern):
+                try:
+                    set_patterns[regex_set.Add(pattern.pattern)] = index
+                except re2.error:
+                    continue
+        if set_patterns:
+            try:
+                regex_set.Compile()
+            except re2.error:
+                return
+            self._set = regex_set
+            self._set_patterns = set_patterns
+
+    def search(self, *texts: str) -> List[PatternMatch]:
+        """ Find the first match of each pattern, looking through the texts in order
+
+        Args:
+            texts: Text to search, e.g. a message
+        Returns:
+            First match of each pattern that matches, in the order of the patterns
+        """
+
+        found: Dict[int, PatternMatch] = {}
+        for text in texts:
+            if len(found) == len(self.patterns):
+                break
+            if self._set is not None and text.isascii() and not _UNPORTABLE_TEXT.search(text):
+                candidates = self._separate + [self._set_patterns.get(index) for index in self._set.Match(text) or ()]
+            else:
+                candidates = range(len(self.patterns))
+            for index in candidates:
+                if index not in found:
+                    match = self.patterns[index].search(text)
+                    if match:
+                        found[index] = PatternMatch(index, match.group(0), match.span())
+
+        return [found[index] for index in sorted(found)]
@@ -0,0 +1,294 @@
+import dataclasses
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List
+
+from . import json_codec
+from .models import (
+    conversation,
+    post
+)
+
+CONVERSATION = 'conversation'
+CONVERSATION_EDITS = 'conversation_edits'
+FILE = 'file'
+WORKSPACE_DRAFTS = 'workspace_drafts'
+SQLITE_TIMEOUT = 30
+
+_CONVERSATION_TYPES = {cls.__name__: cls for cls in (conversation.Conversation, conversation.ConversationSuccinct)}
+_DRAFT_TYPES = {cls.__name__: cls for cls in (post.Draft, post.DraftSuccinct)}
+# Fields of a conversation holding objects of their own
+_CONVERSATION_FIELDS = {
+    'purpose': conversation.Purpose,
+    'topic': conversation.Topic,
+    'retention': conversation.Retention
+}
+
+
+class JournalError(Exception):
+    pass
+
+
+def finding_key(scope: str, detect_type: str, finding: Any) -> str:
+    """ Build a stable key identifying a finding, for recording which findings have been
+    output
+
+    Args:
+        scope: Scope of the finding, e.g. messages
+        detect_type: Name of the signature that matched
+        finding: The finding
+    Returns:
+        Hex digest identifying the finding
+    """
+
+    return hashlib.sha1('\n'.join(
+        (scope, detect_type, json_codec.dumps(finding, sort_keys=True))).encode('utf-8')).hexdigest()
+
+
+def _conversation_to_dict(conversation_object: conversation.Conversation or conversation.ConversationSuccinct) \
+        -> Dict[str, Any]:
+    return {'type': type(conversation_object).__name__, **dataclasses.asdict(conversation_object)}
+
+
+def _conversation_from_dict(conversation_dict: Dict[str, Any]) \
+        -> conversation.Conversation or conversation.ConversationSuccinct:
+    fields = dict(conversation_dict)
+    conversation_type = _CONVERSATION_TYPES.get(fields.pop('type', None))
+    if not conversation_type:
+        raise JournalError(f'Unknown conversation type {conversation_dict.get("type")}')
+    for name, field_type in _CONVERSATION_FIELDS.items():
+        if fields.get(name) is not None:
+            fields[name] = field_type(**fields.get(name))
+    return conversation_type(**fields)
+
+
+def _file_to_dict(file_object: post.File) -> Dict[str, Any]:
+    fields = {field.name: getattr(file_object, field.name) for field in dataclasses.fields(file_object)}
+    if fields.get('shares'):
+        fields['shares'] = [_conversation_to_dict(c) for c in fields.get('shares')]
+    return fields
+
+
+def _file_from_dict(file_dict: Dict[str, Any]) -> post.File:
+    fields = dict(file_dict)
+    if fields.get('shares'):
+        fields['shares'] = [_conversation_from_dict(c) for c in fields.get('shares')]
+    return post.File(**fields)
+
+
+def _draft_to_dict(draft_object: post.Draft or post.DraftSuccinct) -> Dict[str, Any]:
+    return {'type': type(draft_object).__name__, **dataclasses.asdict(draft_object)}
+
+
+def _draft_from_dict(draft_dict: Dict[str, Any]) -> post.Draft or post.DraftSuccinct:
+    fields = dict(draft_dict)
+    draft_type = _DRAFT_TYPES.get(fields.pop('type', None))
+    if not draft_type:
+        raise JournalError(f'Unknown draft type {draft_dict.get("type")}')
+    return draft_type(**fields)
+
+
+def _encode_output(kind: str, output: List) -> str:
+    """ Encode the output of a completed item as JSON. Messages are stored as they are,
+    while File and Draft objects are converted to dicts, recording the class of each
+    object that has more than one
+
+    Args:
+        kind: Type of the item, e.g. conversation
+        output: List of what enumerating the item produced
+    Returns:
+        JSON encoded output
+    """
+
+    if kind == FILE:
+        output = [_file_to_dict(f) for f in output]
+    elif kind == WORKSPACE_DRAFTS:
+        output = [_draft_to_dict(d) for d in output]
+    return json_codec.dumps(output)
+
+
+def _decode_output(kind: str, encoded: str) -> List:
+    """ Decode the output of a completed item from the output of _encode_output()
+
+    Args:
+        kind: Type of the item, e.g. conversation
+        encoded: JSON encoded output
+    Returns:
+        List of what enumerating the item produced
+    """
+
+    output = json_codec.loads(encoded)
+    if kind == FILE:
+        return [_file_from_dict(f) for f in output]
+    elif kind == WORKSPACE_DRAFTS:
+        return [_draft_from_dict(d) for d in output]
+    return output
+
+
+class ScanJournal(object):
+    """ Crash-safe journal of the progress of a scan. Each conversation, file and workspace
+    is recorded with its output once it has been fully enumerated, along with every finding
+    output. A scan resumed from the journal reuses the recorded output instead of making
+    the API calls again, and doesn't output the same finding twice.
+
+    The journal is stored in SQLite and can be shared by every worker process in a run.
+    Each process and thread opens its own connection to the database. Output is stored as
+    JSON, so loading a journal never runs code from it."""
+
+    def __init__(self, path: str or Path):
+        self.path = str(path)
+        self.scan_id = None
+        self.timeframe = None
+        self._local = threading.local()
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        connection = self._connection()
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS scans ('
+            'id TEXT PRIMARY KEY, '
+            'timeframe INTEGER NOT NULL, '
+            'started REAL NOT NULL)')
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS completed ('
+            'scan TEXT NOT NULL, '
+            'kind TEXT NOT NULL, '
+            'key TEXT NOT NULL, '
+            'output TEXT NOT NULL, '
+            'PRIMARY KEY (scan, kind, key))')
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS findings ('
+            'scan TEXT NOT NULL, '
+            'key TEXT NOT NULL, '
+            'PRIMARY KEY (scan, key))')
+
+    def __getstate__(self):
+        return {'path': self.path, 'scan_id': self.scan_id, 'timeframe': self.timeframe}
+
+    def __setstate__(self, state):
+        self.path = state.get('path')
+        self.scan_id = state.get('scan_id')
+        self.timeframe = state.get('timeframe')
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        """ Get the SQLite connection for the current process and thread. Connections
+        inherited from a parent process are never reused
+
+        Returns:
+            SQLite connection
+        """
+
+        if getattr(self._local, 'pid', None) != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=SQLITE_TIMEOUT, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return self._local.connection
+
+    def _delete_scan(self, scan_id: str) -> None:
+        connection = self._connection()
+        connection.execute('DELETE FROM completed WHERE scan = ?', (scan_id,))
+        connection.execute('DELETE FROM findings WHERE scan = ?', (scan_id,))
+        connection.execute('DELETE FROM scans WHERE id = ?', (scan_id,))
+
+    def start(self, timeframe: int) -> None:
+        """ Start a new scan. Progress of any unfinished scan is discarded
+
+        Args:
+            timeframe: Furthest back time the scan gets messages from
+        """
+
+        for row in self._connection().execute('SELECT id FROM scans').fetchall():
+            self._delete_scan(row[0])
+        self.scan_id = uuid.uuid4().hex
+        self.timeframe = timeframe
+        self._connection().execute('INSERT INTO scans (id, timeframe, started) VALUES (?, ?, ?)',
+                                   (self.scan_id, timeframe, time.time()))
+
+    def resume(self) -> None:
+        """ Resume the unfinished scan. The timeframe of the original scan is used, so the
+        resumed scan covers the same period """
+
+        row = self._connection().execute(
+            'SELECT id, timeframe FROM scans ORDER BY started DESC LIMIT 1').fetchone()
+        if not row:
+            raise JournalError(f'No unfinished scan to resume in {self.path}')
+        self.scan_id, self.timeframe = row
+
+    def count_completed(self) -> int:
+        """ Get the number of items completed so far in the scan
+
+        Returns:
+            Number of conversations, files and workspaces completed
+        """
+
+        return self._connection().execute(
+            'SELECT COUNT(*) FROM completed WHERE scan = ?', (self.scan_id,)).fetchone()[0]
+
+    def get_completed(self, kind: str, key: str) -> List or None:
+        """ Get the recorded output of an item completed earlier in the scan
+
+        Args:
+            kind: Type of the item, e.g. conversation
+            key: ID of the item
+        Returns:
+            Output recorded for the item, or None if the item hasn't been completed
+        """
+
+        row = self._connection().execute(
+            'SELECT output FROM completed WHERE scan = ? AND kind = ? AND key = ?',
+            (self.scan_id, kind, key)).fetchone()
+        if row:
+            return _decode_output(kind, row[0])
+
+    def complete(self, kind: str, key: str, output: List) -> None:
+        """ Record an item as completed, with its output
+
+        Args:
+            kind: Type of the item, e.g. conversation
+            key: ID of the item
+            output: List of what enumerating the item produced, e.g. its messages
+        """
+
+        self._connection().execute(
+            'INSERT OR REPLACE INTO completed (scan, kind, key, output) VALUES (?, ?, ?, ?)',
+            (self.scan_id, kind, key, _encode_output(kind, output)))
+
+    def has_finding(self, scope: str, detect_type: str, finding: Any) -> bool:
+        """ Check whether a finding was already output earlier in the scan
+
+        Args:
+            scope: Scope of the finding, e.g. messages
+            detect_type: Name of the signature that matched
+            finding: The finding
+        Returns:
+            True if the finding has been output
+        """
+
+        return self._connection().execute(
+            'SELECT 1 FROM findings WHERE scan = ? AND key = ?',
+            (self.scan_id, finding_key(scope, detect_type, finding))).fetchone() is not None
+
+    def record_finding(self, scope: str, detect_type: str, finding: Any) -> None:
+        """ Record a finding as output. Findings should be recorded after they are output,
+        so a failure in between outputs the finding again rather than losing it
+
+        Args:
+            scope: Scope of the finding, e.g. messages
+            detect_type: Name of the signature that matched
+            finding: The finding
+        """
+
+        self._connection().execute(
+            'INSERT OR IGNORE INTO findings (scan, key) VALUES (?, ?)',
+            (self.scan_id, finding_key(scope, detect_type, finding)))
+
+    def finish(self) -> None:
+        """ Mark the scan as finished, deleting its progress """
+
+        self._delete_scan(self.scan_id)
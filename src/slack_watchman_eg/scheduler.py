@@ -0,0 +1,45 @@
+import heapq
+from typing import Any, Callable, List, Sequence
+
+# Number of tasks to create for each worker process. Workers pull tasks as they become
+# idle, so more, smaller tasks stop one large task holding up the end of a run
+TASKS_PER_PROCESS = 8
+
+
+def make_tasks(items: Sequence,
+               processes: int,
+               weight: Callable[[Any], float] = None,
+               tasks_per_process: int = TASKS_PER_PROCESS) -> List[List]:
+    """ Split work into small tasks for worker processes to pull from a shared queue.
+
+    Items are balanced across tasks by their weight, e.g. the estimated size of a
+    conversation, heaviest first. An item heavier than the average task gets a task to
+    itself. Tasks are returned heaviest first, so the longest running tasks start first
+    and lighter ones fill in around them.
+
+    Args:
+        items: Work to split, e.g. conversations
+        processes: Number of worker processes that will run the tasks
+        weight: Function giving the estimated cost of an item. All items cost the same if not given
+        tasks_per_process: Number of tasks to create for each worker process
+    Returns:
+        List of tasks, each a list of items
+    """
+
+    if not len(items):
+        return []
+
+    count = min(len(items), max(processes, 1) * tasks_per_process)
+    weighted = [(weight(item) if weight else 1, position) for position, item in enumerate(items)]
+    weighted.sort(key=lambda w: w[0], reverse=True)
+
+    tasks = [[] for _ in range(count)]
+    totals = [0] * count
+    heap = [(0, index) for index in range(count)]
+    for item_weight, position in weighted:
+        total, index = heapq.heappop(heap)
+        tasks[index].append(items[position])
+        totals[index] = total + item_weight
+        heapq.heappush(heap, (totals[index], index))
+
+    return [task for _, task in sorted(zip(totals, tasks), key=lambda t: t[0], reverse=True)]
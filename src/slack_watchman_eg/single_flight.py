@@ -0,0 +1,70 @@
+import copy
+import os
+import threading
+from typing import Any, Callable, Hashable
+
+
+class _Call(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """ Coalesces concurrent identical calls. The first caller for a key runs the
+    function, and any callers arriving with the same key while it is in flight wait for,
+    and share, its result instead of making the call again.
+
+    Waiting callers receive a deep copy of the result, so callers can modify what they
+    get back without affecting each other. State is reset in forked child processes."""
+
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def __getstate__(self):
+        return {}
+
+    def __setstate__(self, state):
+        self._reset()
+
+    def do(self, key: Hashable, func: Callable, *args, **kwargs) -> Any:
+        """ Call a function, or wait for an in-flight call with the same key to finish
+
+        Args:
+            key: Key identifying identical calls
+            func: Function to call
+        Returns:
+            Result of the function
+        """
+
+        if self._pid != os.getpid():
+            self._reset()
+
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error:
+                raise call.error
+            return copy.deepcopy(call.result)
+
+        try:
+            call.result = func(*args, **kwargs)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
@@ -1,16 +1,25 @@
-import dataclasses
-import json
-import multiprocessing
-import numpy
-import re
+import os
 import requests
 import time
 import calendar
 from urllib3.util import Retry
 from requests.adapters import HTTPAdapter
-from typing import List, Dict
+from typing import List, Dict, Iterator, Iterable, Tuple
 
 from . import sw_logger
+from . import rate_limiter
+from . import json_codec
+from . import metadata_cache
+from . import single_flight
+from . import adaptive_concurrency
+from . import api_metrics
+from . import checkpoint
+from . import scan_journal
+from . import worker_pool
+from . import scheduler
+from . import directory
+from . import prefilter
+from . import text_extraction
 from .models import (
     signature,
     user,
@@ -23,6 +32,12 @@ from .models import (
 # Default timeframe of 1 hour
 DEFAULT_TIMEFRAME = calendar.timegm(time.gmtime()) - 3600
 DEFAULT_TIMEOUT = 5
+DEFAULT_BASE_URL = 'https://slack.com/api'
+DEFAULT_POOL_SIZE = 10
+MAX_RATE_LIMIT_RETRIES = 5
+# Metadata cache namespace holding the number of messages each conversation had when last
+# scanned, used to estimate how long fetching it will take
+CONVERSATION_SIZE = 'conversation_size'
 
 
 class ScopeError(Exception):
@@ -35,14 +50,29 @@ class SlackAPIError(Exception):
 
 class SlackAPI(object):
 
-    def __init__(self, token: str):
+    def __init__(self,
+                 token: str,
+                 pool_size: int = DEFAULT_POOL_SIZE,
+                 limiter: rate_limiter.RateLimiter = None,
+                 base_url: str = DEFAULT_BASE_URL,
+                 cache: metadata_cache.MetadataCache = None,
+                 controller: adaptive_concurrency.AdaptiveConcurrency = None,
+                 metrics: api_metrics.ApiMetrics = None):
         self.token = token
-        self.base_url = 'https://slack.com/api'
+        self.base_url = base_url
         self.limit = '1000'
+        self.rate_limiter = limiter if limiter else rate_limiter.RateLimiter()
+        self.cache = cache
+        self.in_flight = single_flight.SingleFlight()
+        self.controller = controller
+        self.metrics = metrics
+        self._pid = os.getpid()
         self.session = session = requests.session()
         session.mount(
             self.base_url,
-            HTTPAdapter(max_retries=Retry(total=5, backoff_factor=0.2)))
+            HTTPAdapter(max_retries=Retry(total=5, backoff_factor=0.2, respect_retry_after_header=False),
+                        pool_connections=pool_size,
+                        pool_maxsize=pool_size))
         session.headers.update({
             'Connection': 'keep-alive, close',
             'Authorization': f'Bearer {self.token}',
@@ -51,123 +81,192 @@ class SlackAPI(object):
         })
         session.params['limit'] = self.limit
 
-    def _pagination_loop(self,
-                         response: requests.Response,
-                         pagination: str,
-                         method: str,
-                         relative_url: str,
-                         params: Dict,
-                         data: Dict,
-                         verify_ssl: bool) -> List:
-
-        results = []
-
-        if pagination == 'offset' and response.json().get('offset'):
-            while response.json().get('offset'):
-                response = self.session.request(
-                    method,
-                    relative_url,
-                    params=params,
-                    data=data,
-                    verify=verify_ssl,
-                    timeout=5
-                )
-
-                params.update({
-                    'offset': response.json().get('offset')
-                })
-                results.append(response.json())
-        elif pagination == 'latest' and response.json().get('offset'):
-            while response.json().get('offset'):
-                response = self.session.request(
-                    method,
-                    relative_url,
-                    params=params,
-                    data=data,
-                    verify=verify_ssl,
-                    timeout=5
-                )
-
-                params.update({
-                    'latest': response.json().get('offset')
-                })
-                results.append(response.json())
-        else:
-            results.append(response.json())
+    def _reset_connection_pools(self):
+        """ Give a forked child process its own connection pools. Keep-alive connections
+        inherited from the parent are still used by the parent, possibly from another thread """
 
-        return results
+        for adapter in self.session.adapters.values():
+            adapter.init_poolmanager(adapter._pool_connections, adapter._pool_maxsize, adapter._pool_block)
+            adapter.proxy_manager = {}
+        self._pid = os.getpid()
 
-    def _make_request(self,
+    def _send(self,
+              url: str,
+              method: str,
+              params: Dict,
+              data: Dict,
+              verify_ssl: bool) -> Dict:
+        """ Send a single request to the Slack API. Identical GET requests made
+        concurrently from different threads share one HTTP call and its response
+
+        Args:
+            url: Slack API method to call
+            method: HTTP method to use
+            params: Query parameters
+            data: Request body
+            verify_ssl: Whether to verify SSL certificates
+        Returns:
+            Decoded JSON response from the Slack API
+        """
+
+        if method != 'GET' or data:
+            return self._send_request(url, method, params, data, verify_ssl)
+
+        key = (url, tuple(sorted((k, str(v)) for k, v in (params or {}).items() if v is not None)))
+        return self.in_flight.do(key, self._send_request, url, method, params, data, verify_ssl)
+
+    def _send_request(self,
                       url: str,
-                      params: Dict = None,
-                      data: Dict = None,
-                      method: str = 'GET',
-                      verify_ssl: bool = True,
-                      pagination: str = None) -> List:
-        try:
-            relative_url = '/'.join((self.base_url, url))
+                      method: str,
+                      params: Dict,
+                      data: Dict,
+                      verify_ssl: bool) -> Dict:
+        """ Send a single request to the Slack API, first waiting for the rate limiter
+        to allow a call to the method. If the API responds that the method is rate limited,
+        the request is retried once the Retry-After period has passed
+
+        Args:
+            url: Slack API method to call
+            method: HTTP method to use
+            params: Query parameters
+            data: Request body
+            verify_ssl: Whether to verify SSL certificates
+        Returns:
+            Decoded JSON response from the Slack API. If the method is still rate
+            limited after retrying, the rate limited response is returned
+        """
+
+        if self._pid != os.getpid():
+            self._reset_connection_pools()
+        relative_url = '/'.join((self.base_url, url))
+        for attempt in range(MAX_RATE_LIMIT_RETRIES):
+            waited = self.rate_limiter.acquire(url)
+            if self.metrics and waited:
+                self.metrics.record_wait(url, waited)
+            start = time.monotonic()
             response = self.session.request(
                 method,
                 relative_url,
                 params=params,
                 data=data,
                 verify=verify_ssl,
-                timeout=5
+                timeout=DEFAULT_TIMEOUT
             )
+            latency = time.monotonic() - start
+            body = json_codec.loads(response.content)
+            rate_limited = response.status_code == 429 or body.get('error') == 'ratelimited'
+            if self.controller:
+                self.controller.record(latency, rate_limited)
+            if self.metrics:
+                self.metrics.record_request(url, latency, len(response.content), rate_limited, attempt > 0)
+            if not rate_limited:
+                return body
+            self.rate_limiter.penalise(url, rate_limiter.parse_retry_after(response.headers.get('Retry-After')))
+
+        return body
+
+    def _iter_pages(self,
+                    url: str,
+                    params: Dict = None,
+                    data: Dict = None,
+                    method: str = 'GET',
+                    verify_ssl: bool = True,
+                    pagination: str = None) -> Iterator[Dict]:
+        """ Generator that makes a request to the Slack API and yields each page of the
+        response as it arrives. Each page is decoded once.
 
-            if not response.json().get('ok') and response.json().get('error') == 'missing_scope':
-                raise ScopeError()
-            elif not response.json().get('ok') and response.json().get('error') == 'channel_not_found':
-                params['team'] = ''
-                response = self.session.request(
-                    method='GET',
-                    url=relative_url,
-                    params=params,
-                    data=data,
-                    verify=verify_ssl,
-                    timeout=5
-                )
-                return self._pagination_loop(
-                    response,
-                    pagination,
-                    method,
-                    relative_url,
-                    params,
-                    data,
-                    verify_ssl
-                )
-            elif not response.json().get('ok') and response.json().get('error') == 'ratelimited':
-                print('Slack API rate limit reached - cooling off')
-                time.sleep(60)
-                self._make_request(
-                    url,
-                    params,
-                    data,
-                    method,
-                    verify_ssl,
-                    pagination
-                )
-            elif not response.json().get('ok'):
-                raise SlackAPIError()
-            else:
-                if not response.json().get('offset'):
-                    return [response.json()]
-                else:
-                    return self._pagination_loop(
-                        response,
-                        pagination,
-                        method,
-                        relative_url,
-                        params,
-                        data,
-                        verify_ssl
-                    )
-        except ScopeError:
-            raise ScopeError(f"Missing required scope: {response.json().get('needed')}")
-        except SlackAPIError:
-            raise SlackAPIError(f"Slack API Error: {response.json().get('error')}")
-        except Exception as e:
-            raise Exception(e)
+        Args:
+            url: Slack API method to call
+            params: Query parameters
+            data: Request body
+            method: HTTP method to use
+            verify_ssl: Whether to verify SSL certificates
+            pagination: Parameter to pass the offset of the next page in, either 'offset'
+                or 'latest'. Only the first page is returned if not given
+        Returns:
+            Decoded JSON pages from the Slack API
+        """
+
+        if self.metrics:
+            self.metrics.record_call(url)
+        params = dict(params) if params else {}
+        page = self._send(url, method, params, data, verify_ssl)
+        if not page.get('ok') and page.get('error') == 'channel_not_found':
+            params['team'] = ''
+            page = self._send(url, method, params, data, verify_ssl)
+
+        while True:
+            if not page.get('ok') and page.get('error') == 'missing_scope':
+                raise ScopeError(f"Missing required scope: {page.get('needed')}")
+            elif not page.get('ok'):
+                raise SlackAPIError(f"Slack API Error: {page.get('error')}")
+
+            if self.metrics:
+                self.metrics.record_page(url)
+            yield page
+
+            if not pagination or not page.get('offset'):
+                return
+            params[pagination] = page.get('offset')
+            page = self._send(url, method, params, data, verify_ssl)
+
+    def _iter_results(self,
+                      url: str,
+                      identifier: str,
+                      params: Dict = None,
+                      pagination: str = None) -> Iterator[Dict]:
+        """ Generator that yields each item in a paginated Slack API response
+        as each page arrives
+
+        Args:
+            url: Slack API method to call
+            identifier: The key in each page the items are held under, e.g. 'messages'
+            params: Query parameters
+            pagination: Parameter to pass the offset of the next page in
+        Returns:
+            Items from the Slack API response
+        """
+
+        for page in self._iter_pages(url, params=params, pagination=pagination):
+            yield from page.get(identifier) or []
+
+    def _make_request(self,
+                      url: str,
+                      params: Dict = None,
+                      data: Dict = None,
+                      method: str = 'GET',
+                      verify_ssl: bool = True,
+                      pagination: str = None) -> List:
+        return list(self._iter_pages(url, params, data, method, verify_ssl, pagination))
+
+    def _cached_request(self,
+                        url: str,
+                        key: str,
+                        identifier: str,
+                        params: Dict = None) -> Dict or List:
+        """ Make a request for metadata, using the metadata cache if one is set
+
+        Args:
+            url: Slack API method to call
+            key: Key identifying the request in the cache
+            identifier: The key in the response the data is held under
+            params: Query parameters
+        Returns:
+            Data from the response
+        """
+
+        if self.cache:
+            result = self.cache.get(url, key)
+            if result is not None:
+                if self.metrics:
+                    self.metrics.record_cache_hit(url)
+                return result
+
+        result = self._make_request(url, params=params)[0].get(identifier)
+        if self.cache and result is not None:
+            self.cache.set(url, key, result)
+
+        return result
 
     def get_enterprise_info(self) -> Dict:
         """ Return all information for the Enterprise Grid
@@ -176,7 +275,7 @@ class SlackAPI(object):
             JSON object containing information on the Slack Enterprise Grid
         """
 
-        return self._make_request('discovery.enterprise.info')[0].get('enterprise')
+        return self._cached_request('discovery.enterprise.info', 'enterprise', 'enterprise')
 
     def get_all_users(self, offset: str = None) -> List[Dict]:
         """ Get all users in a Grid
@@ -185,13 +284,20 @@ class SlackAPI(object):
             All users in a Grid, plus Workspaces they are assigned to
         """
 
+        return list(self.iter_users(offset))
+
+    def iter_users(self, offset: str = None) -> Iterator[Dict]:
+        """ Generator version of get_all_users, yielding users as each page arrives
+
+        Returns:
+            Users in a Grid, plus Workspaces they are assigned to
+        """
+
         params = {
             'offset': offset
         }
 
-        users = self._make_request('discovery.users.list', params=params, pagination='offset')
-
-        return _format_results(users, 'users')
+        return self._iter_results('discovery.users.list', 'users', params=params, pagination='offset')
 
     def get_user_info(self, user_id: str) -> Dict:
         """ Get information from one user in the Grid
@@ -284,13 +390,22 @@ class SlackAPI(object):
             JSON containing recent conversations created
         """
 
+        return list(self.iter_recent_conversations(latest))
+
+    def iter_recent_conversations(self, latest: float = None) -> Iterator[Dict]:
+        """ Generator version of get_recent_conversations, yielding conversations as each page arrives
+
+        Args:
+            latest: Timestamp within the last 24 hours to shorten or lengthen the requested timespan.
+        Returns:
+            Recently active conversations
+        """
+
         params = {
             'latest': latest
         }
 
-        conversations = self._make_request('discovery.conversations.recent', params=params, pagination='latest')
-
-        return _format_results(conversations, 'channels')
+        return self._iter_results('discovery.conversations.recent', 'channels', params=params, pagination='latest')
 
     def get_conversation_history(self,
                                  channel_id: str,
@@ -309,6 +424,24 @@ class SlackAPI(object):
             JSON object containing channel information
         """
 
+        return list(self.iter_conversation_history(channel_id, team_id, latest, oldest))
+
+    def iter_conversation_history(self,
+                                  channel_id: str,
+                                  team_id: str = None,
+                                  latest: float = None,
+                                  oldest: float = None) -> Iterator[Dict]:
+        """ Generator version of get_conversation_history, yielding messages as each page arrives
+
+        Args:
+            team_id: ID for the team the channel is in
+            channel_id: ID for the channel to return
+            latest: The newest date to retrieve messages from
+            oldest: The oldest date to retrieve messages from
+        Returns:
+            Messages from the channel
+        """
+
         params = {
             'channel': channel_id,
             'team': team_id,
@@ -316,9 +449,7 @@ class SlackAPI(object):
             'oldest': oldest
         }
 
-        conversations = self._make_request('discovery.conversations.history', params=params, pagination='latest')
-
-        return _format_results(conversations, 'messages')
+        return self._iter_results('discovery.conversations.history', 'messages', params=params, pagination='latest')
 
     def get_conversation_edits(self,
                                channel_id: str,
@@ -337,6 +468,24 @@ class SlackAPI(object):
 
         """
 
+        return list(self.iter_conversation_edits(channel_id, team_id, latest, oldest))
+
+    def iter_conversation_edits(self,
+                                channel_id: str,
+                                team_id: str,
+                                latest: float = None,
+                                oldest: float = None) -> Iterator[Dict]:
+        """ Generator version of get_conversation_edits, yielding edit records as each page arrives
+
+        Args:
+            team_id: ID for the team to search in
+            channel_id: ID for the channel to return
+            latest: The newest date to retrieve messages from
+            oldest: The oldest date to retrieve messages from
+        Returns:
+            Edit and delete records for the channel
+        """
+
         params = {
             'channel': channel_id,
             'team': team_id,
@@ -344,9 +493,7 @@ class SlackAPI(object):
             'oldest': oldest
         }
 
-        conversations = self._make_request('discovery.conversations.edits', params=params, pagination='latest')
-
-        return _format_results(conversations, 'edits')
+        return self._iter_results('discovery.conversations.edits', 'edits', params=params, pagination='latest')
 
     def get_conversation_info(self,
                               channel_id: str,
@@ -365,7 +512,7 @@ class SlackAPI(object):
             'team': team_id
         }
 
-        return self._make_request('discovery.conversations.info', params=params)[0].get('info')
+        return self._cached_request('discovery.conversations.info', f'{channel_id}:{team_id}', 'info', params)
 
     def get_conversation_members(self,
                                  channel_id: str,
@@ -582,15 +729,29 @@ class SlackAPI(object):
             JSON object with drafts from specified team
         """
 
+        return list(self.iter_drafts(team_id, oldest, latest))
+
+    def iter_drafts(self,
+                    team_id: str,
+                    oldest: int = None,
+                    latest: int = None) -> Iterator[Dict]:
+        """ Generator version of list_drafts, yielding drafts as each page arrives
+
+        Args:
+            team_id: Team ID of the workspace the draft was created within.
+            oldest: Start of time range of messages to include in results.
+            latest: End of time range of messages to include in results.
+        Returns:
+            Drafts from the specified team
+        """
+
         params = {
             'team': team_id,
             'latest': latest,
             'oldest': oldest
         }
 
-        drafts = self._make_request('discovery.drafts.list', params=params, pagination='offset')
-
-        return _format_results(drafts, 'drafts')
+        return self._iter_results('discovery.drafts.list', 'drafts', params=params, pagination='offset')
 
     def get_draft_info(self,
                        team_id: str,
@@ -632,14 +793,26 @@ class SlackAPI(object):
             JSON object containing file data
         """
 
+        return list(self.iter_files(oldest, latest))
+
+    def iter_files(self,
+                   oldest: int or str = None,
+                   latest: int or str = None) -> Iterator[Dict]:
+        """ Generator version of list_files, yielding files as each page arrives
+
+        Args:
+            oldest: Start of time range of messages to include in results.
+            latest: End of time range of messages to include in results.
+        Returns:
+            Files uploaded within the timeframe
+        """
+
         params = {
             'latest': latest,
             'oldest': oldest
         }
 
-        drafts = self._make_request('discovery.files.list', params=params, pagination='offset')
-
-        return _format_results(drafts, 'files')
+        return self._iter_results('discovery.files.list', 'files', params=params, pagination='offset')
 
     def get_file_info(self, file_id: str) -> dict:
         """ Get all comments for a file
@@ -723,7 +896,71 @@ class SlackAPI(object):
             'team': team_id
         }
 
-        return self._make_request('team.info', params=params)[0].get('team')
+        return self._cached_request('team.info', team_id, 'team', params)
+
+
+class SearchPool(object):
+    """ Worker processes that search the messages and files found by a scan with every
+    signature at once, kept running for the whole search.
+
+    The signatures, their search string matchers, the Enterprise directory, messages and
+    files are sent to the worker processes once, when the first search starts. Each search then only sends the
+    positions of the messages or files for each task."""
+
+    def __init__(self,
+                 slack_connection: SlackAPI,
+                 signature_list: List[signature.CompiledSignature],
+                 enterprise_directory: directory.EnterpriseDirectory,
+                 message_list: List[Dict],
+                 files_list: List[post.File],
+                 cores: int,
+                 verbose: bool):
+        message_list = message_list or []
+        files_list = files_list or []
+        self._message_tasks = scheduler.make_tasks(
+            range(len(message_list)), cores, weight=lambda position: _message_weight(message_list[position]))
+        self._file_tasks = scheduler.make_tasks(range(len(files_list)), cores)
+        self._pool = worker_pool.WorkerPool(
+            cores,
+            signature_list=signature_list,
+            slack_connection=slack_connection,
+            enterprise_directory=enterprise_directory,
+            message_list=message_list,
+            files_list=files_list,
+            message_matcher=prefilter.SearchStringMatcher(signature_list, 'messages'),
+            file_matcher=prefilter.SearchStringMatcher(signature_list, 'files'),
+            verbose=verbose)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._pool.__exit__(exc_type, exc_val, exc_tb)
+
+    def find_messages(self) -> Iterator[List[Tuple[int, Dict]]]:
+        """ Search the messages with every signature
+
+        Returns:
+            (signature index, match) for each match, batched by task in the order the
+            tasks finish
+        """
+
+        return self._pool.imap_unordered(_mp_pool_find_messages_worker, self._message_tasks)
+
+    def find_files(self) -> Iterator[List[Tuple[int, Dict]]]:
+        """ Search the files with every signature
+
+        Returns:
+            (signature index, match) for each match, batched by task in the order the
+            tasks finish
+        """
+
+        return self._pool.imap_unordered(_mp_pool_find_files_worker, self._file_tasks)
+
+    def close(self) -> None:
+        """ Stop the worker processes """
+
+        self._pool.close()
 
 
 def _format_results(results_list: list, identifier: str) -> List[Dict]:
@@ -764,7 +1001,7 @@ def _flatten_list(input_list) -> list:
     return [item for sublist in input_list for item in sublist]
 
 
-def _location_verification(conv: conversation.Conversation, sig: signature.Signature) -> bool:
+def _location_verification(conv: conversation.Conversation, sig: signature.CompiledSignature) -> bool:
     """ Verify post location against selected locations in the signature
         e.g: do not return direct messages if they have not been specified
 
@@ -802,7 +1039,6 @@ def _convert_timestamp(timestamp: str or int) -> str:
 
 def _deduplicate(input_list: list) -> List[Dict]:
     """ Removes duplicates where results are returned by multiple queries
-    Nested class handles JSON encoding for dataclass objects
 
     Args:
         input_list: List of dataclass objects
@@ -810,30 +1046,35 @@ def _deduplicate(input_list: list) -> List[Dict]:
         List of JSON objects with duplicates removed
     """
 
-    class EnhancedJSONEncoder(json.JSONEncoder):
-        def default(self, o):
-            if dataclasses.is_dataclass(o):
-                return dataclasses.asdict(o)
-            return super().default(o)
-
-    json_set = {json.dumps(dictionary, sort_keys=True, cls=EnhancedJSONEncoder) for dictionary in input_list}
+    json_set = {json_codec.dumps(dictionary, sort_keys=True) for dictionary in input_list}
 
-    return [json.loads(t) for t in json_set]
+    return [json_codec.loads(t) for t in json_set]
 
 
-def initiate_slack_connection(token: str) -> SlackAPI:
+def initiate_slack_connection(token: str,
+                              limiter: rate_limiter.RateLimiter = None,
+                              base_url: str = DEFAULT_BASE_URL,
+                              cache: metadata_cache.MetadataCache = None,
+                              metrics: api_metrics.ApiMetrics = None) -> SlackAPI:
     """ Create a Slack API object to use for interacting with the Slack API
     First tries to get the API token from the environment variable:
         SLACK_WATCHMAN_EG_TOKEN
     Failing this, looks for it in the config file:
         watchman.conf
 
+    Args:
+        token: Slack API token
+        limiter: Rate limiter to share with other Slack API objects. A new one is
+            created if not given
+        base_url: Base URL of the Slack API
+        cache: Cache for team, conversation and enterprise lookups
+        metrics: Collector for API usage metrics
     Returns:
         Slack API object
     """
 
     try:
-        return SlackAPI(token)
+        return SlackAPI(token, limiter=limiter, base_url=base_url, cache=cache, metrics=metrics)
     except Exception as e:
         raise e
 
@@ -879,15 +1120,9 @@ def get_users(slack_connection: SlackAPI,
         List of Slack User objects for all users in the enterprise
     """
 
-    all_users = slack_connection.get_all_users()
     results = []
 
-    for user_info in all_users:
-        wk = []
-        for w in workspaces_list:
-            workspace = next((item for item in workspaces_list if item.id == w.id))
-            wk.append(workspace)
-
+    for user_info in slack_connection.iter_users():
         results.append(user.create_from_dict(user_info, workspaces_list, verbose))
 
     return results
@@ -961,191 +1196,168 @@ def tombstone_message(slack_connection: SlackAPI,
         raise e
 
 
-def search_message_matches(sig: signature.Signature,
+def search_message_matches(signature_list: List[signature.CompiledSignature],
                            slack_connection: SlackAPI,
-                           users_list: List[user.User],
+                           enterprise_directory: directory.EnterpriseDirectory,
                            message_list: List[post.Message],
-                           workspaces_list: List[workspace.Workspace],
                            cores: int,
                            logger: sw_logger.JSONLogger,
-                           verbose: bool) -> List[Dict]:
-    """ Use the search API to find messages posted in a certain timeframe
-    matching search terms in the signature file. These are then compared against a regex
-    to assess whether they contain sensitive data matching the signature.
+                           verbose: bool,
+                           pool: SearchPool = None,
+                           raise_errors: bool = False) -> List[List[Dict]]:
+    """ Search messages posted in a certain timeframe with every signature at once. Messages
+    containing search terms in a signature are compared against its regex to assess whether
+    they contain sensitive data matching the signature.
 
     Args:
+        signature_list: Signatures defining what to search for. Only signatures with the
+            messages scope are used
         slack_connection: Slack API object
+        enterprise_directory: Users and workspaces in the Enterprise
         message_list: List of Message objects to search through
-        sig: Signature object defining what to search for
-        users_list: List of User objects
-        workspaces_list: List of Workspace objects
         cores: number of cores to use
         logger: Logging object
         verbose: Whether to use verbose logging or not
+        pool: Search pool holding the messages to search, created with the same signatures.
+            If not given, new worker processes are started for the search
+        raise_errors: Raise errors from the search, rather than logging them and returning
+            no matches
     Returns:
-        List of Message objects containing post data
+        List of matches for each signature, in the same order as signature_list
     """
 
     try:
-        results = multiprocessing.Manager().list()
-        list_of_chunks = numpy.array_split(numpy.array(message_list), cores)
-
-        processes = []
-
-        for message_list in list_of_chunks:
-            p = multiprocessing.Process(
-                target=_mp_find_messages_worker,
-                args=(
-                    sig,
-                    slack_connection,
-                    users_list,
-                    message_list,
-                    workspaces_list,
-                    results,
-                    verbose
-                )
-            )
-            processes.append(p)
-            p.start()
-
-        for process in processes:
-            process.join()
-
-        if results:
-            results = _deduplicate(results)
-            logger.log('INFO', f'{len(results)} total matches found after filtering')
-            return results
+        if pool:
+            batches = pool.find_messages()
         else:
-            logger.log('INFO', 'No matches found after filtering')
+            batches = worker_pool.imap_unordered(
+                _mp_find_messages_worker,
+                scheduler.make_tasks(message_list, cores, weight=_message_weight),
+                cores,
+                signature_list=signature_list,
+                slack_connection=slack_connection,
+                enterprise_directory=enterprise_directory,
+                verbose=verbose,
+                matcher=prefilter.SearchStringMatcher(signature_list, 'messages'))
+        return _group_matches(signature_list, 'messages', batches, logger)
     except Exception as e:
+        if raise_errors:
+            raise
         logger.log('CRITICAL', e)
+        return [[] for _ in signature_list]
 
 
-def search_file_matches(sig: signature.Signature,
-                        users_list: List[user.User],
+def search_file_matches(signature_list: List[signature.CompiledSignature],
+                        enterprise_directory: directory.EnterpriseDirectory,
                         files_list: List[post.File],
                         cores: int,
-                        logger: sw_logger.JSONLogger) -> List[Dict]:
-    """ Use the search API to find files posted in a certain timeframe
-    matching search terms in the signature file.
+                        logger: sw_logger.JSONLogger,
+                        pool: SearchPool = None,
+                        raise_errors: bool = False) -> List[List[Dict]]:
+    """ Search files posted in a certain timeframe with every signature at once, for files
+    matching search terms in a signature.
 
     Args:
-        files_list:
-        sig: Signature object defining what to search for
-        users_list: List of User objects
+        signature_list: Signatures defining what to search for. Only signatures with the
+            files scope are used
+        enterprise_directory: Users and workspaces in the Enterprise
+        files_list: List of File objects to search through
         cores: Number of cores to use
+        logger: Logging object
+        pool: Search pool holding the files to search, created with the same signatures.
+            If not given, new worker processes are started for the search
+        raise_errors: Raise errors from the search, rather than logging them and returning
+            no matches
     Returns:
-        List of Message objects containing post data
+        List of matches for each signature, in the same order as signature_list
     """
 
     try:
-        results = multiprocessing.Manager().list()
-        list_of_chunks = numpy.array_split(numpy.array(files_list), cores)
-
-        processes = []
-
-        for message_list in list_of_chunks:
-            p = multiprocessing.Process(
-                target=_mp_find_files_worker,
-                args=(
-                    sig,
-                    users_list,
-                    message_list,
-                    results
-                )
-            )
-            processes.append(p)
-            p.start()
-
-        for process in processes:
-            process.join()
-
-        if results:
-            results = _deduplicate(results)
-            logger.log('INFO', f'{len(results)} total matches found after filtering')
-            return results
+        if pool:
+            batches = pool.find_files()
         else:
-            logger.log('INFO', 'No matches found after filtering')
+            batches = worker_pool.imap_unordered(
+                _mp_find_files_worker,
+                scheduler.make_tasks(files_list, cores),
+                cores,
+                signature_list=signature_list,
+                enterprise_directory=enterprise_directory,
+                matcher=prefilter.SearchStringMatcher(signature_list, 'files'))
+        return _group_matches(signature_list, 'files', batches, logger)
     except Exception as e:
+        if raise_errors:
+            raise
         logger.log('CRITICAL', e)
+        return [[] for _ in signature_list]
+
+
+def _group_matches(signature_list: List[signature.CompiledSignature],
+                   scope: str,
+                   batches: Iterable[List[Tuple[int, Dict]]],
+                   logger: sw_logger.JSONLogger) -> List[List[Dict]]:
+    """ Sort matches tagged with the index of their signature into a list for each signature,
+    removing duplicates
+
+    Args:
+        signature_list: Signatures the matches were found with
+        scope: Scope that was searched, e.g. messages
+        batches: Lists of (signature index, match)
+        logger: Logging object
+    Returns:
+        List of matches for each signature, in the same order as signature_list
+    """
+
+    grouped = [[] for _ in signature_list]
+    for batch in batches:
+        for index, result in batch:
+            grouped[index].append(result)
+
+    for index, sig in enumerate(signature_list):
+        if scope in sig.scope:
+            grouped[index] = _deduplicate(grouped[index])
+            logger.log('INFO', f'{len(grouped[index])} total matches found for {sig.name} in {scope}')
+
+    return grouped
 
 
 def search_draft_matches(slack_connection: SlackAPI,
-                         sig: signature.Signature,
+                         signature_list: List[signature.CompiledSignature],
                          drafts_list: List[post.Draft],
-                         users_list: List[user.User],
+                         enterprise_directory: directory.EnterpriseDirectory,
                          logger: sw_logger.JSONLogger,
                          verbose: bool,
-                         timeframe: int = DEFAULT_TIMEFRAME) -> List[Dict]:
-    """ Find drafts posted in a certain timeframe
-    matching search terms in the signature file. These are then compared against a regex
-    to assess whether they contain sensitive data matching the signature.
+                         timeframe: int = DEFAULT_TIMEFRAME,
+                         raise_errors: bool = False) -> List[List[Dict]]:
+    """ Search drafts created in a certain timeframe with every signature at once. Drafts
+    containing search terms in a signature are compared against its regex to assess whether
+    they contain sensitive data matching the signature.
 
     Args:
-        logger: Logging object
         slack_connection: Slack API object
-        sig: Signature object defining what to search for
-        users_list: List of User objects
+        signature_list: Signatures defining what to search for. Only signatures with the
+            drafts scope are used
         drafts_list: List of Draft objects
-        timeframe: How far back to search for drafts
+        enterprise_directory: Users and workspaces in the Enterprise
+        logger: Logging object
         verbose: Whether to use verbose logging or not
+        timeframe: How far back to search for drafts
+        raise_errors: Raise errors from the search, rather than logging them and returning
+            no matches
     Returns:
-        List of Drafts objects containing post data
+        List of matches for each signature, in the same order as signature_list
     """
 
-    results = []
     try:
-        for draft in drafts_list:
-            result_drafts = []
-
-            # This nasty nested if is required to iterate through multiple
-            # levels of blocks in the JSON data. This is where the
-            # text that needs checking against regex is stored.
-            if draft.blocks and draft.created >= timeframe:
-                for block_list in draft.blocks:
-                    if block_list.get('type') == 'rich_text':
-                        for element in block_list.get('elements'):
-                            element_sub_list = element.get('elements')
-                            for esl in element_sub_list:
-                                if esl.get('type') == 'text':
-                                    for pattern in sig.patterns:
-                                        r = re.compile(pattern)
-                                        if sig.search_strings:
-                                            for search_string in sig.search_strings:
-                                                if str(search_string.lower()) in esl.get('text').lower():
-                                                    if r.search(esl.get('text')):
-                                                        draft_user = next((item for item in users_list if
-                                                                           item.id == draft.user), None)
-                                                        team_id = draft.team
-                                                        team = slack_connection.get_team_info(team_id)
-                                                        if draft_user:
-                                                            user_dict = draft_user
-                                                        else:
-                                                            user_dict = None
-
-                                                        if team:
-                                                            team_dict = workspace.create_from_dict(team, verbose)
-                                                        else:
-                                                            team_dict = None
-
-                                                        result_drafts.append({
-                                                            'timestamp': _convert_timestamp(draft.created),
-                                                            'match_string': r.search(esl.get('text')).group(0),
-                                                            'draft': draft,
-                                                            'user': user_dict,
-                                                            'workspace': team_dict,
-                                                        })
-            if result_drafts:
-                for result in result_drafts:
-                    results.append(result)
-        if results:
-            results = _deduplicate(results)
-            logger.log('INFO', f'{len(results)} total matches found after filtering')
-            return results
-        else:
-            logger.log('INFO', 'No matches found after filtering')
+        return _group_matches(
+            signature_list,
+            'drafts',
+            [match_drafts(signature_list, slack_connection, enterprise_directory, drafts_list, verbose, timeframe)],
+            logger)
     except Exception as e:
+        if raise_errors:
+            raise
         logger.log('CRITICAL', e)
+        return [[] for _ in signature_list]
 
 
 def find_shared_channels(slack_connection: SlackAPI, verbose: bool) -> List[conversation.Conversation]:
@@ -1180,37 +1392,43 @@ def find_shared_channels(slack_connection: SlackAPI, verbose: bool) -> List[conv
 
 def get_all_messages(slack_connection: SlackAPI,
                      cores: int,
-                     timeframe: int = DEFAULT_TIMEFRAME) -> List[post.Message]:
+                     timeframe: int = DEFAULT_TIMEFRAME,
+                     checkpoints: checkpoint.CheckpointStore = None,
+                     journal: scan_journal.ScanJournal = None,
+                     edits: bool = False,
+                     conversations: List[Dict] = None) -> List[post.Message]:
     """ Get all messages in the Enterprise for a given timeframe
 
     Args:
         timeframe: timeframe to search in
         slack_connection: Slack API object
         cores: number of cores to use
+        checkpoints: Store of high-water marks. If given, only messages newer than the
+            last scanned message in each conversation are returned
+        journal: Journal to record completed conversations in, and resume from
+        edits: Whether to also get messages posted before the timeframe but edited during it
+        conversations: Output from the discovery.conversations.recent endpoint to get
+            messages from. All recently updated conversations are used if not given
     Returns:
         list of Message objects containing all drafts
     """
 
-    results = multiprocessing.Manager().list()
-    updated_conversations = slack_connection.get_recent_conversations(latest=timeframe)
-    list_of_chunks = numpy.array_split(numpy.array(updated_conversations), cores)
-    processes = []
-
-    for conv_list in list_of_chunks:
-        p = multiprocessing.Process(
-            target=_mp_message_search_worker,
-            args=(
-                conv_list,
-                slack_connection,
-                timeframe,
-                results
-            )
-        )
-        processes.append(p)
-        p.start()
-
-    for process in processes:
-        process.join()
+    results = []
+    if conversations is None:
+        updated_conversations = slack_connection.get_recent_conversations(latest=timeframe)
+    else:
+        updated_conversations = conversations
+    for batch in worker_pool.imap_unordered(
+            _mp_message_search_worker,
+            scheduler.make_tasks(updated_conversations, cores,
+                                 weight=lambda conv: estimate_conversation_size(slack_connection, conv)),
+            cores,
+            slack_connection=slack_connection,
+            timeframe=timeframe,
+            checkpoints=checkpoints,
+            journal=journal,
+            edits=edits):
+        results.extend(batch)
 
     return results
 
@@ -1218,7 +1436,10 @@ def get_all_messages(slack_connection: SlackAPI,
 def get_all_files(slack_connection: SlackAPI,
                   cores: int,
                   verbose: bool,
-                  timeframe: int = DEFAULT_TIMEFRAME) -> List[post.File]:
+                  timeframe: int = DEFAULT_TIMEFRAME,
+                  checkpoints: checkpoint.CheckpointStore = None,
+                  journal: scan_journal.ScanJournal = None,
+                  files: List[Dict] = None) -> List[post.File]:
     """ Get all files in the Enterprise for a given timeframe
 
     Args:
@@ -1226,30 +1447,28 @@ def get_all_files(slack_connection: SlackAPI,
         slack_connection: Slack API object
         cores: Number of cores to use
         verbose: Whether to use verbose logging or not
+        checkpoints: Store of high-water marks. If given, only files newer than the
+            last scanned file are returned
+        journal: Journal to record completed files in, and resume from
+        files: Output from the discovery.files.list endpoint to get information for. All
+            new files are used if not given
     Returns:
         list of File objects containing all drafts
     """
 
-    results = multiprocessing.Manager().list()
-    updated_files = slack_connection.list_files(oldest=timeframe)
-    list_of_chunks = numpy.array_split(numpy.array(updated_files), cores)
-    processes = []
-
-    for file_list in list_of_chunks:
-        p = multiprocessing.Process(
-            target=_mp_file_search_worker,
-            args=(
-                file_list,
-                slack_connection,
-                results,
-                verbose
-            )
-        )
-        processes.append(p)
-        p.start()
-
-    for process in processes:
-        process.join()
+    results = []
+    if files is None:
+        updated_files = list_new_files(slack_connection, timeframe, checkpoints)
+    else:
+        updated_files = files
+    for batch in worker_pool.imap_unordered(
+            _mp_file_search_worker,
+            scheduler.make_tasks(updated_files, cores),
+            cores,
+            slack_connection=slack_connection,
+            verbose=verbose,
+            journal=journal):
+        results.extend(batch)
 
     return results
 
@@ -1258,7 +1477,9 @@ def get_all_drafts(slack_connection: SlackAPI,
                    workspaces_list: List[workspace.Workspace],
                    cores: int,
                    verbose: bool,
-                   timeframe: int = DEFAULT_TIMEFRAME) -> List[post.Draft]:
+                   timeframe: int = DEFAULT_TIMEFRAME,
+                   checkpoints: checkpoint.CheckpointStore = None,
+                   journal: scan_journal.ScanJournal = None) -> List[post.Draft]:
     """ Get all drafts in the Enterprise for a given timeframe
 
     Args:
@@ -1267,90 +1488,388 @@ def get_all_drafts(slack_connection: SlackAPI,
         workspaces_list: List of all workspaces in the Enterprise
         cores: Number of cores to use
         verbose: Whether to use verbose logging or not
+        checkpoints: Store of high-water marks. If given, only drafts newer than the
+            last scanned draft in each workspace are returned
+        journal: Journal to record completed workspaces in, and resume from
     Returns:
         list of Draft objects containing all drafts
     """
 
-    results = multiprocessing.Manager().list()
-    list_of_chunks = numpy.array_split(numpy.array(workspaces_list), cores)
-    processes = []
-
-    for workspace in list_of_chunks:
-        p = multiprocessing.Process(
-            target=_mp_draft_search_worker,
-            args=(
-                workspace,
-                slack_connection,
-                timeframe,
-                results,
-                verbose
-            )
-        )
-        processes.append(p)
-        p.start()
+    results = []
+    for batch in worker_pool.imap_unordered(
+            _mp_draft_search_worker,
+            scheduler.make_tasks(workspaces_list, cores),
+            cores,
+            slack_connection=slack_connection,
+            timeframe=timeframe,
+            verbose=verbose,
+            checkpoints=checkpoints,
+            journal=journal):
+        results.extend(batch)
+
+    return results
+
+
+def get_conversation_messages(slack_connection: SlackAPI,
+                              conv: Dict,
+                              timeframe: int,
+                              checkpoints: checkpoint.CheckpointStore = None,
+                              journal: scan_journal.ScanJournal = None) -> List[Dict]:
+    """ Get recent messages for a single conversation
+
+    Args:
+        slack_connection: Slack API object
+        conv: Conversation output from discovery.conversations.recent endpoint
+        timeframe: Furthest back time to get messages from
+        checkpoints: Store of high-water marks for each conversation
+        journal: Journal to record completed conversations in, and reuse their messages from
+    Returns:
+        List of messages from the conversation
+    """
+
+    if journal:
+        completed = journal.get_completed(scan_journal.CONVERSATION, conv.get('id'))
+        if completed is not None:
+            return completed
+
+    if checkpoints:
+        oldest = checkpoints.since(checkpoint.CONVERSATION, conv.get('id'), timeframe)
+        message_list = checkpoints.new_entries(
+            checkpoint.CONVERSATION,
+            conv.get('id'),
+            slack_connection.get_conversation_history(conv.get('id'), conv.get('team'), oldest=oldest),
+            'ts',
+            'ts')
+    else:
+        message_list = slack_connection.iter_conversation_history(conv.get('id'), conv.get('team'),
+                                                                  oldest=timeframe)
+    messages = prepare_messages(conv, message_list)
+    if journal:
+        journal.complete(scan_journal.CONVERSATION, conv.get('id'), messages)
+    if slack_connection.cache:
+        slack_connection.cache.set(CONVERSATION_SIZE, conv.get('id'), len(messages))
+    return messages
+
+
+def get_conversation_edited_messages(slack_connection: SlackAPI,
+                                     conv: Dict,
+                                     timeframe: int,
+                                     checkpoints: checkpoint.CheckpointStore = None,
+                                     journal: scan_journal.ScanJournal = None) -> List[Dict]:
+    """ Get messages in a single conversation that were posted before the timeframe, but
+    edited during it. Only the edited messages are returned, not the rest of the history
+
+    Args:
+        slack_connection: Slack API object
+        conv: Conversation output from discovery.conversations.recent endpoint
+        timeframe: Furthest back time to get edits from
+        checkpoints: Store of high-water marks for each conversation
+        journal: Journal to record completed conversations in, and reuse their edits from
+    Returns:
+        List of edited messages from the conversation
+    """
+
+    if journal:
+        completed = journal.get_completed(scan_journal.CONVERSATION_EDITS, conv.get('id'))
+        if completed is not None:
+            return completed
+
+    if checkpoints:
+        edit_list = checkpoints.new_entries(
+            checkpoint.CONVERSATION_EDITS,
+            conv.get('id'),
+            slack_connection.get_conversation_edits(
+                conv.get('id'), conv.get('team'),
+                oldest=checkpoints.since(checkpoint.CONVERSATION_EDITS, conv.get('id'), timeframe)),
+            'edited.ts',
+            'ts')
+        history_oldest = checkpoints.since(checkpoint.CONVERSATION, conv.get('id'), timeframe)
+    else:
+        edit_list = slack_connection.iter_conversation_edits(conv.get('id'), conv.get('team'), oldest=timeframe)
+        history_oldest = timeframe
+    messages = prepare_edits(conv, edit_list, history_oldest)
+    if journal:
+        journal.complete(scan_journal.CONVERSATION_EDITS, conv.get('id'), messages)
+    return messages
+
+
+def estimate_conversation_size(slack_connection: SlackAPI, conv: Dict) -> int:
+    """ Estimate the cost of fetching a conversation's messages, from the number of
+    messages it had when last scanned. Conversations that haven't been scanned before,
+    or when there is no metadata cache, are given the same estimate
+
+    Args:
+        slack_connection: Slack API object
+        conv: Conversation output from discovery.conversations.recent endpoint
+    Returns:
+        Estimated cost of fetching the conversation
+    """
+
+    size = None
+    if slack_connection.cache:
+        size = slack_connection.cache.get(CONVERSATION_SIZE, conv.get('id'))
+    # Every conversation costs at least one request, whatever its size
+    return 1 + (size or 0)
+
+
+def _message_weight(message: Dict) -> int:
+    return 1 + len(message.get('text') or '')
+
+
+def match_messages(signature_list: List[signature.CompiledSignature],
+                   slack_connection: SlackAPI,
+                   enterprise_directory: directory.EnterpriseDirectory,
+                   message_list: List[Dict],
+                   verbose: bool,
+                   matcher: prefilter.SearchStringMatcher = None) -> List[Tuple[int, Dict]]:
+    """ Search messages with every signature in a single pass. The text is extracted from
+    each message once, and scanned once for the search strings of every signature with the
+    messages scope. It is then only searched with the pattern sets of signatures it contains
+    a search string for. The messages passed in are not modified
+
+    Args:
+        signature_list: Signatures to search with
+        slack_connection: Slack API object
+        enterprise_directory: Users and workspaces in the Enterprise
+        message_list: List of messages to search through
+        verbose: Whether to use verbose logging or not
+        matcher: Search string matcher built from the signatures for the messages scope.
+            Built here if not given
+    Returns:
+        List of (index of the signature in signature_list, match) for each match. Matches
+        have the part of the message the match starts in, the Message object, user,
+        workspace and URL, and when the message was last edited if it has been
+    """
+
+    if matcher is None:
+        matcher = prefilter.SearchStringMatcher(signature_list, 'messages')
+    results = []
+    for message in message_list:
+        post_text = text_extraction.extract_message(message)
+        details = None
+        for index in sorted(matcher.candidates(post_text.text)):
+            sig = signature_list[index]
+            for pattern_match in sig.pattern_set.search(post_text.text):
+                if pattern_match.match_string:
+                    if details is None:
+                        details = _message_details(slack_connection, enterprise_directory, message, verbose)
+                    if _location_verification(details.get('message').conversation, sig):
+                        results.append((index, {
+                            'match_string': pattern_match.match_string,
+                            'match_location': post_text.locate(pattern_match.span[0])[0],
+                            **details
+                        }))
+
+    return results
+
+
+def _message_details(slack_connection: SlackAPI,
+                     enterprise_directory: directory.EnterpriseDirectory,
+                     message: Dict,
+                     verbose: bool) -> Dict:
+    """ Create the Message object for a matching message, and find who posted it and where
+
+    Args:
+        slack_connection: Slack API object
+        enterprise_directory: Users and workspaces in the Enterprise
+        message: Message that has matched
+        verbose: Whether to use verbose logging or not
+    Returns:
+        Message object, URL, user and workspace of the message, and when it was last
+        edited if it has been
+    """
+
+    conv_info = slack_connection.get_conversation_info(message.get('conv_id'), message.get('conv_team'))[0]
+    shared = []
+    if conv_info.get('shared').get('shared_team_ids'):
+        for wrk_id in conv_info.get('shared').get('shared_team_ids'):
+            shared.append(slack_connection.get_team_info(wrk_id))
+    conv_info['shared'] = shared
+    conv_info = conversation.create_from_dict(conv_info, verbose)
+    matched_message = post.create_message_from_dict(dict(message, conversation=conv_info))
+    workspace = enterprise_directory.get_workspace(message.get('team'))
+
+    if workspace:
+        url = f'https://{workspace.domain}.slack.com/archives/{matched_message.conversation.id}' \
+              f'/p{matched_message.timestamp}'
+    else:
+        url = None
+    details = {
+        'message': matched_message,
+        'url': url,
+        'user': enterprise_directory.get_user(matched_message.user),
+        'workspace': workspace
+    }
+    if message.get('edited'):
+        details['edited'] = _convert_timestamp(message.get('edited').get('ts'))
 
-    for process in processes:
-        process.join()
+    return details
+
+
+def match_files(signature_list: List[signature.CompiledSignature],
+                enterprise_directory: directory.EnterpriseDirectory,
+                file_list: List[post.File],
+                matcher: prefilter.SearchStringMatcher = None) -> List[Tuple[int, Dict]]:
+    """ Search files with every signature in a single pass. A file matches a signature with
+    the files scope if its title contains any of the signature's search strings, and its
+    file type is one of the signature's file types, if it has any
+
+    Args:
+        signature_list: Signatures to search with
+        enterprise_directory: Users and workspaces in the Enterprise
+        file_list: List of File objects to search through
+        matcher: Search string matcher built from the signatures for the files scope.
+            Built here if not given
+    Returns:
+        List of (index of the signature in signature_list, match) for each match, and
+        conversation the file is shared in
+    """
+
+    if matcher is None:
+        matcher = prefilter.SearchStringMatcher(signature_list, 'files')
+    results = []
+    for target_file in file_list:
+        filetype = target_file.filetype.lower()
+        for index in sorted(matcher.candidates(target_file.title)):
+            sig = signature_list[index]
+            if sig.file_types and not any(file_type in filetype for file_type in sig.file_types):
+                continue
+            for conv in target_file.shares:
+                if _location_verification(conv, sig):
+                    results.append((index, {
+                        'file': target_file,
+                        'conversation': conv,
+                        'user': enterprise_directory.get_user(target_file.user)
+                    }))
 
     return results
 
 
-def _message_block_search(message: dict, query: str) -> bool:
-    """ Searches to see if a message contains blocks if it doesn't contain text.
-    Also looks for blocks when the text string is:
-        'This content can’t be displayed.'
+def match_drafts(signature_list: List[signature.CompiledSignature],
+                 slack_connection: SlackAPI,
+                 enterprise_directory: directory.EnterpriseDirectory,
+                 drafts_list: List[post.Draft],
+                 verbose: bool,
+                 timeframe: int = DEFAULT_TIMEFRAME) -> List[Tuple[int, Dict]]:
+    """ Search drafts with every signature in a single pass, in the same way as messages
+
+    Args:
+        signature_list: Signatures to search with
+        slack_connection: Slack API object
+        enterprise_directory: Users and workspaces in the Enterprise
+        drafts_list: List of Draft objects to search through
+        verbose: Whether to use verbose logging or not
+        timeframe: Furthest back time a draft can have been created
+    Returns:
+        List of (index of the signature in signature_list, match) for each match. Matches
+        have the part of the draft the match starts in, the Draft object, when it was
+        created, and its user and workspace
+    """
+
+    matcher = prefilter.SearchStringMatcher(signature_list, 'drafts')
+    results = []
+    for draft in drafts_list:
+        if draft.created < timeframe:
+            continue
+        post_text = text_extraction.extract_draft(draft)
+        details = None
+        for index in sorted(matcher.candidates(post_text.text)):
+            for pattern_match in signature_list[index].pattern_set.search(post_text.text):
+                if pattern_match.match_string:
+                    if details is None:
+                        team = slack_connection.get_team_info(draft.team)
+                        details = {
+                            'user': enterprise_directory.get_user(draft.user),
+                            'workspace': workspace.create_from_dict(team, verbose) if team else None
+                        }
+                    results.append((index, {
+                        'timestamp': _convert_timestamp(draft.created),
+                        'match_string': pattern_match.match_string,
+                        'match_location': post_text.locate(pattern_match.span[0])[0],
+                        'draft': draft,
+                        **details
+                    }))
+
+    return results
+
 
-    Then searches for the signature query string in the text that is found
+def list_new_files(slack_connection: SlackAPI,
+                   timeframe: int,
+                   checkpoints: checkpoint.CheckpointStore = None) -> List[Dict]:
+    """ List files uploaded in the timeframe. If a checkpoint store is given, only files
+    newer than the last scanned file are listed
 
     Args:
-        message: Message to search for blocks in
-        query: Query string to discover in text
+        slack_connection: Slack API object
+        timeframe: Furthest back time to list files from
+        checkpoints: Store of high-water marks
     Returns:
-        True if the query is in text, False if not
+        File information in dict format from the discovery.files.list endpoint
     """
 
-    if message.get('client_msg_id'):
-        if str(query.lower()) in message.get('text').lower():
-            return True
-        else:
-            return False
-    elif message.get('bot_id') and \
-            (not message.get('text') or message.get('text') == 'This content can’t be displayed.'):
-        if not message.get('blocks'):
-            return False
-        else:
-            for block in message.get('blocks'):
-                if block.get('text'):
-                    if str(query.lower()) in block.get('text').get('text').lower():
-                        return True
+    if not checkpoints:
+        return slack_connection.list_files(oldest=timeframe)
+
+    oldest = checkpoints.since(checkpoint.FILES, checkpoint.ENTERPRISE, timeframe)
+    return checkpoints.new_entries(checkpoint.FILES,
+                                   checkpoint.ENTERPRISE,
+                                   slack_connection.list_files(oldest=int(oldest)),
+                                   'created')
+
+
+def prepare_messages(conv: Dict, message_list: Iterable[Dict]) -> List[Dict]:
+    """ Filter a conversation history down to plain user messages and tag each
+    message with the conversation it was posted in
+
+    Args:
+        conv: Conversation output from discovery.conversations.recent endpoint
+        message_list: Messages from the conversation history
+    Returns:
+        List of messages to search
+    """
 
+    results = []
+    for message in message_list:
+        if not message.get('files') and not message.get('subtype'):
+            message['conv_id'] = conv.get('id')
+            message['conv_team'] = conv.get('team')
+            results.append(message)
+
+    return results
 
-def _regex_search_message(message: dict, regex: re.Pattern) -> str:
-    """ Search a post text for matches against the regex
+
+def prepare_edits(conv: Dict, edit_list: Iterable[Dict], history_oldest: float) -> List[Dict]:
+    """ Filter edit records down to edits of plain user messages posted before the
+    conversation history that is searched, and tag each edited message with the
+    conversation it was posted in. Messages posted since then are already searched in
+    their edited form as part of the history. Each version of a message is kept once
 
     Args:
-        message: Post to look for text in
-        regex: Complied regex object
+        conv: Conversation output from discovery.conversations.recent endpoint
+        edit_list: Edit records from the conversation
+        history_oldest: Time the conversation history is fetched from
     Returns:
-        Regex match string if found, nothing if not
+        List of edited messages to search
     """
 
-    if not message.get('text') or message.get('text') == 'This content can’t be displayed.':
-        if message.get('blocks'):
-            for block in message.get('blocks'):
-                if block.get('text'):
-                    if regex.search(str(block.get('text').get('text'))):
-                        return regex.search(str(block.get('text').get('text'))).group(0)
-    elif regex.search(str(message.get('text'))):
-        return regex.search(str(message.get('text'))).group(0)
+    versions = set()
+    edits = []
+    for edit in edit_list:
+        version = (edit.get('ts'), edit.get('text'))
+        if float(edit.get('ts')) < float(history_oldest) and version not in versions:
+            versions.add(version)
+            edits.append(edit)
+
+    return prepare_messages(conv, edits)
 
 
 # Multiprocessing Worker Functions
 def _mp_draft_search_worker(workspaces_list: List[workspace.Workspace],
                             slack_connection: SlackAPI,
                             timeframe: int,
-                            results: list,
-                            verbose: bool):
+                            verbose: bool,
+                            checkpoints: checkpoint.CheckpointStore = None,
+                            journal: scan_journal.ScanJournal = None):
     """ MULTIPROCESSING WORKER - Iterates through a workspace and returns all draft
     messages.
 
@@ -1358,17 +1877,38 @@ def _mp_draft_search_worker(workspaces_list: List[workspace.Workspace],
         workspaces_list: List of workspace Objects
         slack_connection: Slack API connection
         timeframe: Furthest back time to get messages from
-        results: MP results list to pass back to calling function
         verbose: Whether to use verbose logging or not
+        checkpoints: Store of high-water marks for each workspace's drafts
+        journal: Journal to record completed workspaces in, and reuse their drafts from
     Returns:
         List of draft objects
     """
 
-    for workspace in workspaces_list:
-        workspace_drafts = slack_connection.list_drafts(workspace.id, oldest=timeframe)
-        for draft_info in workspace_drafts:
-            if draft_info.get('date_created') >= timeframe:
-                results.append(post.create_draft_from_dict(draft_info, verbose))
+    results = []
+    try:
+        for workspace in workspaces_list:
+            if journal:
+                completed = journal.get_completed(scan_journal.WORKSPACE_DRAFTS, workspace.id)
+                if completed is not None:
+                    results.extend(completed)
+                    continue
+            if checkpoints:
+                oldest = checkpoints.since(checkpoint.DRAFTS, workspace.id, timeframe)
+                draft_list = checkpoints.new_entries(
+                    checkpoint.DRAFTS,
+                    workspace.id,
+                    list(slack_connection.iter_drafts(workspace.id, oldest=int(oldest))),
+                    'date_created')
+            else:
+                draft_list = slack_connection.iter_drafts(workspace.id, oldest=timeframe)
+            drafts = [post.create_draft_from_dict(draft_info, verbose) for draft_info in draft_list
+                      if draft_info.get('date_created') >= timeframe]
+            if journal:
+                journal.complete(scan_journal.WORKSPACE_DRAFTS, workspace.id, drafts)
+            results.extend(drafts)
+    finally:
+        if slack_connection.metrics:
+            slack_connection.metrics.flush()
 
     return results
 
@@ -1376,7 +1916,9 @@ def _mp_draft_search_worker(workspaces_list: List[workspace.Workspace],
 def _mp_message_search_worker(conv_list: list,
                               slack_connection: SlackAPI,
                               timeframe: int,
-                              results: list):
+                              checkpoints: checkpoint.CheckpointStore = None,
+                              journal: scan_journal.ScanJournal = None,
+                              edits: bool = False):
     """ MULTIPROCESSING WORKER - Iterates through a list of conversation IDs
     and gets recent messages for each
 
@@ -1384,160 +1926,163 @@ def _mp_message_search_worker(conv_list: list,
         conv_list: List of output from discovery.conversations.recent endpoint
         slack_connection: Slack API object
         timeframe: Furthest back time to get messages from
-        results: MP results list to pass back to calling function
+        checkpoints: Store of high-water marks for each conversation
+        journal: Journal to record completed conversations in, and reuse their messages from
+        edits: Whether to also get older messages edited during the timeframe
     Returns:
         List of messages from each recently updated conversation
     """
 
-    for conv in conv_list:
-        message_list = slack_connection.get_conversation_history(conv.get('id'), conv.get('team'), oldest=timeframe)
-        for message in message_list:
-            if not message.get('files') and not message.get('subtype'):
-                message['conv_id'] = conv.get('id')
-                message['conv_team'] = conv.get('team')
-                results.append(message)
+    results = []
+    try:
+        for conv in conv_list:
+            results.extend(get_conversation_messages(slack_connection, conv, timeframe, checkpoints, journal))
+            if edits:
+                results.extend(get_conversation_edited_messages(slack_connection, conv, timeframe, checkpoints,
+                                                                journal))
+    finally:
+        if slack_connection.metrics:
+            slack_connection.metrics.flush()
+
     return results
 
 
 def _mp_file_search_worker(file_list: list,
                            slack_connection: SlackAPI,
-                           results: list,
-                           verbose: bool) -> list:
+                           verbose: bool,
+                           journal: scan_journal.ScanJournal = None) -> list:
     """ MULTIPROCESSING WORKER - Iterates through a list of conversation IDs
     and gets recent messages for each
 
     Args:
         file_list: List of file information in dict format from the discovery.files.list endpoint
         slack_connection: Slack API object
-        results: MP results list to pass back to calling function
         verbose: Whether to use verbose logging or not
+        journal: Journal to record completed files in, and reuse them from
     Returns:
         List of File objects
     """
 
-    for f in file_list:
-        file_info = slack_connection.get_file_info(f.get('id'))
-        shares = []
-        if file_info.get('shares'):
-            for share in file_info.get('shares'):
-                if share.get('channel').startswith('D'):
-                    team_id = get_enterprise(slack_connection).id
-                else:
-                    team_id = share.get('team')
-                conv = slack_connection.get_conversation_info(share.get('channel'), team_id)[0]
-                shares.append(conversation.create_from_dict(conv, verbose))
-            file_info['shares'] = shares
-            results.append(post.create_file_from_dict(file_info))
+    results = []
+    try:
+        for f in file_list:
+            if journal:
+                completed = journal.get_completed(scan_journal.FILE, f.get('id'))
+                if completed is not None:
+                    results.extend(completed)
+                    continue
+            file_info = slack_connection.get_file_info(f.get('id'))
+            files = []
+            shares = []
+            if file_info.get('shares'):
+                for share in file_info.get('shares'):
+                    if share.get('channel').startswith('D'):
+                        team_id = get_enterprise(slack_connection).id
+                    else:
+                        team_id = share.get('team')
+                    conv = slack_connection.get_conversation_info(share.get('channel'), team_id)[0]
+                    shares.append(conversation.create_from_dict(conv, verbose))
+                file_info['shares'] = shares
+                files.append(post.create_file_from_dict(file_info))
+            if journal:
+                journal.complete(scan_journal.FILE, f.get('id'), files)
+            results.extend(files)
+    finally:
+        if slack_connection.metrics:
+            slack_connection.metrics.flush()
 
     return results
 
 
-def _mp_find_messages_worker(sig: signature.Signature,
+def _mp_find_messages_worker(message_list: List[Dict],
+                             signature_list: List[signature.CompiledSignature],
                              slack_connection: SlackAPI,
-                             users_list: List[user.User],
-                             message_list: List[Dict],
-                             workspaces_list: List[workspace.Workspace],
-                             results,
-                             verbose: bool):
-    """ MULTIPROCESSING WORKER - Iterates through lists of messages to find matches against a signature
+                             enterprise_directory: directory.EnterpriseDirectory,
+                             verbose: bool,
+                             matcher: prefilter.SearchStringMatcher = None):
+    """ MULTIPROCESSING WORKER - Searches a list of messages with every signature
 
     Args:
-        sig: Signature objects
-        users_list: List of User objects from the Enterprise
-        message_list: List of Message objects
-        workspaces_list: List of Workspaces objects from the Enterprise
-        results: MP results list to pass back to calling function
+        message_list: List of messages
+        signature_list: Signatures to search with
+        slack_connection: Slack API object
+        enterprise_directory: Users and workspaces in the Enterprise
         verbose: Whether to use verbose logging or not
+        matcher: Search string matcher built from the signatures for the messages scope
     Returns:
-        List of Message objects that match the signature
+        List of (signature index, match) for each match
     """
 
-    for query in sig.search_strings:
-        message_list = [message for message in message_list if _message_block_search(message, query)]
-        for message in message_list:
-            for pattern in sig.patterns:
-                r = re.compile(pattern)
-                workspace = next(
-                    (item for item in workspaces_list if item.id == message.get('team')), None)
-
-                match_string = _regex_search_message(message, r)
-                if match_string:
-                    conv_info = slack_connection.get_conversation_info(message.get('conv_id'),
-                                                                       message.get('conv_team'))[0]
-
-                    shared = []
-                    if conv_info.get('shared').get('shared_team_ids'):
-                        for wrk_id in conv_info.get('shared').get('shared_team_ids'):
-                            shared.append(slack_connection.get_team_info(wrk_id))
-                    conv_info['shared'] = shared
-                    conv_info = conversation.create_from_dict(conv_info, verbose)
-                    message['conversation'] = conv_info
-                    message = post.create_message_from_dict(message)
-                    post_user = next(
-                        (item for item in users_list if item.id == message.user), None)
-
-                    if workspace:
-                        url = f'https://{workspace.domain}.slack.com/archives/{message.conversation.id}' \
-                              f'/p{message.timestamp}'
-                    else:
-                        url = None
-                    if _location_verification(message.conversation, sig):
-                        results.append({
-                            'match_string': match_string,
-                            'message': message,
-                            'url': url,
-                            'user': post_user,
-                            'workspace': workspace
-                        })
+    results = []
+    try:
+        results.extend(match_messages(signature_list, slack_connection, enterprise_directory, message_list, verbose,
+                                      matcher))
+    finally:
+        if slack_connection.metrics:
+            slack_connection.metrics.flush()
 
     return results
 
 
-def _mp_find_files_worker(sig: signature.Signature,
-                          users_list: List[user.User],
-                          file_list: List[post.File],
-                          results):
-    """ MULTIPROCESSING WORKER - Iterates through lists of files to find matches against a signature
+def _mp_find_files_worker(file_list: List[post.File],
+                          signature_list: List[signature.CompiledSignature],
+                          enterprise_directory: directory.EnterpriseDirectory,
+                          matcher: prefilter.SearchStringMatcher = None):
+    """ MULTIPROCESSING WORKER - Searches a list of files with every signature
 
     Args:
-        sig: Signature objects
-        users_list: List of User objects from the Enterprise
         file_list: List of File objects
-        results: MP results list to pass back to calling function
+        signature_list: Signatures to search with
+        enterprise_directory: Users and workspaces in the Enterprise
+        matcher: Search string matcher built from the signatures for the files scope
     Returns:
-        List of files that have matched the given signature
+        List of (signature index, match) for each match
+    """
+
+    return match_files(signature_list, enterprise_directory, file_list, matcher)
+
+
+def _mp_pool_find_messages_worker(positions: List[int],
+                                  signature_list: List[signature.CompiledSignature],
+                                  slack_connection: SlackAPI,
+                                  enterprise_directory: directory.EnterpriseDirectory,
+                                  message_list: List[Dict],
+                                  message_matcher: prefilter.SearchStringMatcher,
+                                  verbose: bool):
+    """ MULTIPROCESSING WORKER - Searches messages held by a search pool with every signature
 
+    Args:
+        positions: Positions of the messages to search
+        signature_list: Signatures the pool was created with
+        slack_connection: Slack API object
+        enterprise_directory: Users and workspaces in the Enterprise
+        message_list: Messages the pool was created with
+        message_matcher: Search string matcher built from the signatures for the messages scope
+        verbose: Whether to use verbose logging or not
+    Returns:
+        List of (signature index, match) for each match
     """
 
-    for query in sig.search_strings:
-        for target_file in file_list:
-            if sig.file_types:
-                for file_type in sig.file_types:
-                    if file_type.lower() in target_file.filetype.lower() \
-                            and str(query.lower()) in target_file.title.lower():
-                        for conv in target_file.shares:
-                            if _location_verification(conv, sig):
-                                file_user = next((item for item in users_list if item.id == target_file.user),
-                                                 None)
-                                results_dict = {
-                                    'file': target_file,
-                                    'conversation': conv,
-                                    'user': file_user
-                                }
-
-                                results.append(results_dict)
-            else:
-                if str(query.lower()) in target_file.title.lower():
-                    for conv in target_file.shares:
-                        if _location_verification(conv, sig):
-                            file_user = next((item for item in users_list if item.id == target_file.user),
-                                             None)
-                            results_dict = {
-                                'file': target_file,
-                                'conversation': conv,
-                                'user': file_user
-                            }
-
-                            results.append(results_dict)
+    return _mp_find_messages_worker([message_list[position] for position in positions], signature_list,
+                                    slack_connection, enterprise_directory, verbose, message_matcher)
 
-    return results
+
+def _mp_pool_find_files_worker(positions: List[int],
+                               signature_list: List[signature.CompiledSignature],
+                               enterprise_directory: directory.EnterpriseDirectory,
+                               files_list: List[post.File],
+                               file_matcher: prefilter.SearchStringMatcher):
+    """ MULTIPROCESSING WORKER - Searches files held by a search pool with every signature
+
+    Args:
+        positions: Positions of the files to search
+        signature_list: Signatures the pool was created with
+        enterprise_directory: Users and workspaces in the Enterprise
+        files_list: Files the pool was created with
+        file_matcher: Search string matcher built from the signatures for the files scope
+    Returns:
+        List of (signature index, match) for each match
+    """
+
+    return _mp_find_files_worker([files_list[position] for position in positions], signature_list,
+                                 enterprise_directory, file_matcher)
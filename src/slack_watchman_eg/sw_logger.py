@@ -1,4 +1,3 @@
-import json
 import dataclasses
 import logging
 import sys
@@ -9,6 +8,8 @@ from logging import Logger
 from typing import Any, Dict
 from colorama import Fore, Back, Style, init
 
+from . import json_codec
+
 
 class StdoutLogger:
     def __init__(self, **kwargs):
@@ -196,11 +197,18 @@ class StdoutLogger:
         print(' '.ljust(79) + Fore.GREEN)
 
 
-class EnhancedJSONEncoder(json.JSONEncoder):
-    def default(self, o):
-        if dataclasses.is_dataclass(o):
-            return dataclasses.asdict(o)
-        return super().default(o)
+class _JSONFormatter(logging.Formatter):
+    """ Formats each record with the format for its kind of output, NOTIFY, SUCCESS or the
+    rest. The format is picked per record, so records logged at the same time by different
+    threads each get their own """
+
+    def __init__(self, formats: Dict[str, logging.Formatter], default: str):
+        super().__init__()
+        self.formats = formats
+        self.default = default
+
+    def format(self, record: logging.LogRecord) -> str:
+        return self.formats.get(getattr(record, 'output_format', self.default)).format(record)
 
 
 class JSONLogger(Logger):
@@ -215,6 +223,8 @@ class JSONLogger(Logger):
             '{"timestamp": "%(asctime)s", "level": "SUCCESS", "message": "%(message)s"}')
         self.logger = logging.getLogger(self.name)
         self.handler = logging.StreamHandler(sys.stdout)
+        self.handler.setFormatter(_JSONFormatter(
+            {'NOTIFY': self.notify_format, 'INFO': self.info_format, 'SUCCESS': self.success_format}, 'INFO'))
         self.logger.addHandler(self.handler)
         if kwargs.get('debug'):
             self.logger.setLevel(logging.DEBUG)
@@ -229,24 +239,18 @@ class JSONLogger(Logger):
             log_data: str or Dict,
             **kwargs):
         if level.upper() == 'NOTIFY':
-            self.handler.setFormatter(self.notify_format)
             self.logger.info(
-                json.dumps(
-                    log_data,
-                    cls=EnhancedJSONEncoder),
+                json_codec.dumps(log_data),
                 extra={
+                    'output_format': 'NOTIFY',
                     'scope': kwargs.get('scope', ''),
                     'type': kwargs.get('detect_type', ''),
                     'severity': kwargs.get('severity', '')})
         elif level.upper() == 'INFO':
-            self.handler.setFormatter(self.info_format)
             self.logger.info(log_data)
         elif level.upper() == 'DEBUG':
-            self.handler.setFormatter(self.info_format)
             self.logger.debug(log_data)
         elif level.upper() == 'SUCCESS':
-            self.handler.setFormatter(self.success_format)
-            self.logger.info(log_data)
+            self.logger.info(log_data, extra={'output_format': 'SUCCESS'})
         else:
-            self.handler.setFormatter(self.info_format)
             self.logger.critical(log_data)
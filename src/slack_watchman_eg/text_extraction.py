@@ -0,0 +1,173 @@
+import bisect
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+from .models import post
+
+# Text the Discovery API gives for messages it can't display, e.g. ones made only of blocks
+CANT_BE_DISPLAYED = 'This content can’t be displayed.'
+# Placed between separate parts of a post, e.g. paragraphs, fields and attachments
+SEPARATOR = '\n'
+# Fields of an attachment holding text, in the order they are shown
+ATTACHMENT_FIELDS = ('pretext', 'author_name', 'title', 'text', 'footer')
+
+
+@dataclass(slots=True)
+class PostText:
+    """ All the text in a post, flattened into one string. The start of each part of the
+    post the text came from is recorded, so a position in the string can be traced back
+    to the part of the post it is in"""
+
+    text: str
+    parts: Tuple[Tuple[int, str], ...]
+
+    def locate(self, offset: int) -> Tuple[str, int] or None:
+        """ Find which part of the post a position in the text is in
+
+        Args:
+            offset: Position in the text, e.g. the start of a match
+        Returns:
+            Path of the part in the post, e.g. blocks[0].fields[1], and the position within
+            it. None if there is no text
+        """
+
+        index = bisect.bisect_right(self.parts, offset, key=lambda part: part[0]) - 1
+        if index < 0:
+            return None
+        start, path = self.parts[index]
+        return path, offset - start
+
+
+class _TextBuilder(object):
+    """ Joins the text of each part of a post, recording where each part starts """
+
+    def __init__(self):
+        self._pieces: List[str] = []
+        self._parts: List[Tuple[int, str]] = []
+        self._length = 0
+        self._separate = False
+
+    def add(self, text: str, path: str) -> None:
+        """ Add the text of a part of the post, run on from the text before it """
+
+        if not isinstance(text, str) or not text:
+            return
+        if self._separate and self._pieces:
+            self._pieces.append(SEPARATOR)
+            self._length += len(SEPARATOR)
+        self._separate = False
+        self._parts.append((self._length, path))
+        self._pieces.append(text)
+        self._length += len(text)
+
+    def separate(self) -> None:
+        """ Start a new part of the post, e.g. a new paragraph """
+
+        self._separate = True
+
+    def build(self) -> PostText:
+        return PostText(''.join(self._pieces), tuple(self._parts))
+
+
+def extract_message(message: Dict) -> PostText:
+    """ Flatten every part of a message holding text into one string: the text of the
+    message, its blocks and its attachments.
+
+    Rich text blocks hold the same content as the text of the message, so are only used
+    when the message has no text, or the text is the placeholder the Discovery API gives
+    when it can't display the message.
+
+    Args:
+        message: Message from the Discovery API
+    Returns:
+        Text of the message, and where each part of it came from
+    """
+
+    builder = _TextBuilder()
+    text = message.get('text')
+    has_text = bool(text) and text != CANT_BE_DISPLAYED
+    if has_text:
+        builder.add(text, 'text')
+    _add_blocks(builder, message.get('blocks'), 'blocks', skip_rich_text=has_text)
+    _add_attachments(builder, message.get('attachments'), 'attachments')
+
+    return builder.build()
+
+
+def extract_draft(draft: post.Draft or post.DraftSuccinct) -> PostText:
+    """ Flatten every part of a draft holding text into one string: its blocks and its
+    attachments
+
+    Args:
+        draft: Draft object
+    Returns:
+        Text of the draft, and where each part of it came from
+    """
+
+    builder = _TextBuilder()
+    _add_blocks(builder, draft.blocks, 'blocks')
+    _add_attachments(builder, draft.attachments, 'attachments')
+
+    return builder.build()
+
+
+def _add_blocks(builder: _TextBuilder, blocks: List[Dict], path: str, skip_rich_text: bool = False) -> None:
+    for i, block in enumerate(blocks or []):
+        block_type = block.get('type')
+        block_path = f'{path}[{i}]'
+        if block_type == 'rich_text':
+            if not skip_rich_text:
+                _add_rich_text(builder, block.get('elements'), f'{block_path}.elements')
+            continue
+        if block_type == 'context':
+            for j, element in enumerate(block.get('elements') or []):
+                builder.separate()
+                builder.add(_text_object(element), f'{block_path}.elements[{j}]')
+            continue
+        # Section, header and other blocks with a text object
+        builder.separate()
+        builder.add(_text_object(block.get('text')), f'{block_path}.text')
+        for j, field in enumerate(block.get('fields') or []):
+            builder.separate()
+            builder.add(_text_object(field), f'{block_path}.fields[{j}]')
+
+
+def _add_rich_text(builder: _TextBuilder, elements: List[Dict], path: str) -> None:
+    """ Add rich text elements. Sections, lists, quotes and preformatted text are separate
+    parts, while the runs of text and links within them run on from each other """
+
+    for i, element in enumerate(elements or []):
+        element_path = f'{path}[{i}]'
+        if 'elements' in element:
+            builder.separate()
+            _add_rich_text(builder, element.get('elements'), f'{element_path}.elements')
+            builder.separate()
+        elif element.get('type') == 'text':
+            builder.add(element.get('text'), element_path)
+        elif element.get('type') == 'link':
+            # The URL can hold secrets as well as the text shown for it
+            builder.add(element.get('text'), element_path)
+            builder.separate()
+            builder.add(element.get('url'), f'{element_path}.url')
+            builder.separate()
+
+
+def _add_attachments(builder: _TextBuilder, attachments: List[Dict], path: str) -> None:
+    for i, attachment in enumerate(attachments or []):
+        attachment_path = f'{path}[{i}]'
+        for field in ATTACHMENT_FIELDS:
+            builder.separate()
+            builder.add(attachment.get(field), f'{attachment_path}.{field}')
+        for j, field in enumerate(attachment.get('fields') or []):
+            builder.separate()
+            builder.add(field.get('title'), f'{attachment_path}.fields[{j}].title')
+            builder.separate()
+            builder.add(field.get('value'), f'{attachment_path}.fields[{j}].value')
+        _add_blocks(builder, attachment.get('blocks'), f'{attachment_path}.blocks')
+
+
+def _text_object(text_object: Dict) -> str or None:
+    """ Get the text from a Block Kit text object, e.g. {'type': 'mrkdwn', 'text': '...'} """
+
+    if isinstance(text_object, dict):
+        return text_object.get('text')
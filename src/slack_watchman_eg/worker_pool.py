@@ -0,0 +1,154 @@
+import contextlib
+import gc
+import inspect
+import multiprocessing
+import threading
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Tuple
+
+# Set in each worker process by the pool initializer
+_worker_func: Callable = None
+_worker_shared: Dict[str, Any] = {}
+
+# Number of threads starting worker processes with the heap frozen
+_freeze_count = 0
+_freeze_lock = threading.Lock()
+
+
+def _initialise(func: Callable, shared: Dict[str, Any]):
+    global _worker_func, _worker_shared
+    _worker_func = func
+    _worker_shared = shared
+
+
+@contextlib.contextmanager
+def frozen_heap():
+    """ Share the parent's objects with worker processes started inside the block, rather
+    than each worker process holding its own copy.
+
+    When worker processes are forked, the objects given to them, such as the Enterprise
+    directory and messages to search, are inherited from the parent without being copied.
+    The pages holding them are only copied once written to, and the garbage collector
+    would write to every one of them. Freezing the heap first moves the existing objects
+    out of its reach in the worker processes, so memory use doesn't grow with the number
+    of processes. Worker processes that are spawned, rather than forked, are unaffected.
+    """
+
+    global _freeze_count
+    if multiprocessing.get_start_method() != 'fork':
+        yield
+        return
+
+    with _freeze_lock:
+        if not _freeze_count:
+            gc.freeze()
+        _freeze_count += 1
+    try:
+        yield
+    finally:
+        with _freeze_lock:
+            _freeze_count -= 1
+            if not _freeze_count:
+                gc.unfreeze()
+
+
+def _run_task(task: Any) -> List:
+    return _worker_func(task, **_worker_shared)
+
+
+def _run_pool_task(func_task: Tuple[Callable, Any]) -> List:
+    func, task = func_task
+    parameters = inspect.signature(func).parameters
+    return func(task, **{name: value for name, value in _worker_shared.items() if name in parameters})
+
+
+def imap_unordered(func: Callable[..., List],
+                   tasks: Iterable,
+                   processes: int,
+                   **shared) -> Iterator[List]:
+    """ Run a worker function over tasks in a pool of processes, yielding each task's
+    results as a single batch as soon as the task finishes.
+
+    Objects shared by every task, such as the Slack API connection, are given to the
+    worker processes once when the pool starts, rather than being sent with each task.
+    Forked worker processes share them with the parent, see frozen_heap().
+    Only the task itself and its list of results are sent between processes.
+
+    Args:
+        func: Module level worker function, called as func(task, **shared)
+        tasks: Work for the worker function, e.g. chunks of conversations
+        processes: Number of worker processes to use
+        shared: Keyword arguments passed to every call of the worker function
+    Returns:
+        List of results from each task, in the order the tasks finish
+    """
+
+    tasks = list(tasks)
+    if not tasks:
+        return
+    processes = max(1, min(processes, len(tasks)))
+    with frozen_heap():
+        pool = multiprocessing.Pool(processes, initializer=_initialise, initargs=(func, shared))
+    with pool:
+        yield from pool.imap_unordered(_run_task, tasks)
+
+
+class WorkerPool(object):
+    """ A pool of worker processes that keeps running between batches of tasks, so it can
+    be reused by every signature in a scan.
+
+    Objects shared by every task, such as the user directory and the messages to search,
+    are given to the worker processes once when the pool starts. Tasks then only need to
+    refer to them, e.g. by the index of a signature and the positions of messages. Worker
+    functions are passed the shared objects they have parameters for.
+
+    The worker processes are started by the first batch of tasks, and stopped by close()."""
+
+    def __init__(self, processes: int, **shared):
+        self.processes = max(1, processes)
+        self._shared = shared
+        self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type:
+            self.terminate()
+        else:
+            self.close()
+
+    def imap_unordered(self, func: Callable[..., List], tasks: Iterable) -> Iterator[List]:
+        """ Run a worker function over tasks in the pool, yielding each task's results as
+        a single batch as soon as the task finishes.
+
+        Args:
+            func: Module level worker function, called as func(task, **shared)
+            tasks: Work for the worker function
+        Returns:
+            List of results from each task, in the order the tasks finish
+        """
+
+        tasks = [(func, task) for task in tasks]
+        if not tasks:
+            return
+        if self._pool is None:
+            with frozen_heap():
+                self._pool = multiprocessing.Pool(self.processes, initializer=_initialise,
+                                                  initargs=(None, self._shared))
+        yield from self._pool.imap_unordered(_run_pool_task, tasks)
+
+    def close(self) -> None:
+        """ Stop the worker processes once their tasks have finished """
+
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def terminate(self) -> None:
+        """ Stop the worker processes straight away """
+
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
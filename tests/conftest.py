@@ -0,0 +1,147 @@
+import calendar
+import random
+import re
+import time
+from typing import Dict, List, Set, Tuple
+
+import pytest
+
+from slack_watchman_eg import (
+    directory,
+    fake_discovery,
+    rate_limiter,
+    slack_wrapper,
+    sw_logger
+)
+from slack_watchman_eg.models import signature
+
+ALL_LOCATIONS = ['public', 'private', 'mpim', 'im']
+# Seconds before now that generated posts are spread across
+SPAN = 3600
+
+
+def make_signature(name: str,
+                   scope: List[str],
+                   search_strings: List[str],
+                   patterns: List[str],
+                   locations: List[str] = None,
+                   file_types: List[str] = None) -> signature.CompiledSignature:
+    return signature.compile_signature(signature.Signature(
+        name=name,
+        status='enabled',
+        author='test',
+        date='2023-04-14',
+        version='1.0',
+        description=name,
+        severity=70,
+        watchman_apps={'slack_eg': {}},
+        scope=scope,
+        file_types=file_types or [],
+        locations=locations or ALL_LOCATIONS,
+        test_cases=signature.TestCases(match_cases=[], fail_cases=[]),
+        search_strings=search_strings,
+        patterns=patterns))
+
+
+def sample_texts() -> List[str]:
+    """ Texts to compare searches against, including edge cases for case, overlapping
+    search strings, non-ASCII characters and characters RE2 reads differently to Python """
+
+    rng = random.Random(0)
+    texts = ['', 'PASSWORD', 'Passwords: hunter2', 'mykey', 'ke', 'sswor', 'server.pem\nkey',
+             'é password=ünïcode', 'key\x0bvalue']
+    for _ in range(300):
+        text = fake_discovery._random_text(rng, 0.3)
+        if rng.random() < 0.3:
+            text = text.upper()
+        texts.append(text)
+    return texts
+
+
+def baseline_message_matches(signature_list: List[signature.CompiledSignature],
+                             dataset: Dict) -> Set[Tuple[str, str, str, str]]:
+    """ Find the matches in every message of a dataset the way signatures were searched
+    before the prefilter and pattern sets: each signature in turn, checking its search
+    strings and then each of its patterns with re
+
+    Returns:
+        Signature name, conversation ID, message timestamp and match string of each match
+    """
+
+    expected = set()
+    for conv_id, messages in dataset.get('history').items():
+        info = dataset.get('conversations').get(conv_id)
+        for sig in signature_list:
+            if 'messages' not in sig.scope:
+                continue
+            if (info.get('is_im') and 'im' not in sig.locations) \
+                    or (info.get('is_mpim') and 'mpim' not in sig.locations) \
+                    or (info.get('is_private') and 'private' not in sig.locations):
+                continue
+            for message in messages:
+                text = message.get('text')
+                if not any(search_string in text.lower() for search_string in sig.search_strings):
+                    continue
+                for pattern in sig.signature.patterns:
+                    match = re.search(pattern, text)
+                    if match:
+                        expected.add((sig.name, conv_id, message.get('ts'), match.group(0)))
+    return expected
+
+
+def found_message_matches(signature_list: List[signature.CompiledSignature],
+                          matches: List[List[Dict]]) -> Set[Tuple[str, str, str, str]]:
+    return {(sig.name, result.get('message').get('conversation').get('id'), result.get('message').get('timestamp'),
+             result.get('match_string'))
+            for sig, results in zip(signature_list, matches) for result in results}
+
+
+@pytest.fixture
+def signature_list() -> List[signature.CompiledSignature]:
+    return [
+        make_signature('AWS API Tokens', ['messages', 'drafts'], ['aws_access_key_id', 'AKIA'],
+                       [r'AKIA[0-9A-Z]{16}']),
+        make_signature('Passwords', ['messages', 'drafts'], ['password'], [r'(?i)password[:=]\s*\S+'],
+                       locations=['public', 'private']),
+        make_signature('Slack Tokens', ['messages'], ['xox'], [r'xox[baprs]-[0-9a-zA-Z-]{10,48}']),
+        # An empty search string leaves every message to be searched with the patterns
+        make_signature('Private Keys', ['messages'], [''], [r'-----BEGIN [A-Z ]*PRIVATE KEY-----']),
+        make_signature('Certificate Files', ['files'], ['.pem'], [], file_types=['pem'])
+    ]
+
+
+@pytest.fixture
+def timeframe() -> int:
+    return calendar.timegm(time.gmtime()) - SPAN - 60
+
+
+@pytest.fixture
+def dataset() -> Dict:
+    return fake_discovery.generate_dataset(conversations=12, messages_per_conversation=40, files=20,
+                                           drafts_per_workspace=2, users=20, secret_rate=0.2, span=SPAN, seed=7)
+
+
+@pytest.fixture
+def fake_server(dataset):
+    with fake_discovery.FakeDiscoveryServer(dataset) as server:
+        yield server
+
+
+@pytest.fixture
+def slack_connection(fake_server) -> slack_wrapper.SlackAPI:
+    connection = slack_wrapper.SlackAPI('xoxp-test', limiter=rate_limiter.RateLimiter(multiplier=1000),
+                                        base_url=fake_server.base_url)
+    yield connection
+    connection.session.close()
+
+
+@pytest.fixture
+def enterprise_directory(slack_connection) -> directory.EnterpriseDirectory:
+    workspaces_list = slack_wrapper.get_workspaces(slack_connection, verbose=True)
+    users_list = slack_wrapper.get_users(slack_connection, workspaces_list, verbose=True)
+    return directory.EnterpriseDirectory(users_list, workspaces_list)
+
+
+@pytest.fixture
+def logger() -> sw_logger.JSONLogger:
+    return sw_logger.JSONLogger()
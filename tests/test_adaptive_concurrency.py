@@ -0,0 +1,95 @@
+import types
+
+import pytest
+
+from slack_watchman_eg import adaptive_concurrency, fake_discovery, rate_limiter, slack_wrapper
+
+
+class _Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+class _Logger(object):
+    def __init__(self):
+        self.messages = []
+
+    def log(self, mes_type, message):
+        self.messages.append((mes_type, message))
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(adaptive_concurrency, 'time', types.SimpleNamespace(monotonic=clock.monotonic))
+    return clock
+
+
+def test_limit_grows_by_one_per_limit_of_responses(clock):
+    controller = adaptive_concurrency.AdaptiveConcurrency(initial=8)
+
+    for _ in range(8):
+        controller.record(0.1)
+    assert controller.limit == 8
+    controller.record(0.1)
+    assert controller.limit == 9
+    for _ in range(9):
+        controller.record(0.1)
+    assert controller.limit == 10
+    assert controller.peak == pytest.approx(controller._limit)
+
+
+def test_rate_limit_halves_once_per_round_trip(clock):
+    controller = adaptive_concurrency.AdaptiveConcurrency(initial=64)
+    controller.record(0.5)
+
+    # Responses to requests sent together only back off once
+    for _ in range(10):
+        controller.record(0.5, rate_limited=True)
+    assert controller.limit == 32
+
+    clock.now += 1
+    controller.record(0.5, rate_limited=True)
+    assert controller.limit == 16
+
+
+def test_rising_latency_reduces_limit(clock):
+    controller = adaptive_concurrency.AdaptiveConcurrency(initial=100)
+    for _ in range(adaptive_concurrency.WARM_UP_SAMPLES):
+        controller.record(0.1)
+    grown = controller.limit
+
+    clock.now += 10
+    for _ in range(5):
+        controller.record(1.0)
+
+    assert controller.limit < grown
+    assert controller.limit >= int(grown * adaptive_concurrency.LATENCY_BACKOFF)
+
+
+def test_limit_stays_within_bounds(clock):
+    controller = adaptive_concurrency.AdaptiveConcurrency(initial=50, minimum=2, maximum=10)
+    assert controller.limit == 10
+    for _ in range(100):
+        controller.record(0.1)
+    assert controller.limit == 10
+
+    for _ in range(10):
+        clock.now += 1
+        controller.record(0.1, rate_limited=True)
+    assert controller.limit == 2
+
+
+def test_rate_limited_responses_reduce_limit(dataset, timeframe):
+    logger = _Logger()
+    controller = adaptive_concurrency.AdaptiveConcurrency(initial=16, logger=logger)
+    with fake_discovery.FakeDiscoveryServer(dataset, rate_limit_every=5, retry_after=0) as server:
+        connection = slack_wrapper.SlackAPI('xoxp-test', limiter=rate_limiter.RateLimiter(multiplier=1000),
+                                            base_url=server.base_url, controller=controller)
+        for conv_id, messages in dataset.get('history').items():
+            assert len(connection.get_conversation_history(conv_id, oldest=timeframe)) == len(messages)
+
+    assert any(message.startswith('Slack API rate limit reached') for _, message in logger.messages)
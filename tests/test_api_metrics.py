@@ -0,0 +1,64 @@
+import multiprocessing
+
+from slack_watchman_eg import api_metrics, fake_discovery, rate_limiter, slack_wrapper
+
+HISTORY = 'discovery.conversations.history'
+
+
+def _flush_from_worker(metrics):
+    metrics.record_call(HISTORY)
+    metrics.record_request(HISTORY, 0.2, 100, rate_limited=True)
+    metrics.flush()
+
+
+def test_paginated_call_counts_once(dataset, tmp_path, timeframe):
+    metrics = api_metrics.ApiMetrics(tmp_path / 'spool')
+    conv_id, messages = next(iter(dataset.get('history').items()))
+    with fake_discovery.FakeDiscoveryServer(dataset, page_size=7) as server:
+        connection = slack_wrapper.SlackAPI('xoxp-test', limiter=rate_limiter.RateLimiter(multiplier=1000),
+                                            base_url=server.base_url, metrics=metrics)
+        history = connection.get_conversation_history(conv_id, oldest=timeframe)
+
+    stats = metrics.collect().get(HISTORY)
+    pages = -(-len(messages) // 7)
+    assert len(history) == len(messages)
+    assert stats.get('calls') == 1
+    assert stats.get('pages') == stats.get('requests') == pages
+    assert sum(stats.get('latency_buckets')) == pages
+    assert stats.get('bytes_received') > 0
+
+
+def test_collect_merges_worker_processes(tmp_path):
+    metrics = api_metrics.ApiMetrics(tmp_path / 'spool')
+    metrics.record_call(HISTORY)
+    metrics.record_request(HISTORY, 0.01, 50)
+    metrics.record_wait(HISTORY, 1.5)
+
+    worker = multiprocessing.get_context('fork').Process(target=_flush_from_worker, args=(metrics,))
+    worker.start()
+    worker.join()
+
+    stats = metrics.collect().get(HISTORY)
+    assert (stats.get('calls'), stats.get('requests'), stats.get('bytes_received')) == (2, 2, 150)
+    assert (stats.get('rate_limited'), stats.get('rate_limit_waits'), stats.get('rate_limit_wait_seconds')) == \
+        (1, 1, 1.5)
+    assert stats.get('latency_buckets')[0] == 1
+    assert stats.get('latency_buckets')[api_metrics.LATENCY_BUCKETS.index(0.25)] == 1
+
+
+def test_write_prometheus(tmp_path):
+    metrics = api_metrics.ApiMetrics(tmp_path / 'spool')
+    metrics.record_call(HISTORY)
+    metrics.record_request(HISTORY, 0.3, 10)
+    metrics.record_request(HISTORY, 60, 10)
+    path = tmp_path / 'api_metrics.prom'
+
+    api_metrics.write_prometheus(metrics.collect(), path)
+
+    lines = path.read_text().splitlines()
+    name = f'{api_metrics.PROMETHEUS_PREFIX}_request_duration_seconds'
+    assert f'{api_metrics.PROMETHEUS_PREFIX}_calls_total{{method="{HISTORY}"}} 1' in lines
+    assert f'{name}_bucket{{method="{HISTORY}",le="0.25"}} 0' in lines
+    assert f'{name}_bucket{{method="{HISTORY}",le="0.5"}} 1' in lines
+    assert f'{name}_bucket{{method="{HISTORY}",le="+Inf"}} 2' in lines
+    assert f'{name}_count{{method="{HISTORY}"}} 2' in lines
@@ -0,0 +1,34 @@
+import pytest
+
+from slack_watchman_eg import async_slack_wrapper, checkpoint, rate_limiter, slack_wrapper
+
+
+@pytest.fixture
+def async_connection(fake_server):
+    connection = async_slack_wrapper.AsyncSlackAPI('xoxp-test', concurrency=4,
+                                                   limiter=rate_limiter.RateLimiter(multiplier=1000),
+                                                   base_url=fake_server.base_url)
+    yield connection
+    connection.close()
+
+
+def test_get_all_messages(async_connection, slack_connection, timeframe):
+    messages = async_connection.run(async_slack_wrapper.get_all_messages(async_connection, timeframe, edits=True))
+
+    expected = slack_wrapper.get_all_messages(slack_connection, 2, timeframe, edits=True)
+    assert sorted((m.get('conv_id'), m.get('ts')) for m in messages) == \
+        sorted((m.get('conv_id'), m.get('ts')) for m in expected)
+
+
+def test_get_all_files_with_checkpoints(tmp_path, dataset, async_connection, timeframe):
+    path = tmp_path / 'checkpoints.db'
+    store = checkpoint.CheckpointStore(path)
+    files = async_connection.run(async_slack_wrapper.get_all_files(async_connection, True, timeframe,
+                                                                   checkpoints=store))
+    assert sorted(f.id for f in files) == sorted(f.get('id') for f in dataset.get('files').values()
+                                                 if f.get('shares'))
+    store.commit()
+
+    store = checkpoint.CheckpointStore(path)
+    assert async_connection.run(async_slack_wrapper.get_all_files(async_connection, True, timeframe,
+                                                                  checkpoints=store)) == []
@@ -0,0 +1,88 @@
+import pytest
+import requests
+
+from slack_watchman_eg import cassette, fake_discovery, rate_limiter, slack_wrapper
+
+from conftest import baseline_message_matches, found_message_matches
+
+
+def _connection(base_url):
+    return slack_wrapper.SlackAPI('xoxp-test', limiter=rate_limiter.RateLimiter(multiplier=1000),
+                                  base_url=base_url)
+
+
+def test_replay_without_server(tmp_path, signature_list, dataset, fake_server, enterprise_directory, logger,
+                               timeframe):
+    recording = _connection(fake_server.base_url)
+    cassette.use_cassette(recording, tmp_path, cassette.RECORD)
+    recorded = slack_wrapper.get_all_messages(recording, 2, timeframe)
+    slack_wrapper.search_message_matches(signature_list, recording, enterprise_directory, recorded, 2, logger,
+                                         True, raise_errors=True)
+    assert list(tmp_path.glob('*.json'))
+    fake_server.stop()
+
+    replaying = _connection(fake_server.base_url)
+    cassette.use_cassette(replaying, tmp_path, cassette.REPLAY)
+    # Timestamps are left out of the recorded requests, so a later timeframe still replays
+    replayed = slack_wrapper.get_all_messages(replaying, 2, timeframe + 1)
+    matches = slack_wrapper.search_message_matches(signature_list, replaying, enterprise_directory, replayed, 2,
+                                                   logger, True, raise_errors=True)
+
+    assert sorted((m.get('conv_id'), m.get('ts')) for m in replayed) == \
+        sorted((m.get('conv_id'), m.get('ts')) for m in recorded)
+    assert found_message_matches(signature_list, matches) == baseline_message_matches(signature_list, dataset)
+
+
+def test_replay_pages(tmp_path, dataset, timeframe):
+    with fake_discovery.FakeDiscoveryServer(dataset, page_size=7) as server:
+        recording = _connection(server.base_url)
+        cassette.use_cassette(recording, tmp_path, cassette.RECORD)
+        recorded = slack_wrapper.get_all_messages(recording, 2, timeframe, edits=True)
+        # Every page is recorded separately, none overwriting another
+        assert server.method_counts.get('discovery.conversations.history') > len(dataset.get('history'))
+        assert len(list(tmp_path.glob('*.json'))) == server.request_count
+
+    replaying = _connection(server.base_url)
+    cassette.use_cassette(replaying, tmp_path, cassette.REPLAY)
+    replayed = slack_wrapper.get_all_messages(replaying, 2, timeframe + 1, edits=True)
+
+    expected = sorted((conv_id, m.get('ts')) for conv_id, messages in dataset.get('history').items() for m in messages)
+    assert sorted((m.get('conv_id'), m.get('ts')) for m in recorded) == expected
+    assert sorted((m.get('conv_id'), m.get('ts'), m.get('text')) for m in replayed) == \
+        sorted((m.get('conv_id'), m.get('ts'), m.get('text')) for m in recorded)
+
+
+def test_page_cursors_not_masked():
+    def key(latest, cursors=frozenset()):
+        request = requests.Request('GET', 'http://127.0.0.1/api/discovery.conversations.history',
+                                   params={'channel': 'C1', 'oldest': '1700000000', 'latest': latest}).prepare()
+        return cassette._interaction_key(request, cursors)
+
+    cursors = {'1700003000.000100', '1700001000.000200'}
+    assert key('1700003000.000100', cursors) != key('1700001000.000200', cursors)
+    # Timestamps of the timeframe are masked, so recordings replay at any time
+    assert key('1700005000') == key('1700006000')
+
+
+def test_replay_unrecorded_request(tmp_path, fake_server):
+    replaying = _connection(fake_server.base_url)
+    cassette.use_cassette(replaying, tmp_path, cassette.REPLAY)
+
+    with pytest.raises(cassette.CassetteError):
+        replaying.get_enterprise_info()
+    assert fake_server.request_count == 0
+
+
+def test_authorization_not_recorded(tmp_path, fake_server):
+    recording = _connection(fake_server.base_url)
+    cassette.use_cassette(recording, tmp_path, cassette.RECORD)
+    recording.get_enterprise_info()
+
+    recorded = [path.read_text() for path in tmp_path.glob('*.json')]
+    assert len(recorded) == 1
+    assert 'xoxp-test' not in recorded[0]
+
+
+def test_unknown_mode(tmp_path):
+    with pytest.raises(cassette.CassetteError):
+        cassette.CassetteAdapter(tmp_path, 'rewind')
@@ -0,0 +1,92 @@
+import calendar
+import time
+
+from slack_watchman_eg import checkpoint, slack_wrapper
+
+
+def test_since_uses_committed_marks(tmp_path):
+    store = checkpoint.CheckpointStore(tmp_path / 'checkpoints.db')
+
+    assert store.since(checkpoint.CONVERSATION, 'C1', 100) == 100
+    store.advance(checkpoint.CONVERSATION, 'C1', 200)
+    assert store.get(checkpoint.CONVERSATION, 'C1') is None
+    assert store.since(checkpoint.CONVERSATION, 'C1', 100) == 100
+
+    assert store.commit() == 1
+    assert store.since(checkpoint.CONVERSATION, 'C1', 100) == 200
+    # The timeframe is always the furthest back entries are fetched from
+    assert store.since(checkpoint.CONVERSATION, 'C1', 300) == 300
+
+
+def test_uncommitted_run_does_not_move_marks(tmp_path):
+    path = tmp_path / 'checkpoints.db'
+    checkpoint.CheckpointStore(path).advance(checkpoint.FILES, checkpoint.ENTERPRISE, 200)
+
+    assert checkpoint.CheckpointStore(path).get(checkpoint.FILES, checkpoint.ENTERPRISE) is None
+
+
+def test_marks_only_move_forward(tmp_path):
+    store = checkpoint.CheckpointStore(tmp_path / 'checkpoints.db')
+    store.advance(checkpoint.CONVERSATION, 'C1', 200)
+    store.advance(checkpoint.CONVERSATION, 'C1', 150)
+    store.commit()
+
+    older = checkpoint.CheckpointStore(store.path)
+    older.advance(checkpoint.CONVERSATION, 'C1', 100)
+    older.commit()
+
+    assert store.get(checkpoint.CONVERSATION, 'C1') == 200
+
+
+def test_new_entries_in_same_second_as_mark(tmp_path):
+    path = tmp_path / 'checkpoints.db'
+    store = checkpoint.CheckpointStore(path)
+    first = [{'id': 'F1', 'created': 100}, {'id': 'F2', 'created': 100}, {'id': 'F0', 'created': 90}]
+    assert store.new_entries(checkpoint.FILES, checkpoint.ENTERPRISE, first, 'created') == first
+    store.commit()
+
+    store = checkpoint.CheckpointStore(path)
+    second = first + [{'id': 'F3', 'created': 100}, {'id': 'F4', 'created': 110}]
+    assert store.new_entries(checkpoint.FILES, checkpoint.ENTERPRISE, second, 'created') == second[3:]
+    store.commit()
+
+    store = checkpoint.CheckpointStore(path)
+    assert store.new_entries(checkpoint.FILES, checkpoint.ENTERPRISE, second, 'created') == []
+
+
+def test_new_entries_by_nested_field(tmp_path):
+    store = checkpoint.CheckpointStore(tmp_path / 'checkpoints.db')
+    edits = [{'ts': '1.000001', 'edited': {'ts': '50.000002'}}, {'ts': '2.000003', 'edited': {'ts': '40.000004'}}]
+    store.new_entries(checkpoint.CONVERSATION_EDITS, 'C1', edits, 'edited.ts', 'ts')
+    store.commit()
+
+    assert store.get(checkpoint.CONVERSATION_EDITS, 'C1') == 50.000002
+    assert store.new_entries(checkpoint.CONVERSATION_EDITS, 'C1', edits, 'edited.ts', 'ts') == []
+
+
+def test_messages_scanned_once(tmp_path, dataset, slack_connection, timeframe):
+    path = tmp_path / 'checkpoints.db'
+    store = checkpoint.CheckpointStore(path)
+    messages = slack_wrapper.get_all_messages(slack_connection, 2, timeframe, checkpoints=store)
+    assert len(messages) == sum(len(m) for m in dataset.get('history').values())
+    assert store.commit() == len(dataset.get('history'))
+
+    conv_id = next(iter(dataset.get('history')))
+    newest = dataset.get('history').get(conv_id)[0]
+    posted = {
+        'type': 'message',
+        'client_msg_id': 'new',
+        'user': newest.get('user'),
+        'team': newest.get('team'),
+        'text': 'posted after the first scan',
+        'ts': f'{calendar.timegm(time.gmtime()) + 1}.999999'
+    }
+    dataset.get('history').get(conv_id).insert(0, posted)
+
+    store = checkpoint.CheckpointStore(path)
+    messages = slack_wrapper.get_all_messages(slack_connection, 2, timeframe, checkpoints=store)
+    assert [(m.get('conv_id'), m.get('ts')) for m in messages] == [(conv_id, posted.get('ts'))]
+    store.commit()
+
+    store = checkpoint.CheckpointStore(path)
+    assert slack_wrapper.get_all_messages(slack_connection, 2, timeframe, checkpoints=store) == []
@@ -0,0 +1,54 @@
+import dataclasses
+
+import pytest
+
+from slack_watchman_eg import json_codec
+
+
+@dataclasses.dataclass(slots=True)
+class _Point(object):
+    y: int
+    x: int
+
+
+@pytest.fixture(params=json_codec.BACKENDS)
+def backend(request, monkeypatch):
+    if not json_codec._available(request.param):
+        pytest.skip(f'{request.param} is not installed')
+    monkeypatch.setattr(json_codec, 'BACKEND', json_codec.BACKEND)
+    json_codec.set_backend(request.param)
+    return request.param
+
+
+def test_dumps_is_compact_and_ascii(backend):
+    obj = {'match_string': 'pässwörd 🔑\x7f', 'url': None, 'shares': [1, 2.5, True]}
+
+    encoded = json_codec.dumps(obj)
+
+    assert encoded == '{"match_string":"p\\u00e4ssw\\u00f6rd \\ud83d\\udd11\\u007f","url":null,"shares":[1,2.5,true]}'
+    assert json_codec.loads(encoded) == obj
+    assert json_codec.loads(encoded.encode('utf-8')) == obj
+
+
+def test_dumps_dataclasses(backend):
+    assert json_codec.dumps({'b': _Point(1, 2), 'a': [_Point(3, 4)]}, sort_keys=True) == \
+        '{"a":[{"x":4,"y":3}],"b":{"x":2,"y":1}}'
+    assert json_codec.dumps(_Point(1, 2)) == '{"y":1,"x":2}'
+
+
+def test_dumps_values_only_json_accepts(backend):
+    assert json_codec.loads(json_codec.dumps({'big': 2 ** 70})) == {'big': 2 ** 70}
+
+
+def test_dumps_unsupported_type(backend):
+    with pytest.raises(TypeError):
+        json_codec.dumps({'set': {1}})
+
+
+def test_unknown_backend(monkeypatch):
+    monkeypatch.setattr(json_codec, 'BACKEND', json_codec.BACKEND)
+    with pytest.raises(ValueError):
+        json_codec.set_backend('simplejson')
+    monkeypatch.setattr(json_codec, 'ujson', None)
+    with pytest.raises(ImportError):
+        json_codec.set_backend('ujson')
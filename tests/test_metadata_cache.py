@@ -0,0 +1,54 @@
+import multiprocessing
+
+from slack_watchman_eg import metadata_cache, rate_limiter, slack_wrapper
+
+
+def _set_from_worker(cache):
+    cache.set('team.info', 'T2', {'id': 'T2'})
+
+
+def test_get_and_set(tmp_path):
+    cache = metadata_cache.MetadataCache(tmp_path / 'cache.db')
+    cache.set('team.info', 'T1', {'id': 'T1', 'name': 'ünïcode'})
+
+    assert cache.get('team.info', 'T1') == {'id': 'T1', 'name': 'ünïcode'}
+    assert cache.get('team.info', 'T2') is None
+    assert cache.get('discovery.conversations.info', 'T1') is None
+
+
+def test_expired_entries(tmp_path):
+    cache = metadata_cache.MetadataCache(tmp_path / 'cache.db', ttl=-1)
+    cache.set('team.info', 'T1', {'id': 'T1'})
+    cache.set('team.info', 'T2', {'id': 'T2'}, ttl=60)
+
+    assert cache.get('team.info', 'T1') is None
+    assert cache.get('team.info', 'T2') == {'id': 'T2'}
+    assert cache.purge_expired() == 1
+    cache.clear()
+    assert cache.get('team.info', 'T2') is None
+
+
+def test_shared_between_processes_and_runs(tmp_path):
+    cache = metadata_cache.MetadataCache(tmp_path / 'cache.db')
+    worker = multiprocessing.get_context('fork').Process(target=_set_from_worker, args=(cache,))
+    worker.start()
+    worker.join()
+
+    assert cache.get('team.info', 'T2') == {'id': 'T2'}
+    assert metadata_cache.MetadataCache(tmp_path / 'cache.db').get('team.info', 'T2') == {'id': 'T2'}
+
+
+def test_lookups_served_from_cache(tmp_path, dataset, fake_server):
+    team_id = next(iter(dataset.get('teams')))
+    cache = metadata_cache.MetadataCache(tmp_path / 'cache.db')
+
+    def connection():
+        return slack_wrapper.SlackAPI('xoxp-test', limiter=rate_limiter.RateLimiter(multiplier=1000),
+                                      base_url=fake_server.base_url, cache=cache)
+
+    team = connection().get_team_info(team_id)
+    assert fake_server.method_counts.get('team.info') == 1
+
+    # A later run reuses the cached lookup without calling the API
+    assert connection().get_team_info(team_id) == team
+    assert fake_server.method_counts.get('team.info') == 1
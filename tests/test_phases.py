@@ -0,0 +1,85 @@
+import threading
+import time
+
+import pytest
+
+from slack_watchman_eg import phases
+
+
+def test_results_passed_to_required_phases():
+    executor = phases.PhaseExecutor()
+    order = []
+    executor.add('workspaces', lambda: order.append('workspaces') or ['T1'])
+    executor.add('users', lambda workspaces: order.append('users') or [f'{w}:U1' for w in workspaces],
+                 requires=['workspaces'])
+    executor.add('report', lambda users: order.append('report') or len(users), requires=['users'],
+                 after=['workspaces'])
+
+    results = executor.run()
+
+    assert results == {'workspaces': ['T1'], 'users': ['T1:U1'], 'report': 1}
+    assert order == ['workspaces', 'users', 'report']
+
+
+def test_independent_phases_overlap():
+    barrier = threading.Barrier(2, timeout=5)
+    executor = phases.PhaseExecutor()
+    executor.add('enterprise', barrier.wait)
+    executor.add('signatures', barrier.wait)
+
+    # Each phase waits for the other to start, so they only finish if run at the same time
+    assert set(executor.run()) == {'enterprise', 'signatures'}
+
+
+def test_forking_phase_runs_alone_on_calling_thread():
+    running = set()
+    overlapped = []
+    threads = {}
+    lock = threading.Lock()
+
+    def phase(name):
+        def func():
+            with lock:
+                overlapped.extend((name, other) for other in running)
+                running.add(name)
+            threads[name] = threading.get_ident()
+            time.sleep(0.05)
+            with lock:
+                running.remove(name)
+        return func
+
+    executor = phases.PhaseExecutor()
+    executor.add('users', phase('users'))
+    executor.add('workspaces', phase('workspaces'))
+    executor.add('messages', phase('messages'), forks=True)
+    executor.add('files', phase('files'), forks=True)
+    executor.add('drafts', phase('drafts'), after=['workspaces'])
+    executor.run()
+
+    assert threads.get('messages') == threads.get('files') == threading.get_ident()
+    assert not [pair for pair in overlapped if 'messages' in pair or 'files' in pair]
+
+
+def test_error_stops_phases_not_yet_started():
+    finished = []
+    executor = phases.PhaseExecutor()
+    executor.add('failing', lambda: 1 / 0)
+    executor.add('slow', lambda: time.sleep(0.1) or finished.append('slow'))
+    executor.add('dependent', lambda: finished.append('dependent'), after=['failing'])
+
+    with pytest.raises(ZeroDivisionError):
+        executor.run()
+    assert finished == ['slow']
+
+
+def test_invalid_phases():
+    executor = phases.PhaseExecutor()
+    executor.add('a', lambda: None, after=['b'])
+    with pytest.raises(phases.PhaseError):
+        executor.add('a', lambda: None)
+    with pytest.raises(phases.PhaseError):
+        executor.run()
+
+    executor.add('b', lambda: None, after=['a'])
+    with pytest.raises(phases.PhaseError):
+        executor.run()
@@ -0,0 +1,54 @@
+import pytest
+
+from slack_watchman_eg import pipeline, slack_wrapper
+
+from conftest import baseline_message_matches
+
+
+def _on_match(found):
+    # Matches are passed on as found, with the Message object rather than a dict
+    def on_match(sig, result):
+        message = result.get('message')
+        found.add((sig.name, message.conversation.id, message.timestamp, result.get('match_string')))
+    return on_match
+
+
+def _stream(signature_list, slack_connection, enterprise_directory, logger, timeframe, **kwargs):
+    found = set()
+    searched = pipeline.stream_message_matches(slack_connection, signature_list, enterprise_directory, 2,
+                                               _on_match(found), logger, True, timeframe, **kwargs)
+    return searched, found
+
+
+def test_stream_matches_every_message(signature_list, dataset, slack_connection, enterprise_directory, logger,
+                                      timeframe, monkeypatch):
+    # Small batches on a queue holding one, so fetchers have to wait for the matchers
+    monkeypatch.setattr(pipeline, 'BATCH_SIZE', 5)
+
+    searched, found = _stream(signature_list, slack_connection, enterprise_directory, logger, timeframe,
+                              queue_size=1)
+
+    assert searched == sum(len(messages) for messages in dataset.get('history').values())
+    assert found == baseline_message_matches(signature_list, dataset)
+
+
+def test_fetch_failure(signature_list, dataset, slack_connection, enterprise_directory, logger, timeframe,
+                       monkeypatch):
+    failing = next(iter(dataset.get('history')))
+    get_conversation_messages = slack_wrapper.get_conversation_messages
+
+    def get_messages(connection, conv, *args):
+        if conv.get('id') == failing:
+            raise ValueError('history unavailable')
+        return get_conversation_messages(connection, conv, *args)
+
+    monkeypatch.setattr(slack_wrapper, 'get_conversation_messages', get_messages)
+    found = set()
+
+    with pytest.raises(pipeline.PipelineError):
+        pipeline.stream_message_matches(slack_connection, signature_list, enterprise_directory, 2,
+                                        _on_match(found), logger, True, timeframe)
+
+    # Messages fetched before the failure are still searched
+    assert found <= baseline_message_matches(signature_list, dataset)
+    assert failing not in {conv_id for _, conv_id, _, _ in found}
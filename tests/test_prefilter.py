@@ -0,0 +1,49 @@
+import random
+
+import pytest
+
+from slack_watchman_eg import prefilter
+
+from conftest import make_signature, sample_texts
+
+SEARCH_STRINGS = ['password', 'pass', 'ssword', 'akia', 'aws_access_key_id', 'xox', '.pem', 'key', 'ey', 'token']
+
+
+@pytest.fixture(params=['installed', 'python'])
+def automaton(request, monkeypatch):
+    if request.param == 'python':
+        monkeypatch.setattr(prefilter, 'ahocorasick', None)
+    elif prefilter.ahocorasick is None:
+        pytest.skip('pyahocorasick is not installed')
+
+
+def test_candidates_match_substring_search(automaton):
+    rng = random.Random(1)
+    signature_list = [make_signature(f'sig{i}', ['messages'], rng.sample(SEARCH_STRINGS, rng.randint(1, 3)), [])
+                      for i in range(20)]
+    signature_list.append(make_signature('files only', ['files'], ['password'], []))
+    matcher = prefilter.SearchStringMatcher(signature_list, 'messages')
+
+    for text in sample_texts():
+        expected = {index for index, sig in enumerate(signature_list)
+                    if 'messages' in sig.scope and any(s in text.lower() for s in sig.search_strings)}
+        assert matcher.candidates(text) == expected, text
+
+
+def test_candidates_of_several_texts(automaton):
+    signature_list = [make_signature('a', ['messages'], ['password'], []),
+                      make_signature('b', ['messages'], ['token'], []),
+                      make_signature('c', ['messages'], ['nothing'], [])]
+    matcher = prefilter.SearchStringMatcher(signature_list, 'messages')
+
+    assert matcher.candidates('a password', 'a TOKEN') == {0, 1}
+    assert matcher.candidates() == set()
+
+
+def test_empty_search_string_always_a_candidate(automaton):
+    signature_list = [make_signature('always', ['messages'], [''], []),
+                      make_signature('never', ['messages'], ['password'], [])]
+    matcher = prefilter.SearchStringMatcher(signature_list, 'messages')
+
+    assert matcher.candidates('no search strings here') == {0}
+    assert matcher.candidates('password') == {0, 1}
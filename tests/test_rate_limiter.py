@@ -0,0 +1,86 @@
+import multiprocessing
+import types
+
+import pytest
+
+from slack_watchman_eg import rate_limiter
+
+HISTORY = 'discovery.conversations.history'
+INFO = 'discovery.enterprise.info'
+
+
+class _Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        # A real clock always moves on, even when sleeping for less than it can resolve
+        self.now += seconds + 1e-9
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(rate_limiter, 'time', types.SimpleNamespace(monotonic=clock.monotonic, sleep=clock.sleep))
+    return clock
+
+
+def test_not_held_to_tier_until_rate_limited(clock):
+    limiter = rate_limiter.RateLimiter()
+
+    assert sum(limiter.acquire(INFO) for _ in range(100)) == 0
+    assert clock.slept == []
+
+
+def test_enforced_bucket_allows_burst_then_refills(clock):
+    # Tier 2 is 20 requests a minute, so a 10 second burst holds 3 requests
+    limiter = rate_limiter.RateLimiter(enforce=True)
+
+    assert [limiter.acquire(INFO) for _ in range(3)] == [0, 0, 0]
+    assert limiter.acquire(INFO) == pytest.approx(2)
+    assert limiter.acquire(INFO) == pytest.approx(3)
+    # Other methods have buckets of their own
+    assert limiter.acquire(HISTORY) == 0
+
+
+def test_penalise_pauses_then_enforces(clock):
+    limiter = rate_limiter.RateLimiter()
+    limiter.penalise(HISTORY, 5)
+
+    assert limiter.acquire(HISTORY) == pytest.approx(5)
+    # Held to tier 4, 100 requests a minute, from then on
+    assert limiter.acquire(HISTORY) == pytest.approx(0.6)
+    assert limiter.acquire(INFO) == 0
+
+
+def test_multiplier_and_unknown_methods(clock):
+    limiter = rate_limiter.RateLimiter(method_tiers={}, multiplier=6, burst_seconds=1, enforce=True)
+
+    # Unknown methods use the default tier, 50 requests a minute, here multiplied to 5 a second
+    assert [limiter.acquire('unknown.method') for _ in range(5)] == [0] * 5
+    assert limiter.acquire('unknown.method') == pytest.approx(0.2)
+
+
+def _penalise(limiter):
+    limiter.penalise(HISTORY, 0.5)
+
+
+def test_shared_between_processes():
+    limiter = rate_limiter.RateLimiter()
+    worker = multiprocessing.get_context('fork').Process(target=_penalise, args=(limiter,))
+    worker.start()
+    worker.join()
+
+    assert 0.2 < limiter.acquire(HISTORY) <= 0.5
+
+
+@pytest.mark.parametrize('value, expected', [('12', 12.0), ('0.5', 0.5), ('-3', 0.0),
+                                             (None, rate_limiter.DEFAULT_RETRY_AFTER),
+                                             ('Wed, 21 Oct 2015 07:28:00 GMT', rate_limiter.DEFAULT_RETRY_AFTER)])
+def test_parse_retry_after(value, expected):
+    assert rate_limiter.parse_retry_after(value) == expected
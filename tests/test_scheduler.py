@@ -0,0 +1,45 @@
+import random
+
+from slack_watchman_eg import metadata_cache, rate_limiter, scheduler, slack_wrapper
+
+
+def test_every_item_in_one_task():
+    items = list(range(1000))
+
+    tasks = scheduler.make_tasks(items, 4)
+
+    assert len(tasks) == 4 * scheduler.TASKS_PER_PROCESS
+    assert sorted(item for task in tasks for item in task) == items
+    assert max(len(task) for task in tasks) - min(len(task) for task in tasks) <= 1
+
+
+def test_fewer_items_than_tasks():
+    assert sorted(scheduler.make_tasks(['a', 'b', 'c'], 4)) == [['a'], ['b'], ['c']]
+    assert scheduler.make_tasks([], 4) == []
+
+
+def test_balanced_by_weight():
+    rng = random.Random(1)
+    sizes = [rng.randint(1, 100) for _ in range(500)] + [50000]
+
+    tasks = scheduler.make_tasks(sizes, 2, weight=lambda size: size)
+    totals = [sum(task) for task in tasks]
+
+    assert sorted(size for task in tasks for size in task) == sorted(sizes)
+    # The largest conversation gets a task to itself, and runs first
+    assert tasks[0] == [50000]
+    assert totals == sorted(totals, reverse=True)
+    assert max(totals[1:]) - min(totals[1:]) <= 100
+
+
+def test_conversation_size_estimate(tmp_path, fake_server, timeframe):
+    connection = slack_wrapper.SlackAPI('xoxp-test', limiter=rate_limiter.RateLimiter(multiplier=1000),
+                                        base_url=fake_server.base_url,
+                                        cache=metadata_cache.MetadataCache(tmp_path / 'cache.db'))
+    conv = connection.get_recent_conversations(latest=timeframe)[0]
+    assert slack_wrapper.estimate_conversation_size(connection, conv) == 1
+
+    # The size recorded by the last scan of a conversation is used for the next one
+    messages = slack_wrapper.get_conversation_messages(connection, conv, timeframe)
+    assert messages
+    assert slack_wrapper.estimate_conversation_size(connection, conv) == 1 + len(messages)
@@ -0,0 +1,68 @@
+from slack_watchman_eg import fake_discovery, rate_limiter, slack_wrapper
+
+from conftest import baseline_message_matches, found_message_matches
+
+
+def test_message_matches_against_fake_server(signature_list, dataset, slack_connection, enterprise_directory,
+                                             logger, timeframe):
+    messages = slack_wrapper.get_all_messages(slack_connection, 2, timeframe)
+    assert len(messages) == sum(len(m) for m in dataset.get('history').values())
+
+    matches = slack_wrapper.search_message_matches(signature_list, slack_connection, enterprise_directory, messages,
+                                                   2, logger, True, raise_errors=True)
+
+    expected = baseline_message_matches(signature_list, dataset)
+    assert expected
+    assert {name for name, _, _, _ in expected} >= {'AWS API Tokens', 'Passwords', 'Private Keys'}
+    assert found_message_matches(signature_list, matches) == expected
+
+
+def test_message_matches_with_search_pool(signature_list, dataset, slack_connection, enterprise_directory, logger,
+                                          timeframe):
+    messages = slack_wrapper.get_all_messages(slack_connection, 2, timeframe)
+    with slack_wrapper.SearchPool(slack_connection, signature_list, enterprise_directory, messages, [], 2,
+                                  True) as pool:
+        matches = slack_wrapper.search_message_matches(signature_list, slack_connection, enterprise_directory,
+                                                       messages, 2, logger, True, pool, raise_errors=True)
+
+    assert found_message_matches(signature_list, matches) == baseline_message_matches(signature_list, dataset)
+
+
+def test_match_user_and_workspace(signature_list, slack_connection, enterprise_directory, logger, timeframe):
+    messages = slack_wrapper.get_all_messages(slack_connection, 2, timeframe)
+    matches = slack_wrapper.search_message_matches(signature_list, slack_connection, enterprise_directory, messages,
+                                                   2, logger, True, raise_errors=True)
+
+    results = [result for sig_results in matches for result in sig_results]
+    assert results
+    for result in results:
+        workspace = result.get('workspace')
+        assert result.get('user').get('id') == result.get('message').get('user')
+        assert workspace.get('id') == result.get('message').get('team')
+        assert result.get('url').startswith(f'https://{workspace.get("domain")}.slack.com/archives/')
+
+
+def test_file_matches_against_fake_server(signature_list, dataset, slack_connection, enterprise_directory, logger,
+                                          timeframe):
+    files = slack_wrapper.get_all_files(slack_connection, 2, True, timeframe)
+    assert len(files) == len(dataset.get('files'))
+
+    matches = slack_wrapper.search_file_matches(signature_list, enterprise_directory, files, 2, logger,
+                                                raise_errors=True)
+
+    expected = {f.get('id') for f in dataset.get('files').values() if f.get('filetype') == 'pem'}
+    assert expected
+    assert {result.get('file').get('id') for result in matches[-1]} == expected
+    assert not any(matches[:-1])
+
+
+def test_message_matches_when_rate_limited(signature_list, dataset, enterprise_directory, logger, timeframe):
+    with fake_discovery.FakeDiscoveryServer(dataset, rate_limit_every=7, retry_after=0) as server:
+        connection = slack_wrapper.SlackAPI('xoxp-test', limiter=rate_limiter.RateLimiter(multiplier=1000),
+                                            base_url=server.base_url)
+        messages = slack_wrapper.get_all_messages(connection, 2, timeframe)
+        matches = slack_wrapper.search_message_matches(signature_list, connection, enterprise_directory, messages,
+                                                       2, logger, True, raise_errors=True)
+
+    assert server.request_count > server.method_counts.get('discovery.conversations.history')
+    assert found_message_matches(signature_list, matches) == baseline_message_matches(signature_list, dataset)
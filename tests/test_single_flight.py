@@ -0,0 +1,92 @@
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from slack_watchman_eg import single_flight
+
+CALLERS = 8
+
+
+def _start_blocked_call(flight, key, result):
+    """ Start a call in a thread that doesn't finish until the returned event is set """
+
+    release = threading.Event()
+    calls = []
+
+    def func():
+        calls.append(1)
+        release.wait()
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    pool = ThreadPoolExecutor(CALLERS)
+    futures = [pool.submit(flight.do, key, func) for _ in range(CALLERS)]
+    # Give every caller time to arrive while the first call is in flight
+    time.sleep(0.1)
+    return release, calls, futures, pool
+
+
+def test_concurrent_calls_share_one_result():
+    flight = single_flight.SingleFlight()
+    release, calls, futures, pool = _start_blocked_call(flight, 'team.info:T1', {'team': {'id': 'T1'}})
+    release.set()
+    results = [future.result() for future in futures]
+    pool.shutdown()
+
+    assert len(calls) == 1
+    assert all(result == {'team': {'id': 'T1'}} for result in results)
+    # Each waiting caller gets its own copy
+    assert len({id(result) for result in results}) == CALLERS
+
+
+def test_error_raised_to_every_caller():
+    flight = single_flight.SingleFlight()
+    release, calls, futures, pool = _start_blocked_call(flight, 'team.info:T1', ValueError('failed'))
+    release.set()
+    for future in futures:
+        with pytest.raises(ValueError):
+            future.result()
+    pool.shutdown()
+
+    assert len(calls) == 1
+    # The failed call isn't remembered, so the next call is made again
+    assert flight.do('team.info:T1', lambda: 'retried') == 'retried'
+
+
+def test_different_keys_and_later_calls_not_shared():
+    flight = single_flight.SingleFlight()
+    calls = []
+
+    def func(value):
+        calls.append(value)
+        return value
+
+    assert flight.do('a', func, 1) == 1
+    assert flight.do('a', func, 2) == 2
+    assert flight.do('b', func, 3) == 3
+    assert calls == [1, 2, 3]
+
+
+def _call_in_child(flight, key, conn):
+    conn.send(flight.do(key, lambda: 'child'))
+
+
+def test_forked_child_does_not_wait_for_parent_call():
+    flight = single_flight.SingleFlight()
+    release, calls, futures, pool = _start_blocked_call(flight, 'key', 'parent')
+    context = multiprocessing.get_context('fork')
+    parent_conn, child_conn = context.Pipe()
+    try:
+        child = context.Process(target=_call_in_child, args=(flight, 'key', child_conn))
+        child.start()
+        assert parent_conn.poll(5)
+        assert parent_conn.recv() == 'child'
+        child.join()
+    finally:
+        release.set()
+        pool.shutdown()
+    assert [future.result() for future in futures] == ['parent'] * CALLERS
@@ -0,0 +1,17 @@
+import json
+
+from slack_watchman_eg import sw_logger
+
+
+def test_notify_line_is_json(capsys):
+    logger = sw_logger.JSONLogger(name='test-notify')
+    logger.log('NOTIFY', {'match_string': 'pässword=1', 'url': None}, scope='messages', detect_type='Passwords',
+               severity=70)
+
+    line = capsys.readouterr().out.strip()
+    record = json.loads(line)
+    assert (record.get('level'), record.get('scope'), record.get('detection_type'), record.get('severity')) == \
+        ('NOTIFY', 'messages', 'Passwords', '70')
+    assert record.get('detection_data') == {'match_string': 'pässword=1', 'url': None}
+    # The finding is written compactly, whichever JSON library is installed
+    assert line.endswith('"detection_data": {"match_string":"p\\u00e4ssword=1","url":null}}')